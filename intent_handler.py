@@ -1,6 +1,11 @@
 import re
+import threading
+from collections import OrderedDict
+import numpy as np
 import pandas as pd
-from rma_utils import render_result_table
+from rma_utils import render_result_table, value_counts
+
+INTENT_CACHE_SIZE = 256
 
 def normalize_text(text):
     text = text.lower()
@@ -35,53 +40,104 @@ def extract_product_from_question(question):
         return match.group(1).strip()
     return None
 
-def recognize_intent(question):
-    q = normalize_text(question)
-    if re.search(r"sản phẩm (gì|nào)? ?nhiều nhất", q):
-        return {"intent": "top_product", "params": {"question": question}}
-    if re.search(r"sản phẩm (gì|nào).*nhiều", q):
-        return {"intent": "top_products", "params": {"question": question}}
+# === Bảng intent: regex biên dịch sẵn, thứ tự theo priority (nhỏ chạy trước) ===
+RE_TOP_PRODUCT = re.compile(r"sản phẩm (gì|nào)? ?nhiều nhất")
+RE_TOP_PRODUCTS = re.compile(r"sản phẩm (gì|nào).*nhiều")
+RE_PRODUCT_WHAT_MANY = re.compile(r"sản phẩm gì nhiều")
+RE_WHICH_ITEM_FAILS = re.compile(r"(cái gì|loại gì|mặt hàng gì|loại nào|cái nào).*?(hư|lỗi|gửi).*?(nhiều|nhất)?")
+RE_SENDS_WHAT_MANY = re.compile(r"gửi gì nhiều")
+RE_WHO_SENDS_PRODUCT = re.compile(r"(ai|khách|khách hàng).*gửi.*sản phẩm")
+RE_STARTS_WITH_SENDER = re.compile(r"^\s*\w+.*gửi")
+RE_SPACES = re.compile(r"\s+")
+
+INTENT_RULES = []
+
+def intent_rule(name, priority):
+    """
+    Đăng ký một luật nhận diện intent. Hàm luật nhận (q đã chuẩn hoá, câu hỏi gốc)
+    và trả về params nếu khớp, None nếu không.
+    """
+    def decorator(func):
+        INTENT_RULES.append((priority, len(INTENT_RULES), name, func))
+        INTENT_RULES.sort(key=lambda rule: (rule[0], rule[1]))
+        return func
+    return decorator
+
+@intent_rule("top_product", 10)
+def _rule_top_product(q, question):
+    if RE_TOP_PRODUCT.search(q):
+        return {"question": question}
+
+@intent_rule("top_products", 20)
+def _rule_top_products(q, question):
+    if RE_TOP_PRODUCTS.search(q):
+        return {"question": question}
+
+@intent_rule("top_customers", 30)
+def _rule_top_customers(q, question):
     if "khách" in q and "gửi nhiều" in q:
-        return {"intent": "top_customers", "params": {"question": question}}
-    if re.search(r"sản phẩm gì nhiều", q):
-        return {"intent": "top_products", "params": {"question": question}}
-    if re.search(r"(cái gì|loại gì|mặt hàng gì|loại nào|cái nào).*?(hư|lỗi|gửi).*?(nhiều|nhất)?", q):
-        return {"intent": "top_products", "params": {"question": question}}
+        return {"question": question}
+
+@intent_rule("top_products", 40)
+def _rule_top_products_loose(q, question):
+    if RE_PRODUCT_WHAT_MANY.search(q) or RE_WHICH_ITEM_FAILS.search(q):
+        return {"question": question}
     if "sản phẩm" in q and ("lỗi nhiều" in q or "gửi nhiều" in q or "nhiều nhất" in q):
-        return {"intent": "top_products", "params": {"question": question}}
-    if re.search(r"gửi gì nhiều", q):
-        customer = extract_customer_from_question(question)
-        return {"intent": "top_products_by_customer", "params": {"question": question, "customer": customer}}
-    if re.search(r"(ai|khách|khách hàng).*gửi.*sản phẩm", q) and ("nhiều" in q or "top" in q):
+        return {"question": question}
+
+@intent_rule("top_products_by_customer", 50)
+def _rule_top_products_by_customer(q, question):
+    if RE_SENDS_WHAT_MANY.search(q):
+        return {"question": question, "customer": extract_customer_from_question(question)}
+
+@intent_rule("top_customers_by_product", 60)
+def _rule_top_customers_by_product(q, question):
+    if RE_WHO_SENDS_PRODUCT.search(q) and ("nhiều" in q or "top" in q):
         product = extract_product_from_question(question)
         if product:
-            return {"intent": "top_customers_by_product", "params": {"question": question, "product": product}}
+            return {"question": question, "product": product}
+
+@intent_rule("top_ktv", 70)
+def _rule_top_ktv(q, question):
     if "ktv" in q or "kỹ thuật viên" in q:
-        return {"intent": "top_ktv", "params": {}}
+        return {"question": question}
+
+@intent_rule("count_product", 80)
+def _rule_count_product(q, question):
+    if ("gửi" in q or "đã gửi" in q) and "sản phẩm" in q and ("tháng" in q or "quý" in q or "năm" in q):
+        if "khách hàng" in q or RE_STARTS_WITH_SENDER.search(q):
+            return None
+        return {"question": question}
+
+@intent_rule("count_product_by_customer", 80)
+def _rule_count_product_by_customer(q, question):
     if ("gửi" in q or "đã gửi" in q) and "sản phẩm" in q and ("tháng" in q or "quý" in q or "năm" in q):
-        if "khách hàng" in q or re.search(r"^\s*\w+.*gửi", q):
-            customer = extract_customer_from_question(question)
-            return {"intent": "count_product_by_customer", "params": {"question": question, "customer": customer}}
-        return {"intent": "count_product", "params": {"question": question}}
+        if "khách hàng" in q or RE_STARTS_WITH_SENDER.search(q):
+            return {"question": question, "customer": extract_customer_from_question(question)}
+
+def recognize_intent(question):
+    q = normalize_text(question)
+    for _, _, name, rule in INTENT_RULES:
+        params = rule(q, question)
+        if params is not None:
+            return {"intent": name, "params": params}
     return {"intent": "unknown", "params": {}}
 
 def filter_by_time(df, question):
     year, month, quarter = extract_time_from_question(question)
-    df_filtered = df.copy()
-    if year and "nam" in df_filtered.columns:
-        df_filtered = df_filtered[df_filtered["nam"] == year]
-    if month and "thang" in df_filtered.columns:
-        df_filtered = df_filtered[df_filtered["thang"] == month]
-    if quarter and "quy" in df_filtered.columns:
-        df_filtered = df_filtered[df_filtered["quy"] == quarter]
-    return df_filtered
+    # Gộp điều kiện thành một mask, không copy bảng khi câu hỏi không có mốc thời gian
+    mask = np.ones(len(df), dtype=bool)
+    for col, value in (("nam", year), ("thang", month), ("quy", quarter)):
+        if value and col in df.columns:
+            mask &= (df[col] == value).to_numpy(dtype=bool, na_value=False)
+    return df if mask.all() else df[mask]
 
 def handle_top_products(df, params):
     question = params.get("question", "")
     df_filtered = filter_by_time(df, question)
     for col in ["san_pham", "model", "ten_san_pham"]:
         if col in df_filtered.columns:
-            top_df = df_filtered[col].value_counts().head(10).reset_index()
+            top_df = value_counts(df_filtered[col]).head(10).reset_index()
             top_df.columns = ["san_pham", "so_luong"]
     result_list = list(top_df.itertuples(index=False, name=None))
     return df_filtered, render_result_table(result_list)
@@ -90,11 +146,55 @@ def handle_top_ktv(df, question):
     df_filtered = filter_by_time(df, question)
     for col in ["ktv", "ten_ky_thuat_vien"]:
         if col in df_filtered.columns:
-            top = df_filtered[col].value_counts().idxmax()
-            count = df_filtered[col].value_counts().max()
+            top = value_counts(df_filtered[col]).idxmax()
+            count = value_counts(df_filtered[col]).max()
             return df_filtered[df_filtered[col] == top], f"Kỹ thuật viên xử lý nhiều nhất là **{top}** với tổng cộng {count} lượt xử lý."
     return df_filtered, "Không tìm thấy dữ liệu kỹ thuật viên trong bảng."
 
+# Tham số tên trong params -> loại tên của EntityResolver, cột trong bảng đã chuẩn hoá tên cột
+ENTITY_PARAMS = {
+    "customer": ("customer", ["ten_khach_hang", "khach_hang"]),
+    "product": ("product", ["san_pham", "model", "ten_san_pham"]),
+}
+
+def resolve_entities(params, question, resolver):
+    """
+    Đổi tên thô trích từ câu hỏi thành các giá trị chính xác trong dữ liệu (params["<tên>_values"]):
+    các giá trị chứa tên thô, không có thì tên nhận ra trong cả câu hỏi, cuối cùng là giá trị gần đúng nhất.
+    """
+    params = dict(params)
+    mentions = None
+    for name, (kind, _) in ENTITY_PARAMS.items():
+        if name not in params:
+            continue
+        raw = params[name]
+        values = resolver.values(kind, raw, fuzzy=False)
+        if not values:
+            if mentions is None:
+                mentions = resolver.mentions(question)
+            values = mentions.get(kind) or resolver.values(kind, raw)
+        if values:
+            params[name + "_values"] = values
+    return params
+
+def filter_entity(df, params, name):
+    """Lọc theo tên: đúng các giá trị đã nhận diện nếu có, không thì chứa chuỗi thô (không phân biệt hoa thường)."""
+    _, cols = ENTITY_PARAMS[name]
+    values = params.get(name + "_values")
+    raw = params.get(name)
+    if values is None and not raw:
+        return df
+    for col in cols:
+        if col in df.columns:
+            if values is not None:
+                return df[df[col].isin(values)]
+            return df[df[col].astype(str).str.contains(raw, case=False, na=False, regex=False)]
+    return df
+
+def entity_label(params, name):
+    values = params.get(name + "_values")
+    return values[0] if values and len(values) == 1 else params.get(name)
+
 def handle_count_product(df, params):
     question = params.get("question", "")
     year, month, quarter = extract_time_from_question(question)
@@ -111,13 +211,9 @@ def handle_count_product(df, params):
     return result
 
 def handle_count_product_by_customer(df, params):
-    customer = params.get("customer")
     question = params.get("question", "")
-    df_filtered = filter_by_time(df, question)
-    for col in ["ten_khach_hang", "khach_hang"]:
-        if col in df_filtered.columns:
-            df_filtered = df_filtered[df_filtered[col].str.contains(customer, case=False, na=False)]
-            break
+    df_filtered = filter_entity(filter_by_time(df, question), params, "customer")
+    customer = entity_label(params, "customer")
     total = len(df_filtered)
     return df_filtered, f"Khách hàng **{customer}** đã gửi tổng cộng {total} sản phẩm theo yêu cầu lọc thời gian."
 
@@ -126,55 +222,106 @@ def handle_top_customers(df, params):
     df_filtered = filter_by_time(df, question)
     for col in ["ten_khach_hang", "khach_hang"]:
         if col in df_filtered.columns:
-            top_df = df_filtered[col].value_counts().head(10).reset_index()
+            top_df = value_counts(df_filtered[col]).head(10).reset_index()
             top_df.columns = ["khach_hang", "so_luong"]
     result_list = list(top_df.itertuples(index=False, name=None))
     return df_filtered, render_result_table(result_list)
     
 def handle_top_products_by_customer(df, params):
-    customer = params.get("customer")
     question = params.get("question", "")
-    df_filtered = filter_by_time(df, question)
-
-    for col in ["ten_khach_hang", "khach_hang"]:
-        if col in df_filtered.columns:
-            df_filtered = df_filtered[df_filtered[col].str.contains(customer, case=False, na=False)]
-            break
+    df_filtered = filter_entity(filter_by_time(df, question), params, "customer")
 
     for col in ["san_pham", "model", "ten_san_pham"]:
         if col in df_filtered.columns:
-            top_df = df_filtered[col].value_counts().head(10).reset_index()
+            top_df = value_counts(df_filtered[col]).head(10).reset_index()
             top_df.columns = ["san_pham", "so_luong"]
     result_list = list(top_df.itertuples(index=False, name=None))
     return df_filtered, render_result_table(result_list)
  
-def handle_intent(question, df):
+def handle_top_customers_by_product(df, params):
+    question = params.get("question", "")
+    df_filtered = filter_entity(filter_by_time(df, question), params, "product")
+
+    for col in ["ten_khach_hang", "khach_hang"]:
+        if col in df_filtered.columns:
+            top_df = value_counts(df_filtered[col]).head(10).reset_index()
+            top_df.columns = ["khach_hang", "so_luong"]
+    result_list = list(top_df.itertuples(index=False, name=None))
+    return df_filtered, render_result_table(result_list)
+
+def handle_count_product_intent(df, params):
+    result = handle_count_product(df, params)
+    month = result.get("month")
+    year = result.get("year")
+    total = result.get("total")
+    if month and year and total is not None:
+        return df[df["thang"] == month], f"Trong tháng {month} năm {year}, đã có tổng cộng {total} sản phẩm được nhận bảo hành."
+    elif year and total is not None:
+        return df[df["nam"] == year], f"Trong năm {year}, đã có tổng cộng {total} sản phẩm được nhận bảo hành."
+    else:
+        return df, f"Đã có tổng cộng {total} sản phẩm được nhận bảo hành."
+
+# intent -> hàm xử lý (df, params) -> (df_kết_quả, câu_trả_lời)
+INTENT_HANDLERS = {
+    "top_customers": handle_top_customers,
+    "top_product": handle_top_products,
+    "top_products": handle_top_products,
+    "top_products_by_customer": handle_top_products_by_customer,
+    "top_customers_by_product": handle_top_customers_by_product,
+    "top_ktv": lambda df, params: handle_top_ktv(df, params.get("question", "")),
+    "count_product": handle_count_product_intent,
+    "count_product_by_customer": handle_count_product_by_customer,
+}
+
+_intent_cache = OrderedDict()
+_intent_cache_lock = threading.Lock()
+
+def question_key(question):
+    # Chỉ gộp khoảng trắng và hoa/thường: normalize_text đổi từ ("nhận" -> "gửi") nên hai câu khác nghĩa có thể trùng khoá
+    return RE_SPACES.sub(" ", question).strip().casefold()
+
+def _result_rows(df, df_result):
+    # Vị trí dòng của kết quả trong df (None = cả bảng), để cache không giữ DataFrame của phiên bản cũ
+    if df_result is df:
+        return None
+    if not df.index.is_unique:
+        return False
+    return df.index.get_indexer(df_result.index)
+
+def handle_intent(question, df, version=None, resolver=None):
+    """
+    Trả về (df_kết_quả, câu_trả_lời, intent).
+    Khi có version (phiên bản dữ liệu), kết quả được cache LRU theo (câu hỏi đã gộp khoảng trắng, version,
+    có resolver hay không) nên câu hỏi lặp lại trên cùng dữ liệu không phải tính lại. Cache chỉ giữ
+    (vị trí dòng, câu trả lời, intent), không giữ DataFrame: khi trúng cache, df_kết_quả lấy lại từ df
+    của lần gọi này, nên cache không giữ các phiên bản dữ liệu cũ. Câu không nhận ra intent không được cache.
+    resolver: EntityResolver của cùng phiên bản, để lọc khách hàng/sản phẩm theo đúng tên trong dữ liệu
+    (bỏ dấu, sai chính tả) thay vì tìm chuỗi con trên cả bảng.
+    """
+    key = (question_key(question), version, resolver is not None)
+    if version is not None:
+        with _intent_cache_lock:
+            cached = _intent_cache.get(key)
+            if cached is not None:
+                _intent_cache.move_to_end(key)
+        if cached is not None:
+            rows, answer, intent = cached
+            return (df if rows is None else df.take(rows)), answer, intent
+
     intent_info = recognize_intent(question)
     intent = intent_info["intent"]
     params = intent_info.get("params", {})
-
-    if intent == "top_customers":
-        return handle_top_customers(df, params) + (intent,)
-    elif intent in ["top_product", "top_products"]:
-        return handle_top_products(df, params) + (intent,)
-    elif intent == "top_products_by_customer":
-        return handle_top_products_by_customer(df, params) + (intent,)
-    elif intent == "top_customers_by_product":
-        return handle_top_customers_by_product(df, params) + (intent,)
-    elif intent == "top_ktv":
-        return handle_top_ktv(df, question) + (intent,)
-    elif intent == "count_product":
-        result = handle_count_product(df, params)
-        month = result.get("month")
-        year = result.get("year")
-        total = result.get("total")
-        if month and year and total is not None:
-            return df[df["thang"] == month], f"Trong tháng {month} năm {year}, đã có tổng cộng {total} sản phẩm được nhận bảo hành.", intent
-        elif year and total is not None:
-            return df[df["nam"] == year], f"Trong năm {year}, đã có tổng cộng {total} sản phẩm được nhận bảo hành.", intent
-        else:
-            return df, f"Đã có tổng cộng {total} sản phẩm được nhận bảo hành.", intent
-    elif intent == "count_product_by_customer":
-        return handle_count_product_by_customer(df, params) + (intent,)
-    else:
+    if resolver is not None:
+        params = resolve_entities(params, question, resolver)
+    handler = INTENT_HANDLERS.get(intent)
+    if handler is None:
         return df, "Không xác định được ý định từ câu hỏi.", "unknown"
+    df_result, answer = handler(df, params)
+
+    rows = _result_rows(df, df_result) if version is not None else False
+    if rows is not False:
+        with _intent_cache_lock:
+            _intent_cache[key] = (rows, answer, intent)
+            while len(_intent_cache) > INTENT_CACHE_SIZE:
+                _intent_cache.popitem(last=False)
+    return df_result, answer, intent
@@ -2,27 +2,20 @@ import streamlit as st
 import pandas as pd
 import os
 from dotenv import load_dotenv
-import requests
-import io
-import plotly.express as px
 from rma_ai import query_openai
 from rma_ai import chuan_hoa_ten_cot
-from rma_utils import bo_loc_da_nang, ensure_time_columns, find_col
-from rma_utils import render_bo_loc_sidebar, apply_bo_loc
-import time
-def export_excel_button(df, filename="bao_cao_rma.xlsx", label="📥 Tải file Excel"):
-    if df.empty:
-        return
-    buffer = io.BytesIO()
-    with pd.ExcelWriter(buffer, engine="xlsxwriter") as writer:
-        df.to_excel(writer, index=False, sheet_name="RMA_Report")
-    buffer.seek(0)
-    st.download_button(
-        label=label,
-        data=buffer.getvalue(),
-        file_name=filename,
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    )
+from rma_ai_cache import get_response_cache
+from rma_utils import get_schema, memory_report
+from rma_ui import export_buttons, render_bo_loc_sidebar, run_dashboard, run_report
+from rma_loader import SHEET_URL, enable_copy_on_write, open_files_view, open_view, view_stats
+from rma_cube import build_cube, cube_for_date_range
+from rma_entities import EntityResolver
+from rma_export import filter_fingerprint
+from rma_filters import FilterEngine
+from rma_search import SearchIndex
+from rma_serials import SerialIndex
+from rma_turnaround import TurnaroundEngine
+from rma_reports import dashboard_reports, reports_for_role, timing_summary
 import yaml
 
 def load_users_config():
@@ -85,34 +78,51 @@ if st.session_state.logged_in != True:
             st.error("Sai tên đăng nhập hoặc mật khẩu.")
     st.stop()
 
-import rma_query_templates
-
 load_dotenv()
+enable_copy_on_write()  # bản dữ liệu dùng chung giữa các phiên: ghi vào lát cắt không sửa bản gốc
 
 st.set_page_config(page_title="Trợ lý RMA AI", layout="wide")
 st.title("🧠 RMA – Dữ Liệu Bảo Hành")
 
 # === 1. Load dữ liệu từ Google Sheet ===
-GOOGLE_SHEET_URL = "https://docs.google.com/spreadsheets/d/1fWFLZWyCAXn_B8jcZ0oY4KhJ8krbLPsH/export?format=csv"
+GOOGLE_SHEET_URL = SHEET_URL
 
-def read_google_sheet(url):
+def read_google_sheet(url, force=False):
+    # Một bản dữ liệu dùng chung cho mọi phiên (kiểm tra lại sau mỗi SHEET_TTL giây), phiên chỉ giữ view
     try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            df = pd.read_csv(io.StringIO(response.content.decode("utf-8")))
-            df.columns = [col.strip() for col in df.columns]
-            return ensure_time_columns(df)
+        view = open_view(url, current=st.session_state.get("dataset_view"), force=force)
+        st.session_state.dataset_view = view
+        return view
     except Exception as e:
         st.error(f"Lỗi khi tải dữ liệu: {e}")
-    return pd.DataFrame()
+    return None
 
-data = read_google_sheet(GOOGLE_SHEET_URL)
-df_raw = read_google_sheet(GOOGLE_SHEET_URL)
-df_raw = chuan_hoa_ten_cot(df_raw)
+def read_uploaded_files(files):
+    # Gộp file Excel/CSV của các chi nhánh (đọc song song, cột chuẩn theo COLUMN_MAPPING) thay cho sheet
+    try:
+        view = open_files_view([(f.name, f.getvalue()) for f in files], current=st.session_state.get("dataset_view"))
+        st.session_state.dataset_view = view
+        return view
+    except Exception as e:
+        st.error(f"Lỗi khi gộp file: {e}")
+    return None
 
-if data.empty:
+uploaded_files = None
+if st.session_state.get("role") == "admin":
+    uploaded_files = st.sidebar.file_uploader(
+        "📂 Gộp file chi nhánh (Excel/CSV)", type=["xlsx", "xlsm", "xls", "csv"], accept_multiple_files=True
+    )
+view = read_uploaded_files(uploaded_files) if uploaded_files else read_google_sheet(GOOGLE_SHEET_URL)
+
+if view is None or view.data.empty:
     st.stop()
 
+data, data_version = view.data, view.version
+# Bản đổi tên cột cho intent/AI, tính một lần cho mỗi phiên bản dữ liệu
+df_raw = view.derived("df_raw", lambda: chuan_hoa_ten_cot(data))
+# Ánh xạ cột dựng một lần cho bộ cột hiện tại, dùng chung cho mọi widget/truy vấn
+schema = get_schema(data.columns)
+
 
 # === 2. Tạo tabs giao diện mới ===
 # Xác định vai trò người dùng từ session
@@ -143,6 +153,33 @@ with st.sidebar:
         st.session_state.logged_in = None
         st.rerun()
 
+    if role == "admin" and st.button("🔄 Tải lại dữ liệu"):
+        read_google_sheet(GOOGLE_SHEET_URL, force=True)
+        st.rerun()
+
+    if role == "admin" and schema.missing:
+        st.warning("⚠️ Không nhận diện được cột: " + ", ".join(schema.missing))
+
+    if role == "admin" and data.attrs.get("date_issues"):
+        with st.expander("📅 Ngày không đọc được", expanded=False):
+            for col, invalid in data.attrs["date_issues"].items():
+                st.caption(f"{col}: {sum(invalid.values())} ô")
+                st.dataframe(pd.DataFrame({"Giá trị": list(invalid), "Số dòng": list(invalid.values())}),
+                             hide_index=True)
+
+    if role == "admin" and view.report is not None:
+        with st.expander("📂 Các file đã gộp", expanded=False):
+            st.dataframe(view.report, hide_index=True)
+
+    if role == "admin":
+        with st.expander("🧮 Bộ nhớ dữ liệu", expanded=False):
+            st.dataframe(view.derived("memory_report", lambda: memory_report(data)), hide_index=True)
+            live = view_stats()
+            st.caption(
+                f"Phiên bản dữ liệu đang giữ: {len(live)} · "
+                + ", ".join(f"{v} ({n} phiên)" for v, n in live.items())
+            )
+
     st.markdown("---")
 
     # 📕 Bộ lọc nâng cao
@@ -152,9 +189,24 @@ with st.sidebar:
     if role in ["admin", "mod"]:
         with st.expander("⚙️ Tuỳ chọn gửi AI", expanded=False):
             max_rows = st.slider("📌 Giới hạn số dòng gửi AI", 50, 1000, 200)
-
-# Áp dụng lọc sau khi lấy lựa chọn
-data_filtered = apply_bo_loc(data, filters)
+            bypass_ai_cache = False
+            if role == "admin":
+                bypass_ai_cache = st.checkbox("🚫 Bỏ qua cache câu trả lời AI")
+                cache_stats = get_response_cache().stats()
+                st.caption(
+                    f"Cache AI: {cache_stats['hits']} hit / {cache_stats['misses']} miss "
+                    f"({cache_stats['hit_rate']}%), {cache_stats['entries']} câu trả lời đã lưu"
+                )
+
+# Áp dụng lọc sau khi lấy lựa chọn: chỉ giữ vị trí dòng, tạo bảng khi cần hiển thị/tính toán
+engine = view.derived("filters", lambda: FilterEngine(data, schema))
+rows = engine.positions(**filters)
+
+# Chỉ mục serial (tra chính xác/tiền tố, đếm số lần gửi) dựng một lần cho mỗi phiên bản dữ liệu
+col_serial = schema.find("serial")
+serials = view.derived("serials", lambda: SerialIndex(data[col_serial])) if col_serial else None
+# Số ngày xử lý (tính sẵn khi tải) cho phân vị/SLA; dùng lại mã nhóm của bộ lọc
+turnaround = view.derived("turnaround", lambda: TurnaroundEngine(data, schema, filters=engine))
 
 # === TAB 1: Xem và lọc dữ liệu ===
 with tab1:
@@ -165,73 +217,55 @@ with tab1:
         search_mode = st.radio("Chọn loại tìm kiếm:", ["🔎 Theo khách hàng", "🔎 Theo sản phẩm", "🔎 Theo số serial"], horizontal=True)
         keyword = st.text_input("Nhập từ khóa cần tìm:")
 
-        # GỢI Ý KHỚP
+        # GỢI Ý KHỚP + LỌC DỮ LIỆU THEO TỪ KHÓA (không phân biệt dấu, dùng chỉ mục trigram theo phiên bản dữ liệu)
         if keyword:
             if search_mode == "🔎 Theo khách hàng":
-                col_name = find_col(data.columns, "khách hàng")
+                col_name = schema.find("khách hàng")
             elif search_mode == "🔎 Theo sản phẩm":
-                col_name = find_col(data.columns, "sản phẩm")
+                col_name = schema.find("sản phẩm")
             else:
-                col_name = None
+                col_name = schema.find("serial")
 
             if col_name:
-                all_values = data[col_name].dropna().unique().tolist()
-                suggestions = [s for s in all_values if keyword.lower() in s.lower()]
+                search_index = view.derived("search:" + col_name, lambda: SearchIndex(data[col_name]))
+                suggestions = search_index.suggest(keyword, limit=3)
                 if suggestions:
                     st.markdown('<div style="font-size: 0.85rem; color: #aaa;"><b>🔎 Gợi ý khớp:</b></div>', unsafe_allow_html=True)
-                    for s in suggestions[:3]:
+                    for s in suggestions:
                         st.markdown(f'<div style="font-size: 0.85rem; color: #ccc;">• {s}</div>', unsafe_allow_html=True)
-
-        # LỌC DỮ LIỆU THEO TỪ KHÓA
-        if keyword:
-            keyword_lower = keyword.lower()
-            if search_mode == "🔎 Theo khách hàng":
-                col_name = find_col(data_filtered.columns, "khách hàng")
-            elif search_mode == "🔎 Theo sản phẩm":
-                col_name = find_col(data_filtered.columns, "sản phẩm")
-            else:
-                col_name = find_col(data_filtered.columns, "serial")
-
-            if col_name:
-                data_filtered = data_filtered[
-                    data_filtered[col_name].astype(str).str.lower().str.contains(keyword_lower, na=False)
-                ]
+                rows = search_index.filter_rows(rows, keyword)
+                if col_name == col_serial and serials is not None and serials.count(keyword) > 1:
+                    st.caption(f"🔁 Serial {keyword.strip()} đã được gửi {serials.count(keyword)} lần.")
             else:
                 st.warning("Không tìm thấy cột phù hợp để tìm kiếm.")
 
     # === LỌC THEO LOẠI DỊCH VỤ ===
     with st.expander("📌 Lọc theo loại dịch vụ"):
-        col_dichvu = find_col(data_filtered.columns, "loại dịch vụ")
+        col_dichvu = schema.find("loại dịch vụ")
         if col_dichvu:
-            unique_types = data_filtered[col_dichvu].dropna().unique().tolist()
+            unique_types = engine.unique(col_dichvu, rows)
             selected_types = st.multiselect("Chọn loại dịch vụ:", unique_types)
             if selected_types:
-                data_filtered = data_filtered[data_filtered[col_dichvu].isin(selected_types)]
+                rows = engine.positions(rows, isin={col_dichvu: selected_types})
 
     # === LỌC THEO LỖI KỸ THUẬT ===
     with st.expander("📌 Lọc theo kỹ thuật viên"):
-        col_loi = find_col(data_filtered.columns, "KTV")
+        col_loi = schema.find("KTV")
         if col_loi:
-            unique_errors = data_filtered[col_loi].dropna().unique().tolist()
+            unique_errors = engine.unique(col_loi, rows)
             selected_errors = st.multiselect("Chọn KTV cần lọc:", unique_errors)
             if selected_errors:
-                data_filtered = data_filtered[data_filtered[col_loi].isin(selected_errors)]
+                rows = engine.positions(rows, isin={col_loi: selected_errors})
 
     # === HIỂN THỊ KẾT QUẢ & TẢI FILE ===
     if keyword or selected_types or selected_errors:
+        data_filtered = engine.take(rows)
         st.markdown(f"**Số dòng sau khi lọc:** {len(data_filtered)} / {len(data)}")
         st.dataframe(data_filtered, use_container_width=True)
 
-        buffer = io.BytesIO()
-        with pd.ExcelWriter(buffer, engine="xlsxwriter") as writer:
-            data_filtered.to_excel(writer, index=False, sheet_name="RMA_Loc")
-        buffer.seek(0)
-        st.download_button(
-            label="📥 Tải kết quả Excel",
-            data=buffer.getvalue(),
-            file_name="RMA_Ketqua_Loc.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
+        # File chỉ tạo khi bấm tải, cache theo bộ lọc + phiên bản dữ liệu
+        export_buttons({"RMA_Loc": data_filtered}, "RMA_Ketqua_Loc.xlsx",
+                       cache_key=("tab1", filter_fingerprint(rows), data_version))
 
 # === TAB 2: Trợ lý AI ===
 if tab2:
@@ -239,42 +273,40 @@ if tab2:
             st.header("🤖 Trợ lý AI – Hỏi đáp theo dữ liệu")
             question = st.text_area("✍️ Nhập câu hỏi:")
         
-            df_ai = data_filtered.tail(max_rows)
-        
             if st.button("🤖 Gửi câu hỏi"):
                 if question.strip() == "":
                     st.warning("❗ Vui lòng nhập câu hỏi.")
                 else:
+                    # Gửi toàn bộ dữ liệu đã lọc: prompt tự tổng hợp và chỉ kèm tối đa max_rows dòng gần nhất
+                    df_ai = engine.take(rows)
                     with st.spinner("⏳ Đang truy vấn AI, vui lòng chờ..."):
-                        # Tiến trình ảo
-                        progress_placeholder = st.empty()
-                        progress_bar = progress_placeholder.progress(0)
-                        for percent_complete in range(100):
-                            time.sleep(0.01)
-                            progress_bar.progress(percent_complete + 1)
-                        progress_placeholder.empty()
-        
-                        # Gọi AI
+                        # Gọi AI (stream: nhận từng đoạn ngay khi model trả về)
                         api_key = os.getenv("OPENAI_API_KEY")
                         ai_response, prompt_used = query_openai(
                             user_question=question,
                             df_summary=df_ai,
                             df_raw=df_raw,
-                            api_key=api_key
+                            api_key=api_key,
+                            data_version=data_version,
+                            use_cache=not bypass_ai_cache,
+                            stream=True,
+                            max_rows=max_rows,
+                            resolver=view.derived("entities", lambda: EntityResolver(data, schema)),
                         )
         
-                    # ✅ Hiện thông báo thành công rồi ẩn đi
-                    success_box = st.empty()
-                    success_box.success("✅ Đã xử lý xong câu hỏi.")
-                    time.sleep(1)
-                    success_box.empty()
-        
                     # 📋 Hiển thị kết quả nếu có
-                    if ai_response:
-                        st.markdown("### 📋 Kết quả:")
-                        st.markdown(ai_response, unsafe_allow_html=True)
+                    if isinstance(ai_response, str):
+                        if ai_response:
+                            st.markdown("### 📋 Kết quả:")
+                            st.markdown(ai_response, unsafe_allow_html=True)
+                        else:
+                            st.warning("⚠️ Không có nội dung trả về từ AI hoặc intent.")
                     else:
-                        st.warning("⚠️ Không có nội dung trả về từ AI hoặc intent.")
+                        st.markdown("### 📋 Kết quả:")
+                        # Bấm nút bất kỳ (kể cả Dừng) sẽ chạy lại script và ngắt stream đang nhận
+                        st.button("⏹️ Dừng trả lời")
+                        st.write_stream(ai_response)
+                    st.toast("✅ Đã xử lý xong câu hỏi.")
         
                     # 🔍 Hiển thị Debug nếu là admin
                     if st.session_state.get("debug_mode", False):
@@ -284,6 +316,10 @@ if tab2:
                         if prompt_used is not None:
                             st.markdown("#### 🧠 Intent hệ thống hiểu:")
                             st.code(prompt_used.get("intent", "Không rõ"), language="json")
+                            if prompt_used.get("cache"):
+                                st.caption(f"Cache AI: {prompt_used['cache']}")
+                            if prompt_used.get("prompt_tokens"):
+                                st.caption(f"Ước lượng prompt: ~{prompt_used['prompt_tokens']} token")
         
                             st.markdown("#### 🧾 Prompt được gửi tới AI:")
                             st.code(prompt_used.get("prompt", ""), language="markdown")
@@ -294,328 +330,72 @@ if tab2:
 with tab3:
     st.header("📋 Thống kê theo mẫu")
 
-    # Bộ lọc khoảng thời gian
-    col_date = find_col(data.columns, "ngày tiếp nhận")
-    if col_date:
-        data[col_date] = pd.to_datetime(data[col_date], errors='coerce')
-        min_date = data[col_date].min()
-        max_date = data[col_date].max()
+    # Cube tổng hợp dựng một lần cho mỗi phiên bản dữ liệu; None = tính trên dòng thô
+    cube = view.derived("cube", lambda: build_cube(data, schema))
+
+    # Bộ lọc khoảng thời gian: tra trên chỉ mục ngày đã sắp xếp, không parse lại cột
+    tab3_rows = None
+    col_date = schema.find("ngày tiếp nhận")
+    if col_date and engine.date_index is not None and engine.date_index.min is not None:
+        min_date = engine.date_index.min
+        max_date = engine.date_index.max
         ngay_bat_dau, ngay_ket_thuc = st.date_input(
             "📅 Chọn khoảng ngày tiếp nhận:",
             value=(min_date, max_date),
             min_value=min_date,
             max_value=max_date
         )
-        data = data[(data[col_date] >= pd.to_datetime(ngay_bat_dau)) &
-                    (data[col_date] <= pd.to_datetime(ngay_ket_thuc))]
+        tab3_rows = engine.positions(date_range=(ngay_bat_dau, ngay_ket_thuc))
+        cube = cube_for_date_range(cube, ngay_bat_dau, ngay_ket_thuc, min_date, max_date)
 
     # Bộ lọc nhóm hàng
-    col_nhom = find_col(data.columns, "nhóm hàng")
+    col_nhom = schema.find("nhóm hàng")
     if col_nhom:
-        nhom_list = data[col_nhom].dropna().unique().tolist()
+        nhom_list = engine.unique(col_nhom, tab3_rows)
         selected_nhoms = st.multiselect("📦 Chọn nhóm hàng cần phân tích:", nhom_list)
         if selected_nhoms:
-            data = data[data[col_nhom].isin(selected_nhoms)]
+            tab3_rows = engine.positions(tab3_rows, isin={col_nhom: selected_nhoms})
+            if cube is not None:
+                cube = cube.where(col_nhom, selected_nhoms) if cube.has(col_nhom) else None
 
-    # Lấy quyền của người dùng từ session
+    # Danh sách báo cáo theo quyền người dùng (định nghĩa trong rma_reports)
     role = st.session_state.get("role", "guest")
+    reports = reports_for_role(role)
+    options = ["— Chọn loại thống kê —"] + [r.label for r in reports]
 
-    # Cập nhật danh sách truy vấn dựa trên quyền người dùng
-    if role == "admin":
-        options = [
-            "— Chọn loại thống kê —",  # Dòng chọn loại thống kê
-            "Tổng số sản phẩm tiếp nhận theo tháng/năm/quý",
-            "Tỷ lệ sửa chữa thành công theo tháng/năm/quý",
-            "Danh sách sản phẩm chưa sửa xong",
-            "Top 10 khách hàng gửi nhiều nhất",
-            "Top 10 sản phẩm bảo hành nhiều nhất",
-            "Top lỗi phổ biến theo nhóm hàng",
-            "Thời gian xử lý trung bình",
-            "Top sản phẩm bảo hành nhiều trong nhóm hàng đã chọn",
-            "Thời gian xử lý trung bình theo khách hàng",
-            "Serial bị gửi nhiều lần",
-            "Hiệu suất sửa chữa theo kỹ thuật viên",
-            "Số lượng bảo hành theo sản phẩm",
-            "Khách hàng gửi bảo hành bao nhiêu tính theo sản phẩm",
-            "Sản phẩm nhận bảo hành bao nhiêu tính theo khách hàng"
-        ]
-    elif role == "mod":
-        options = [
-            "— Chọn loại thống kê —",  # Dòng chọn loại thống kê
-            "Tổng số sản phẩm tiếp nhận theo tháng/năm/quý",
-            "Top 10 khách hàng gửi nhiều nhất",
-            "Top 10 sản phẩm bảo hành nhiều nhất",
-            "Top lỗi phổ biến theo nhóm hàng",
-            "Top sản phẩm bảo hành nhiều trong nhóm hàng đã chọn",
-            "Serial bị gửi nhiều lần",
-            "Hiệu suất sửa chữa theo kỹ thuật viên",
-            "Số lượng bảo hành theo sản phẩm",
-            "Khách hàng gửi bảo hành bao nhiêu tính theo sản phẩm",
-            "Sản phẩm nhận bảo hành bao nhiêu tính theo khách hàng"
-        ]
-    else:  # user
-        options = [
-            "— Chọn loại thống kê —",  # Dòng chọn loại thống kê
-            "Top lỗi phổ biến theo nhóm hàng",
-            "Top sản phẩm bảo hành nhiều trong nhóm hàng đã chọn",
-            "Số lượng bảo hành theo sản phẩm",
-            "Khách hàng gửi bảo hành bao nhiêu tính theo sản phẩm",
-            "Sản phẩm nhận bảo hành bao nhiêu tính theo khách hàng"
-        ]
-
+    # Chế độ tổng hợp: mọi báo cáo được phép trong một lượt tính, một file Excel nhiều sheet
+    dash_reports = dashboard_reports(role)
+    dashboard_mode = len(dash_reports) > 1 and st.toggle("🧭 Xem tổng hợp tất cả báo cáo")
 
     # Hiển thị box và yêu cầu chọn
-    selected = st.selectbox("📊 Chọn loại thống kê:", options, index=0)
+    if not dashboard_mode:
+        selected = st.selectbox("📊 Chọn loại thống kê:", options, index=0)
+
+    if role == "admin":
+        with st.expander("⏱️ Thời gian chạy báo cáo"):
+            timings = timing_summary()
+            if timings.empty:
+                st.caption("Chưa có báo cáo nào được chạy.")
+            else:
+                st.dataframe(timings)
 
     # Nếu chưa chọn, dừng lại
-    if selected == "— Chọn loại thống kê —":
+    if not dashboard_mode and selected == "— Chọn loại thống kê —":
         st.warning("⚠️ Vui lòng chọn loại thống kê.")
         st.stop()
 
-    if selected == "Tổng số sản phẩm tiếp nhận theo tháng/năm/quý":
-        group_by = st.selectbox("Nhóm theo:", ["Năm", "Tháng", "Quý"])
-
-        if group_by:
-            with st.spinner("🔄 Đang truy vấn dữ liệu..."):
-                time.sleep(1)
-                title, df_out = rma_query_templates.query_1_total_by_group(data, group_by)
-
-            if not df_out.empty:
-                st.toast("✅ Đã xử lý xong truy vấn!", icon="🎉")
-                st.subheader(title)
-                st.dataframe(df_out)
-                export_excel_button(df_out, filename="tong_so_tiep_nhan.xlsx")
-            else:
-                st.warning("⚠️ Không tìm thấy dữ liệu phù hợp.")
-
-    elif selected == "Tỷ lệ sửa chữa thành công theo tháng/năm/quý":
-        group_by = st.selectbox("Nhóm theo:", ["Năm", "Tháng", "Quý"])
-
-        if group_by:
-            with st.spinner("🔄 Đang truy vấn dữ liệu..."):
-                time.sleep(1)
-                title, df_out = rma_query_templates.query_2_success_rate_by_group(data, group_by)
-
-            if not df_out.empty:
-                st.toast("✅ Đã xử lý xong truy vấn!", icon="🎉")
-                st.subheader(title)
-                st.dataframe(df_out)
-                export_excel_button(df_out, filename="ti_le_sua_chua.xlsx")
-            else:
-                st.warning("⚠️ Không tìm thấy dữ liệu phù hợp.")
-
-    elif selected == "Danh sách sản phẩm chưa sửa xong":
-        with st.spinner("🔄 Đang truy vấn dữ liệu..."):
-            time.sleep(1)
-            title, df_out = rma_query_templates.query_3_unrepaired_products(data)
-
-        if not df_out.empty:
-            st.toast("✅ Đã xử lý xong truy vấn!", icon="🎉")
-            st.subheader(title)
-            st.dataframe(df_out)
-            export_excel_button(df_out, filename="chua_sua_xong.xlsx")
-        else:
-            st.warning("⚠️ Không tìm thấy dữ liệu phù hợp.")
-
-    elif selected == "Top 10 khách hàng gửi nhiều nhất":
-        with st.spinner("🔄 Đang truy vấn dữ liệu..."):
-            time.sleep(1)
-            title, df_out = rma_query_templates.query_4_top_customers(data)
-
-        if not df_out.empty:
-            st.toast("✅ Đã xử lý xong truy vấn!", icon="🎉")
-            st.subheader(title)
-            st.dataframe(df_out)
-            export_excel_button(df_out, filename="top_khach_hang.xlsx")
-        else:
-            st.warning("⚠️ Không tìm thấy dữ liệu phù hợp.")
-
-
-    elif selected == "Top 10 sản phẩm bảo hành nhiều nhất":
-        with st.spinner("🔄 Đang truy vấn dữ liệu..."):
-            time.sleep(1)
-            title, df_out = rma_query_templates.query_7_top_products(data)
-
-        if not df_out.empty:
-            st.toast("✅ Đã xử lý xong truy vấn!", icon="🎉")
-            st.subheader(title)
-            st.dataframe(df_out)
-            export_excel_button(df_out, filename="top_san_pham.xlsx")
-        else:
-            st.warning("⚠️ Không tìm thấy dữ liệu phù hợp.")
-
-    elif selected == "Top lỗi phổ biến theo nhóm hàng":
-        with st.spinner("🔄 Đang truy vấn dữ liệu..."):
-            time.sleep(1)
-            title, df_out = rma_query_templates.query_top_errors(data)
-
-        if not df_out.empty:
-            st.toast("✅ Đã xử lý xong truy vấn!", icon="🎉")
-            st.subheader(title)
-            fig = px.bar(df_out, x="Lỗi", y="Số lần gặp", title="Biểu đồ lỗi kỹ thuật phổ biến",
-                         text_auto=True, template="plotly_dark")
-            fig.update_layout(xaxis_tickangle=-45, height=500, margin=dict(l=30, r=30, t=60, b=150))
-            st.plotly_chart(fig, use_container_width=True)
-            st.dataframe(df_out)
-            export_excel_button(df_out, filename="top_loi_pop.xlsx")
-        else:
-            st.warning("⚠️ Không tìm thấy dữ liệu phù hợp.")
-
-    elif selected == "Thời gian xử lý trung bình":
-        with st.spinner("🔄 Đang truy vấn dữ liệu..."):
-            time.sleep(1)
-            title, df_out = rma_query_templates.query_avg_processing_time(data)
-
-        if not df_out.empty:
-            st.toast("✅ Đã xử lý xong truy vấn!", icon="🎉")
-            st.subheader(title)
-            st.dataframe(df_out)
-            export_excel_button(df_out, filename="thoi_gian_xu_ly_tb.xlsx")
-        else:
-            st.warning("⚠️ Không tìm thấy dữ liệu phù hợp.")
-
-
-    elif selected == "Top sản phẩm bảo hành nhiều trong nhóm hàng đã chọn":
-        if selected_nhoms and len(selected_nhoms) == 1:
-            selected_group = selected_nhoms[0]  # lấy nhóm duy nhất
-            with st.spinner("🔄 Đang truy vấn dữ liệu..."):
-                time.sleep(1)
-                title, df_out = rma_query_templates.query_top_products_in_group(data, selected_group)
-
-            if not df_out.empty:
-                st.toast("✅ Đã xử lý xong truy vấn!", icon="🎉")
-                st.subheader(title)
-                st.dataframe(df_out)
-                export_excel_button(df_out, filename=f"top_san_pham_{selected_group}.xlsx")
-            else:
-                st.warning("⚠️ Không tìm thấy dữ liệu phù hợp.")
-        elif len(selected_nhoms) > 1:
-            st.warning("⚠️ Truy vấn này chỉ hỗ trợ khi chọn đúng 1 nhóm hàng.")
-        else:
-            st.warning("⚠️ Vui lòng chọn nhóm hàng cần phân tích.")
-
-
-
-    elif selected == "Thời gian xử lý trung bình theo khách hàng":
-        col_khach = find_col(data.columns, "tên khách hàng")
-        if col_khach:
-            unique_khach = data[col_khach].dropna().unique().tolist()
-            selected_khach = st.selectbox("🔍 Chọn khách hàng cần xem:", unique_khach)
-        else:
-            selected_khach = None
-
-        if selected_khach:
-            with st.spinner("🔄 Đang truy vấn dữ liệu..."):
-                time.sleep(1)
-                title, df_out = rma_query_templates.query_avg_time_by_customer(data, selected_khach)
-
-            if not df_out.empty:
-                st.toast("✅ Đã xử lý xong truy vấn!", icon="🎉")
-                st.subheader(title)
-                st.dataframe(df_out)
-                export_excel_button(df_out, filename="tg_xu_ly_theo_khach.xlsx")
-            else:
-                st.warning("⚠️ Không tìm thấy dữ liệu phù hợp.")
-
-    elif selected == "Serial bị gửi nhiều lần":
-        with st.spinner("🔄 Đang truy vấn dữ liệu..."):
-            time.sleep(1)
-            title, df_out = rma_query_templates.query_serial_lap_lai(data)
-
-        if not df_out.empty:
-            st.toast("✅ Đã xử lý xong truy vấn!", icon="🎉")
-            st.subheader(title)
-            st.dataframe(df_out)
-            export_excel_button(df_out, filename="serial_lap_lai.xlsx")
-        else:
-            st.warning("⚠️ Không tìm thấy dữ liệu phù hợp.")
-
-    elif selected == "Hiệu suất sửa chữa theo kỹ thuật viên":
-        with st.spinner("🔄 Đang truy vấn dữ liệu..."):
-            time.sleep(1)
-            title, df_out = rma_query_templates.query_21_technician_status_summary(data)
-
-        if not df_out.empty:
-            st.toast("✅ Đã xử lý xong truy vấn!", icon="🎉")
-            st.subheader(title)
-            st.dataframe(df_out)
-            export_excel_button(df_out, filename="hieu_suat_ktv.xlsx")
-        else:
-            st.warning("⚠️ Không tìm thấy dữ liệu phù hợp.")
-
-    elif selected == "Khách hàng gửi bảo hành bao nhiêu tính theo sản phẩm":
-        col_san_pham = find_col(data.columns, "sản phẩm")
-        if col_san_pham:
-            unique_products = data[col_san_pham].dropna().unique().tolist()
-            selected_product = st.selectbox("📦 Chọn sản phẩm", sorted(unique_products))
-
-            if selected_product:
-                # 🌟 Hiệu ứng loading
-                with st.spinner("🔍 Đang truy vấn dữ liệu, vui lòng chờ..."):
-                    time.sleep(1)  # giả lập độ trễ
-                    title, df_out = rma_query_templates.query_16_top_customers_by_product(data, selected_product)
-
-                # ✅ Thông báo hoàn tất (hiện tạm)
-                st.toast("✅ Đã xử lý xong truy vấn.", icon="🎉")
-
-                # 📊 Hiển thị kết quả
-                st.subheader(title)
-                st.dataframe(df_out)
-                export_excel_button(df_out, filename=f"top_khach_{selected_product}.xlsx")
-        else:
-            st.error("❌ Không tìm thấy cột tên sản phẩm trong dữ liệu.")
-
-    elif selected == "Sản phẩm nhận bảo hành bao nhiêu tính theo khách hàng":
-        col_khach = find_col(data.columns, "tên khách hàng")
-        col_san_pham = find_col(data.columns, "sản phẩm")
-
-        if col_khach and col_san_pham:
-            unique_khach = data[col_khach].dropna().unique().tolist()
-            selected_khach = st.selectbox("👤 Chọn khách hàng", sorted(unique_khach))
-
-            if selected_khach:
-                with st.spinner("🔄 Đang truy vấn dữ liệu, vui lòng chờ..."):
-                    time.sleep(1)
-                    title, df_out = rma_query_templates.query_5_top_products_by_customer(
-                        data, selected_khach, top_n=30
-                    )
-
-                st.toast("✅ Đã xử lý xong truy vấn.", icon="📊")
-                st.subheader(title)
-                st.dataframe(df_out)
-                export_excel_button(df_out, filename=f"top_san_pham_{selected_khach}.xlsx")
-        else:
-            st.error("❌ Không tìm thấy cột 'tên khách hàng' hoặc 'sản phẩm' trong dữ liệu.")
-         
-    elif selected == "Số lượng bảo hành theo sản phẩm":
-        col_sp = find_col(data.columns, "sản phẩm")
-        ok_col = find_col(data.columns, "đã sửa xong")  # Cột "Đã sửa xong"
-        if col_sp and ok_col:
-            unique_products = sorted(data[col_sp].dropna().unique().tolist())
-            selected_product = st.selectbox("🧱 Chọn sản phẩm cần thống kê:", unique_products)
-
-            if selected_product:
-                with st.spinner("🔄 Đang truy vấn dữ liệu..."):
-                    time.sleep(1)
-                    # Đếm số lượt gửi và số lượng đã sửa xong
-                    count = data[data[col_sp] == selected_product].shape[0]
-                    fixed = data[data[col_sp] == selected_product][ok_col].sum()
-                    ratio = round(fixed / count * 100, 1) if count else 0
-
-                    # Tạo bảng kết quả
-                    df_out = pd.DataFrame({
-                        "Sản phẩm": [selected_product],
-                        "Số lượt gửi": [count],
-                        "Đã sửa xong": [fixed],
-                        "Tỷ lệ sửa thành công (%)": [ratio]
-                    })
-
-                st.toast("✅ Đã xử lý xong truy vấn!", icon="📦")
-                st.subheader(f"Kết quả cho sản phẩm: {selected_product}")
-                st.dataframe(df_out)
-                export_excel_button(df_out, filename=f"bao_hanh_{selected_product}.xlsx")
-            else:
-                st.warning("⚠️ Vui lòng chọn sản phẩm cần thống kê.")
-        else:
-            st.error("❌ Không tìm thấy cột sản phẩm hoặc cột 'Đã sửa xong' trong dữ liệu.")
-
+    ctx = {
+        "data": engine.take(tab3_rows),
+        "schema": schema,
+        "cube": cube,
+        "selected_nhoms": selected_nhoms if col_nhom else [],
+        "rows": tab3_rows,
+        "serials": serials,
+        "turnaround": turnaround,
+        "version": data_version,
+        "role": role,
+    }
+    if dashboard_mode:
+        run_dashboard(dash_reports, ctx)
+    else:
+        run_report(reports[options.index(selected) - 1], ctx)
@@ -1,6 +1,17 @@
 
+import os
+import re
 import pandas as pd
 from openai import OpenAI
+from rma_ai_cache import get_response_cache, make_cache_key
+from rma_entities import describe_matches
+from rma_utils import clean_text, get_schema, value_counts
+
+SYSTEM_PROMPT = "Bạn là một trợ lý dữ liệu chuyên về phân tích bảo hành RMA. Trả lời ngắn gọn, dễ hiểu, bằng tiếng Việt, có số liệu cụ thể."
+TEMPERATURE = 0.2
+MAX_TOKENS = 500
+AI_TIMEOUT = float(os.getenv("RMA_AI_TIMEOUT", "30"))  # giây, áp dụng cho kết nối và giữa các đoạn stream
+AI_MAX_RETRIES = int(os.getenv("RMA_AI_MAX_RETRIES", "2"))
 
 def chuan_hoa_ten_cot(df):
     import unicodedata, re
@@ -12,30 +23,167 @@ def chuan_hoa_ten_cot(df):
         return text
     return df.rename(columns={col: normalize(col) for col in df.columns})
 
-def prepare_prompt(user_question, df_summary, matched_names=None):
-    if len(df_summary) > 100:
-        df_summary = df_summary.head(100)
-    df_summary = chuan_hoa_ten_cot(df_summary.copy())
-    if "ngay_nhan" in df_summary.columns:
-        df_summary["ngay_nhan"] = pd.to_datetime(df_summary["ngay_nhan"], errors="coerce")
-        df_summary["nam"] = df_summary["ngay_nhan"].dt.year
-        df_summary["thang"] = df_summary["ngay_nhan"].dt.month
-        df_summary["quy"] = df_summary["ngay_nhan"].dt.quarter
-
-    csv_data = df_summary.to_csv(index=False)
+# === Thu gọn prompt theo ngân sách token ===
+PROMPT_TOKEN_BUDGET = int(os.getenv("RMA_PROMPT_TOKEN_BUDGET", "3000"))
+PROMPT_MAX_ROWS = 100
+SUMMARY_TOP_N = 15
+
+# (từ khoá trong câu hỏi đã bỏ dấu, trường trong COLUMN_MAPPING cần gửi kèm)
+QUESTION_FIELD_HINTS = [
+    (["khach", "cty", "cong ty", "ai gui"], ["Tên khách hàng"]),
+    (["san pham", "model", "mat hang", "loai nao", "cai nao"], ["Sản phẩm"]),
+    (["nhom"], ["Nhóm hàng"]),
+    (["ktv", "ky thuat vien", "nhan vien"], ["Kỹ thuật viên"]),
+    (["loi", "hu", "hong"], ["Tên lỗi"]),
+    (["serial", "so sn"], ["Số serial"]),
+    (["sua", "thanh cong", "tu choi", "trang thai", "ty le", "xong"], ["Đã sửa xong", "Không sửa được", "Từ chối bảo hành"]),
+    (["tra khach", "thoi gian xu ly", "bao lau", "may ngay"], ["Ngày trả khách"]),
+    (["dich vu"], ["Loại dịch vụ"]),
+]
+# Khớp trọn từ/cụm từ ("hu" không khớp "thu", "loi" không khớp "loai"): mỗi nhóm gợi ý một regex dựng sẵn
+QUESTION_FIELD_PATTERNS = [
+    (re.compile(r"\b(?:" + "|".join(re.escape(k) for k in keywords) + r")\b"), hinted)
+    for keywords, hinted in QUESTION_FIELD_HINTS
+]
+BASE_FIELDS = ["Ngày tiếp nhận", "Tên khách hàng", "Sản phẩm"]
+STATUS_FIELDS = ["Đã sửa xong", "Không sửa được", "Từ chối bảo hành"]
+
+def estimate_tokens(text):
+    """
+    Ước lượng số token không cần gọi API: tiếng Việt có dấu tốn nhiều token hơn ASCII,
+    đếm theo byte UTF-8 (~3 byte/token) cho sát với tokenizer của OpenAI.
+    """
+    return len(text.encode("utf-8")) // 3 + 1
+
+def select_prompt_columns(user_question, schema):
+    """Chỉ giữ các cột câu hỏi cần (luôn có ngày nhận, khách hàng, sản phẩm)."""
+    q = clean_text(user_question)
+    fields = list(BASE_FIELDS)
+    for pattern, hinted in QUESTION_FIELD_PATTERNS:
+        if pattern.search(q):
+            fields += [f for f in hinted if f not in fields]
+    if len(fields) == len(BASE_FIELDS):
+        fields += STATUS_FIELDS
+    cols = []
+    for field in fields:
+        col = schema[field]
+        if col and col not in cols:
+            cols.append(col)
+    return cols
+
+def _summary_sections(df, schema, cols):
+    # Các bảng tổng hợp trên TOÀN BỘ dữ liệu đã lọc, theo thứ tự ưu tiên
+    sections = [f"Tổng số dòng phù hợp: {len(df)}"]
+
+    status = []
+    for field in STATUS_FIELDS:
+        col = schema[field]
+        if col:
+            status.append(f"{field}={int((df[col] == 1).sum())}")
+    if status:
+        sections.append("Trạng thái xử lý: " + ", ".join(status))
+
+    if "Năm" in df.columns and "Tháng" in df.columns:
+        by_month = df.groupby(["Năm", "Tháng"], observed=True).size()
+        if len(by_month):
+            lines = [f"{int(y)}-{int(m):02d},{n}" for (y, m), n in by_month.items()]
+            sections.append("Số lượt theo tháng (năm-tháng,số lượt):\n" + "\n".join(lines))
+
+    for field, label in [("Tên khách hàng", "khách hàng"), ("Sản phẩm", "sản phẩm"),
+                         ("Kỹ thuật viên", "kỹ thuật viên"), ("Tên lỗi", "lỗi")]:
+        col = schema[field]
+        if not col or (col not in cols and field not in BASE_FIELDS):
+            continue
+        top = value_counts(df[col]).head(SUMMARY_TOP_N)
+        if len(top):
+            lines = [f"{name},{n}" for name, n in top.items()]
+            sections.append(f"Top {label} ({label},số lượt):\n" + "\n".join(lines))
+    return sections
+
+def prepare_prompt(user_question, df_summary, matched_names=None, token_budget=PROMPT_TOKEN_BUDGET, max_rows=PROMPT_MAX_ROWS):
+    """
+    Dựng prompt vừa ngân sách token: tổng hợp (trạng thái, theo tháng, top khách/sản phẩm)
+    trên toàn bộ dữ liệu đã lọc, rồi thêm các dòng gần nhất với những cột câu hỏi cần
+    cho tới khi hết ngân sách.
+    """
+    schema = get_schema(df_summary.columns)
+    cols = select_prompt_columns(user_question, schema)
+
     extra_info = ""
     if matched_names:
-        extra_info = f"(Đã dò gần đúng tên khách hàng: {matched_names})\n"
-    prompt = f"""{extra_info}
-Dưới đây là bảng dữ liệu bảo hành (dưới dạng csv). Hãy phân tích và trả lời câu hỏi bên dưới, có số liệu cụ thể, ngắn gọn và dễ hiểu.
+        extra_info = f"(Đã dò gần đúng tên trong câu hỏi: {matched_names})\n"
+    header = f"""{extra_info}
+Dưới đây là dữ liệu bảo hành: phần tổng hợp trên toàn bộ dữ liệu phù hợp và một số dòng gần nhất (dưới dạng csv). Hãy phân tích và trả lời câu hỏi bên dưới, có số liệu cụ thể, ngắn gọn và dễ hiểu.
 Dữ liệu:
-{csv_data}
-
+"""
+    footer = f"""
 Câu hỏi: {user_question}
 """
-    return prompt
+    used = estimate_tokens(header) + estimate_tokens(footer)
+
+    parts = []
+    for section in _summary_sections(df_summary, schema, cols):
+        cost = estimate_tokens(section) + 1
+        if used + cost > token_budget:
+            continue
+        parts.append(section)
+        used += cost
+
+    if cols and max_rows > 0:
+        rows = chuan_hoa_ten_cot(df_summary[cols].tail(max_rows))
+        lines = rows.to_csv(index=False).splitlines()
+        kept = []
+        used += estimate_tokens(lines[0]) + estimate_tokens("Các dòng gần nhất:")
+        # Dòng mới nhất được ưu tiên giữ lại
+        for line in reversed(lines[1:]):
+            cost = estimate_tokens(line)
+            if used + cost > token_budget:
+                break
+            kept.append(line)
+            used += cost
+        if kept:
+            parts.append(f"Các dòng gần nhất ({len(kept)}/{len(df_summary)} dòng):\n" + "\n".join([lines[0]] + kept[::-1]))
+
+    return header + "\n\n".join(parts) + "\n" + footer
 
-def query_openai(user_question, df_summary, df_raw, api_key, model="gpt-3.5-turbo", matched_names=None):
+def _stream_answer(stream, cache, cache_key, model, cancel_event=None):
+    """
+    Sinh từng đoạn văn bản ngay khi OpenAI trả về.
+    Dừng khi cancel_event được set hoặc khi bên gọi đóng generator (Streamlit rerun);
+    chỉ lưu cache khi nhận đủ câu trả lời.
+    """
+    parts = []
+    try:
+        for chunk in stream:
+            if cancel_event is not None and cancel_event.is_set():
+                return
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                yield delta
+    except Exception as e:
+        yield f"\n\nLỗi khi gọi OpenAI: {e}"
+        return
+    finally:
+        stream.close()
+    answer = "".join(parts).strip()
+    if answer:
+        cache.set(cache_key, answer, model=model)
+
+def query_openai(user_question, df_summary, df_raw, api_key, model="gpt-3.5-turbo", matched_names=None, data_version=None, use_cache=True,
+                 stream=False, timeout=AI_TIMEOUT, max_retries=AI_MAX_RETRIES, cancel_event=None,
+                 token_budget=PROMPT_TOKEN_BUDGET, max_rows=PROMPT_MAX_ROWS, resolver=None):
+    """
+    Trả về (câu_trả_lời, info).
+    resolver: EntityResolver của phiên bản dữ liệu; tên khách hàng/sản phẩm/KTV nhận ra trong câu hỏi
+    được dùng để lọc đúng các dòng đó trước khi dựng prompt (và ghi vào prompt nếu chưa truyền matched_names).
+    stream=True: câu trả lời từ OpenAI là generator sinh từng đoạn văn bản;
+    câu trả lời bằng intent, từ cache hoặc thông báo lỗi vẫn là str.
+    use_cache=False: không đọc cache nhưng vẫn ghi câu trả lời mới (làm mới mục cũ trong cache).
+    Cache lỗi (đĩa chỉ đọc, SQLite bị khoá) thì chạy như không có cache, không ảnh hưởng câu trả lời.
+    """
     if df_summary.empty:
         return "Không có dữ liệu phù hợp để trả lời.", {
             "intent": "no_data",
@@ -43,7 +191,8 @@ def query_openai(user_question, df_summary, df_raw, api_key, model="gpt-3.5-turb
         }
 
     from intent_handler import handle_intent
-    df_result, intent_response, detected_intent = handle_intent(user_question, df_raw)
+    df_result, intent_response, detected_intent = handle_intent(user_question, df_raw, version=data_version,
+                                                                resolver=resolver)
 
     if detected_intent != "unknown":
         return intent_response, {
@@ -53,28 +202,60 @@ def query_openai(user_question, df_summary, df_raw, api_key, model="gpt-3.5-turb
 
     # Dùng OpenAI nếu không xác định intent
     from openai import OpenAI
-    prompt = prepare_prompt(user_question, df_summary, matched_names)
+    if resolver is not None:
+        matched = resolver.mentions(user_question)
+        narrowed = resolver.filter_frame(df_summary, matched) if matched else df_summary
+        if len(narrowed):
+            df_summary = narrowed
+            if matched and not matched_names:
+                matched_names = describe_matches(matched)
+    prompt = prepare_prompt(user_question, df_summary, matched_names, token_budget=token_budget, max_rows=max_rows)
+
+    # Cache theo (model, system prompt, hash prompt, temperature); use_cache=False để bỏ qua khi đọc
+    cache = get_response_cache()
+    cache_key = make_cache_key(model, SYSTEM_PROMPT, prompt, TEMPERATURE)
+    if use_cache:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached, {
+                "intent": "chat_completion",
+                "prompt": prompt,
+                "prompt_tokens": estimate_tokens(prompt),
+                "cache": "hit"
+            }
 
     try:
-        client = OpenAI(api_key=api_key)
+        client = OpenAI(api_key=api_key, timeout=timeout, max_retries=max_retries)
         response = client.chat.completions.create(
             model=model,
             messages=[
                 {
                     "role": "system",
-                    "content": "Bạn là một trợ lý dữ liệu chuyên về phân tích bảo hành RMA. Trả lời ngắn gọn, dễ hiểu, bằng tiếng Việt, có số liệu cụ thể."
+                    "content": SYSTEM_PROMPT
                 },
                 {
                     "role": "user",
                     "content": prompt
                 }
             ],
-            temperature=0.2,
-            max_tokens=500,
+            temperature=TEMPERATURE,
+            max_tokens=MAX_TOKENS,
+            stream=stream,
         )
-        return response.choices[0].message.content.strip(), {
+        if stream:
+            return _stream_answer(response, cache, cache_key, model, cancel_event), {
+                "intent": "chat_completion",
+                "prompt": prompt,
+                "prompt_tokens": estimate_tokens(prompt),
+                "cache": "miss" if use_cache else "bypass"
+            }
+        answer = response.choices[0].message.content.strip()
+        cache.set(cache_key, answer, model=model)
+        return answer, {
             "intent": "chat_completion",
-            "prompt": prompt
+            "prompt": prompt,
+            "prompt_tokens": estimate_tokens(prompt),
+            "cache": "miss" if use_cache else "bypass"
         }
     except Exception as e:
         return f"Lỗi khi gọi OpenAI: {e}", {
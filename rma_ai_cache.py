@@ -0,0 +1,157 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# === Cache câu trả lời OpenAI trên đĩa (dùng chung giữa các phiên và qua các lần khởi động lại) ===
+AI_CACHE_PATH = os.getenv(
+    "RMA_AI_CACHE_PATH",
+    os.path.join(os.getenv("RMA_CACHE_DIR", ".rma_cache"), "ai_cache.sqlite3"),
+)
+AI_CACHE_TTL = int(os.getenv("RMA_AI_CACHE_TTL", str(7 * 24 * 3600)))  # giây
+AI_CACHE_MAX_ENTRIES = int(os.getenv("RMA_AI_CACHE_MAX_ENTRIES", "2000"))
+
+
+def make_cache_key(model, system_prompt, prompt, temperature):
+    prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    raw = "\x1f".join([model, system_prompt, prompt_hash, repr(float(temperature))])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+CACHE_ERRORS = (sqlite3.Error, OSError)
+
+
+class ResponseCache:
+    """
+    Cache SQLite: hết hạn theo ttl, giới hạn max_entries (xoá mục lâu không dùng nhất),
+    đếm hit/miss lưu ngay trong file để mọi process cùng thấy.
+    Chỉ là cache: lỗi đĩa/SQLite (hệ thống file chỉ đọc, "database is locked" giữa các worker) được ghi log
+    rồi coi như không có cache (get trả None, set bỏ qua), không làm hỏng câu trả lời.
+    """
+    def __init__(self, path=AI_CACHE_PATH, ttl=AI_CACHE_TTL, max_entries=AI_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        try:
+            self._init_db()
+            self.available = True
+        except CACHE_ERRORS as e:
+            print("⚠️ Không mở được cache AI, chạy không cache:", e)
+            self.available = False
+
+    def _init_db(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, model TEXT, response TEXT,"
+                " created_at REAL, last_access REAL, hits INTEGER DEFAULT 0)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON responses(last_access)")
+            conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER)")
+            conn.execute("INSERT OR IGNORE INTO counters VALUES ('hits', 0), ('misses', 0)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _count(self, conn, name):
+        conn.execute("UPDATE counters SET value = value + 1 WHERE name = ?", (name,))
+
+    def get(self, key):
+        if not self.available:
+            return None
+        try:
+            return self._get(key)
+        except CACHE_ERRORS as e:
+            print("⚠️ Không đọc được cache AI:", e)
+            return None
+
+    def _get(self, key):
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._count(conn, "misses")
+                return None
+            conn.execute(
+                "UPDATE responses SET last_access = ?, hits = hits + 1 WHERE key = ?", (now, key)
+            )
+            self._count(conn, "hits")
+            return row[0]
+
+    def set(self, key, response, model=""):
+        if not self.available:
+            return
+        try:
+            self._set(key, response, model)
+        except CACHE_ERRORS as e:
+            print("⚠️ Không ghi được cache AI:", e)
+
+    def _set(self, key, response, model):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, created_at, last_access, hits)"
+                " VALUES (?, ?, ?, ?, ?, 0)",
+                (key, model, response, now, now),
+            )
+            conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+            conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                " SELECT key FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def stats(self):
+        counters, entries = {}, 0
+        if self.available:
+            try:
+                with self._connect() as conn:
+                    counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+                    entries = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            except CACHE_ERRORS as e:
+                print("⚠️ Không đọc được thống kê cache AI:", e)
+        total = counters.get("hits", 0) + counters.get("misses", 0)
+        return {
+            "hits": counters.get("hits", 0),
+            "misses": counters.get("misses", 0),
+            "hit_rate": round(counters.get("hits", 0) / total * 100, 1) if total else 0.0,
+            "entries": entries,
+        }
+
+    def clear(self):
+        if not self.available:
+            return
+        try:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM responses")
+                conn.execute("UPDATE counters SET value = 0")
+        except CACHE_ERRORS as e:
+            print("⚠️ Không xoá được cache AI:", e)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
@@ -0,0 +1,455 @@
+import argparse
+import io
+import json
+import os
+import statistics
+import time
+import warnings
+from datetime import datetime
+
+import pandas as pd
+
+import intent_handler
+import rma_query_templates as q
+from rma_ai import chuan_hoa_ten_cot
+from rma_cube import build_cube
+from rma_dates import parse_dates
+from rma_entities import EntityResolver
+from rma_filters import FilterEngine
+from rma_ingest import ingest_files
+from rma_loader import content_version, enable_copy_on_write, parse_sheet_bytes, read_csv_bytes
+from rma_reports import ROLES_ADMIN, compute_dashboard, dashboard_context, dashboard_reports
+from rma_search import SearchIndex
+from rma_serials import SerialIndex
+from rma_synthetic import SIZES, generate_rma_csv
+from rma_turnaround import TurnaroundEngine
+from rma_utils import COLUMN_MAPPING, apply_bo_loc, clean_text, filter_df_by_time, find_col, get_schema
+
+# === Benchmark offline trên dữ liệu giả lập (không cần Google Sheet / OpenAI) ===
+DEFAULT_REPEAT = 5
+INTENT_QUESTIONS = [
+    "Sản phẩm nào được gửi bảo hành nhiều nhất?",
+    "Top sản phẩm gửi nhiều trong năm 2023",
+    "Khách hàng nào gửi nhiều nhất?",
+    "KTV nào sửa nhiều nhất năm 2023?",
+    "Tháng 3 năm 2023 nhận bao nhiêu sản phẩm?",
+    "Khách hàng {customer} gửi bao nhiêu sản phẩm?",
+    "{customer} gửi sản phẩm gì nhiều?",
+    "Ai gửi sản phẩm {product} nhiều nhất?",
+]
+
+
+class BenchContext:
+    """Dữ liệu dùng chung cho các case: bảng đã parse, schema, cube và vài giá trị mẫu phổ biến."""
+    def __init__(self, content):
+        self.content = content
+        self.data = parse_sheet_bytes(content)
+        self.schema = get_schema(self.data.columns)
+        self.cube = build_cube(self.data, self.schema)
+        self.df_ai = chuan_hoa_ten_cot(self.data)
+        self.engine = FilterEngine(self.data, self.schema)
+        self.turnaround = TurnaroundEngine(self.data, self.schema, filters=self.engine)
+        self.entities = EntityResolver(self.data, self.schema)
+
+        def top(keyword):
+            col = self.schema.find(keyword)
+            return self.data[col].value_counts().index[0] if col else None
+
+        self.customer = top("tên khách hàng")
+        self.product = top("sản phẩm")
+        self.group = top("nhóm hàng")
+        years = self.data["Năm"].dropna() if "Năm" in self.data.columns else pd.Series(dtype=float)
+        self.year = int(years.mode()[0]) if len(years) else None
+        col_date = self.schema.find("ngày tiếp nhận")
+        dates = self.data[col_date].dropna() if col_date else pd.Series(dtype="datetime64[ns]")
+        self.date_range = [dates.quantile(0.25).date(), dates.quantile(0.5).date()] if len(dates) else []
+
+
+CASES = []
+
+
+def bench_case(group, name):
+    """Đăng ký một case: hàm nhận BenchContext, trả về hàm không tham số để đo."""
+    def decorator(factory):
+        CASES.append((group, name, factory))
+        return factory
+    return decorator
+
+
+# --- Tải dữ liệu ---
+@bench_case("load", "parse_sheet_bytes")
+def _bench_load_parse_sheet_bytes(ctx):
+    return lambda: parse_sheet_bytes(ctx.content)
+
+@bench_case("load", "read_csv_bytes (pyarrow)")
+def _bench_load_read_csv_pyarrow(ctx):
+    return lambda: read_csv_bytes(ctx.content, engine="pyarrow")
+
+@bench_case("load", "read_csv_bytes (theo khối)")
+def _bench_load_read_csv_chunked(ctx):
+    return lambda: read_csv_bytes(ctx.content, chunk_bytes=0)
+
+def _raw_dates(ctx):
+    col = ctx.schema.find("ngày tiếp nhận")
+    return pd.read_csv(io.BytesIO(ctx.content), usecols=[col], dtype=str)[col]
+
+@bench_case("load", "pd.to_datetime (đoán định dạng)")
+def _bench_load_to_datetime(ctx):
+    dates = _raw_dates(ctx)
+    return lambda: pd.to_datetime(dates, errors="coerce", dayfirst=True)
+
+@bench_case("load", "parse_dates + Năm/Tháng/Quý/Tuần")
+def _bench_load_parse_dates(ctx):
+    dates = _raw_dates(ctx)
+
+    def run():
+        parsed = parse_dates(dates)
+        return parsed.values(), [parsed.part(name) for name in ("Năm", "Tháng", "Quý", "Tuần")]
+    return run
+
+@bench_case("load", "content_version")
+def _bench_load_content_version(ctx):
+    return lambda: content_version(ctx.content)
+
+@bench_case("load", "build_cube")
+def _bench_load_build_cube(ctx):
+    return lambda: build_cube(ctx.data, ctx.schema)
+
+def _branch_files(ctx, n_files=4):
+    # Chia CSV thành n_files file "chi nhánh" (tên, bytes), cùng tiêu đề
+    header, *lines = ctx.content.decode("utf-8").rstrip("\n").split("\n")
+    step = -(-len(lines) // n_files)
+    return [
+        (f"chi_nhanh_{i + 1}.csv", "\n".join([header] + lines[i * step:(i + 1) * step]).encode("utf-8"))
+        for i in range(n_files)
+    ]
+
+@bench_case("load", "ingest_files 4 file (1 process)")
+def _bench_load_ingest_serial(ctx):
+    files = _branch_files(ctx)
+    return lambda: ingest_files(files, workers=1)
+
+@bench_case("load", "ingest_files 4 file (song song)")
+def _bench_load_ingest_parallel(ctx):
+    files = _branch_files(ctx)
+    return lambda: ingest_files(files)
+
+@bench_case("load", "chuan_hoa_ten_cot")
+def _bench_load_chuan_hoa_ten_cot(ctx):
+    return lambda: chuan_hoa_ten_cot(ctx.data)
+
+
+# --- Tra cột ---
+@bench_case("schema", "find_col x all fields")
+def _bench_schema_find_col_x_all_fields(ctx):
+    cols = list(ctx.data.columns)
+    return lambda: [find_col(cols, field, COLUMN_MAPPING) for field in COLUMN_MAPPING]
+
+@bench_case("schema", "schema.find x all fields")
+def _bench_schema_schema_find_x_all_fields(ctx):
+    return lambda: [ctx.schema.find(field) for field in COLUMN_MAPPING]
+
+
+# --- Bộ lọc ---
+def _filters(ctx, **overrides):
+    filters = {"years": [], "months": [], "quarters": [], "date_range": []}
+    filters.update(overrides)
+    return filters
+
+@bench_case("filter", "apply_bo_loc (trống)")
+def _bench_filter_apply_bo_loc_trong(ctx):
+    filters = _filters(ctx)
+    return lambda: apply_bo_loc(ctx.data, filters)
+
+@bench_case("filter", "apply_bo_loc năm+quý")
+def _bench_filter_apply_bo_loc_nam_quy(ctx):
+    filters = _filters(ctx, years=[ctx.year], quarters=[2, 3])
+    return lambda: apply_bo_loc(ctx.data, filters)
+
+@bench_case("filter", "apply_bo_loc khoảng ngày")
+def _bench_filter_apply_bo_loc_khoang_ngay(ctx):
+    filters = _filters(ctx, date_range=ctx.date_range)
+    return lambda: apply_bo_loc(ctx.data, filters)
+
+@bench_case("filter", "filter_df_by_time")
+def _bench_filter_filter_df_by_time(ctx):
+    return lambda: filter_df_by_time(ctx.data, years=[ctx.year], months=[3, 4])
+
+@bench_case("filter", "intent filter_by_time")
+def _bench_filter_intent_filter_by_time(ctx):
+    question = f"tháng 3 năm {ctx.year}"
+    return lambda: intent_handler.filter_by_time(ctx.df_ai, question)
+
+
+@bench_case("filter", "FilterEngine năm+quý")
+def _bench_filter_engine_nam_quy(ctx):
+    return lambda: ctx.engine.positions(years=[ctx.year], quarters=[2, 3])
+
+@bench_case("filter", "FilterEngine khoảng ngày")
+def _bench_filter_engine_khoang_ngay(ctx):
+    return lambda: ctx.engine.positions(date_range=ctx.date_range)
+
+@bench_case("filter", "FilterEngine từ khoá khách hàng")
+def _bench_filter_engine_tu_khoa(ctx):
+    col = ctx.schema.find("khách hàng")
+    return lambda: ctx.engine.positions(contains={col: "tân"})
+
+
+
+@bench_case("search", "SearchIndex dựng (khách hàng)")
+def _bench_search_build_khach(ctx):
+    col = ctx.schema.find("khách hàng")
+    return lambda: SearchIndex(ctx.data[col])
+
+@bench_case("search", "SearchIndex dựng (serial)")
+def _bench_search_build_serial(ctx):
+    col = ctx.schema.find("serial")
+    return lambda: SearchIndex(ctx.data[col])
+
+@bench_case("search", "SearchIndex gợi ý + lọc khách hàng")
+def _bench_search_khach(ctx):
+    index = SearchIndex(ctx.data[ctx.schema.find("khách hàng")])
+    return lambda: (index.suggest("tan", limit=3), index.positions("tan"))
+
+@bench_case("search", "SearchIndex gợi ý + lọc serial")
+def _bench_search_serial(ctx):
+    index = SearchIndex(ctx.data[ctx.schema.find("serial")])
+    return lambda: (index.suggest("1234", limit=3), index.positions("1234"))
+
+
+@bench_case("serial", "SerialIndex dựng")
+def _bench_serial_build(ctx):
+    col = ctx.schema.find("serial")
+    return lambda: SerialIndex(ctx.data[col])
+
+@bench_case("serial", "SerialIndex thêm 1% dòng mới")
+def _bench_serial_extend(ctx):
+    col = ctx.schema.find("serial")
+    split = len(ctx.data) - max(1, len(ctx.data) // 100)
+    index = SerialIndex(ctx.data[col].iloc[:split])
+    return lambda: index.extended(ctx.data[col].iloc[split:])
+
+@bench_case("serial", "SerialIndex tra chính xác + tiền tố")
+def _bench_serial_lookup(ctx):
+    col = ctx.schema.find("serial")
+    index = SerialIndex(ctx.data[col])
+    serial = ctx.data[col].iloc[len(ctx.data) // 2]
+    index.prefix(serial[:4])  # dựng sẵn bản sắp xếp
+    return lambda: (index.lookup(serial), index.prefix(serial[:6], limit=5))
+
+@bench_case("serial", "query_serial_lap_lai (có chỉ mục)")
+def _bench_serial_repeats(ctx):
+    index = SerialIndex(ctx.data[ctx.schema.find("serial")])
+    return lambda: q.query_serial_lap_lai(ctx.data, schema=ctx.schema, serials=index)
+
+
+@bench_case("entity", "EntityResolver dựng")
+def _bench_entity_build(ctx):
+    return lambda: EntityResolver(ctx.data, ctx.schema)
+
+@bench_case("entity", "resolve khách hàng (không dấu, sai 1 ký tự)")
+def _bench_entity_resolve(ctx):
+    resolver = EntityResolver(ctx.data, ctx.schema)
+    typo = clean_text(ctx.customer)
+    typo = typo[:len(typo) // 2] + typo[len(typo) // 2 + 1:]
+    return lambda: resolver.resolve("customer", typo)
+
+@bench_case("entity", "mentions trong câu hỏi")
+def _bench_entity_mentions(ctx):
+    resolver = EntityResolver(ctx.data, ctx.schema)
+    question = f"Khách hàng {clean_text(ctx.customer)} gửi sản phẩm {ctx.product} nhiều nhất năm {ctx.year}?"
+    return lambda: resolver.mentions(question)
+
+
+def _dashboard_ctx(ctx):
+    # Khoảng ngày lệch ranh giới tháng: không dùng được cube toàn cục, phải tính trên dữ liệu đã lọc
+    data = ctx.engine.take(ctx.engine.positions(date_range=ctx.date_range))
+    return {"data": data, "schema": ctx.schema, "cube": None, "selected_nhoms": []}
+
+@bench_case("dashboard", "tổng hợp: từng báo cáo riêng")
+def _bench_dashboard_separate(ctx):
+    reports, report_ctx = dashboard_reports(ROLES_ADMIN[0]), _dashboard_ctx(ctx)
+    return lambda: compute_dashboard(reports, report_ctx)
+
+@bench_case("dashboard", "tổng hợp: một lượt qua cube")
+def _bench_dashboard_one_pass(ctx):
+    reports, report_ctx = dashboard_reports(ROLES_ADMIN[0]), _dashboard_ctx(ctx)
+    return lambda: compute_dashboard(reports, dashboard_context(report_ctx))
+
+# --- Mẫu thống kê (rma_query_templates) ---
+def _query_cases(ctx):
+    d, s, c, t = ctx.data, ctx.schema, ctx.cube, ctx.turnaround
+    return [
+        ("query_1_total_by_group", lambda: q.query_1_total_by_group(d, "Tháng")),
+        ("query_1_total_by_group [cube]", lambda: q.query_1_total_by_group(d, "Tháng", cube=c)),
+        ("query_2_success_rate_by_group", lambda: q.query_2_success_rate_by_group(d, "Quý", schema=s)),
+        ("query_2_success_rate_by_group [cube]", lambda: q.query_2_success_rate_by_group(d, "Quý", schema=s, cube=c)),
+        ("query_3_unrepaired_products", lambda: q.query_3_unrepaired_products(d, schema=s)),
+        ("query_4_top_customers", lambda: q.query_4_top_customers(d, schema=s)),
+        ("query_4_top_customers [cube]", lambda: q.query_4_top_customers(d, schema=s, cube=c)),
+        ("query_5_top_products_by_customer", lambda: q.query_5_top_products_by_customer(d, ctx.customer, schema=s)),
+        ("query_6_total_by_customer_and_time", lambda: q.query_6_total_by_customer_and_time(d, ctx.customer, "Tháng", schema=s)),
+        ("query_7_top_products", lambda: q.query_7_top_products(d, schema=s)),
+        ("query_7_top_products [cube]", lambda: q.query_7_top_products(d, schema=s, cube=c)),
+        ("query_8_top_rejected_products", lambda: q.query_8_top_rejected_products(d, schema=s)),
+        ("query_9_product_status_counts", lambda: q.query_9_product_status_counts(d, ctx.product, schema=s)),
+        ("query_10_top_errors", lambda: q.query_10_top_errors(d, schema=s)),
+        ("query_11_top_errors_by_product", lambda: q.query_11_top_errors_by_product(d, ctx.product, schema=s)),
+        ("query_12_errors_by_customer_and_product",
+         lambda: q.query_12_errors_by_customer_and_product(d, ctx.customer, ctx.product, schema=s)),
+        ("query_13_status_summary", lambda: q.query_13_status_summary(d, schema=s)),
+        ("query_13_status_summary [cube]", lambda: q.query_13_status_summary(d, schema=s, cube=c)),
+        ("query_14_success_rate_overall", lambda: q.query_14_success_rate_overall(d, schema=s)),
+        ("query_15_rejected_products_by_time", lambda: q.query_15_rejected_products_by_time(d, schema=s)),
+        ("query_16_top_customers_by_product", lambda: q.query_16_top_customers_by_product(d, ctx.product, schema=s)),
+        ("query_17_top_errors_by_customer_and_quarter",
+         lambda: q.query_17_top_errors_by_customer_and_quarter(d, ctx.customer, 2, schema=s)),
+        ("query_18_success_rate_by_customer_product_month",
+         lambda: q.query_18_success_rate_by_customer_product_month(d, ctx.customer, ctx.product, 3, schema=s)),
+        ("query_19_top_technicians", lambda: q.query_19_top_technicians(d, schema=s)),
+        ("query_20_success_rate_by_technician_and_group",
+         lambda: q.query_20_success_rate_by_technician_and_group(d, "Quý", schema=s)),
+        ("query_21_technician_status_summary", lambda: q.query_21_technician_status_summary(d, schema=s)),
+        ("query_21_technician_status_summary [cube]",
+         lambda: q.query_21_technician_status_summary(d, schema=s, cube=c)),
+        ("query_top_errors", lambda: q.query_top_errors(d, schema=s)),
+        ("query_avg_processing_time", lambda: q.query_avg_processing_time(d, schema=s)),
+        ("query_avg_processing_time [engine]", lambda: q.query_avg_processing_time(d, schema=s, turnaround=t)),
+        ("query_turnaround_breakdown sản phẩm [engine]",
+         lambda: q.query_turnaround_breakdown(d, "sản phẩm", schema=s, turnaround=t)),
+        ("query_turnaround_histogram [engine]", lambda: q.query_turnaround_histogram(d, schema=s, turnaround=t)),
+        ("query_top_products_in_group", lambda: q.query_top_products_in_group(d, ctx.group, schema=s)),
+        ("query_product_warranty_count", lambda: q.query_product_warranty_count(d, ctx.product, schema=s)),
+        ("query_avg_time_by_customer", lambda: q.query_avg_time_by_customer(d, ctx.customer, schema=s)),
+        ("query_avg_time_by_customer [engine]",
+         lambda: q.query_avg_time_by_customer(d, ctx.customer, schema=s, turnaround=t)),
+        ("query_serial_lap_lai", lambda: q.query_serial_lap_lai(d, schema=s)),
+    ]
+
+
+# --- Intent ---
+def _intent_cases(ctx):
+    cases = []
+    for template in INTENT_QUESTIONS:
+        question = template.format(customer=ctx.customer, product=ctx.product)
+        # version=None: bỏ qua cache LRU để đo đúng chi phí tính
+        cases.append((question, lambda question=question: intent_handler.handle_intent(question, ctx.df_ai)))
+        if "{customer}" in template or "{product}" in template:
+            cases.append((question + " [resolver]", lambda question=question: intent_handler.handle_intent(
+                question, ctx.df_ai, resolver=ctx.entities)))
+    cases.append(("recognize_intent x all", lambda: [intent_handler.recognize_intent(t) for t in INTENT_QUESTIONS]))
+    return cases
+
+
+def iter_cases(ctx):
+    for group, name, factory in CASES:
+        yield group, name, factory(ctx)
+    for name, func in _query_cases(ctx):
+        yield "query", name, func
+    for name, func in _intent_cases(ctx):
+        yield "intent", name, func
+
+
+def time_call(func, repeat=DEFAULT_REPEAT, warmup=1):
+    samples = []
+    with warnings.catch_warnings():
+        # Cảnh báo parse ngày của pandas lặp lại ở mỗi lần gọi, làm rối bảng kết quả
+        warnings.simplefilter("ignore", UserWarning)
+        for _ in range(warmup):
+            func()
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            func()
+            samples.append((time.perf_counter() - t0) * 1000)
+    return samples
+
+
+def run_benchmarks(sizes=("10k",), repeat=DEFAULT_REPEAT, only=None, seed=0, verbose=True):
+    """
+    Chạy toàn bộ case trên từng kích thước dữ liệu; trả về DataFrame kết quả (ms).
+    only: chuỗi con để lọc theo "nhóm/tên" case.
+    """
+    rows = []
+    for size in sizes:
+        n_rows = SIZES.get(size) or int(size)
+        t0 = time.perf_counter()
+        ctx = BenchContext(generate_rma_csv(n_rows, seed=seed))
+        if verbose:
+            print(f"⏳ {size}: {n_rows} dòng, chuẩn bị {time.perf_counter() - t0:.1f}s")
+        for group, name, func in iter_cases(ctx):
+            if only and only.lower() not in f"{group}/{name}".lower():
+                continue
+            try:
+                samples = time_call(func, repeat=repeat)
+                error = None
+            except Exception as e:
+                samples, error = [], f"{type(e).__name__}: {e}"
+            row = {
+                "size": size,
+                "rows": n_rows,
+                "group": group,
+                "case": name,
+                "repeat": len(samples),
+                "min_ms": round(min(samples), 3) if samples else None,
+                "median_ms": round(statistics.median(samples), 3) if samples else None,
+                "mean_ms": round(statistics.mean(samples), 3) if samples else None,
+                "error": error,
+            }
+            rows.append(row)
+            if verbose:
+                status = f"{row['median_ms']:10.2f} ms" if samples else f"❌ {error}"
+                print(f"  {group:7s} {name[:60]:60s} {status}")
+    return pd.DataFrame(rows)
+
+
+def compare_results(current, baseline):
+    """Ghép với kết quả lần trước theo (size, group, case); ratio < 1 là nhanh hơn."""
+    keys = ["size", "group", "case"]
+    merged = current.merge(baseline[keys + ["median_ms"]], on=keys, how="left", suffixes=("", "_baseline"))
+    merged["ratio"] = (merged["median_ms"] / merged["median_ms_baseline"]).round(3)
+    return merged
+
+
+def save_results(results, path):
+    payload = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "pandas": pd.__version__,
+        "cpu_count": os.cpu_count(),
+        "results": results.to_dict(orient="records"),
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+
+
+def load_results(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return pd.DataFrame(json.load(f)["results"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark các mẫu thống kê, bộ lọc, intent và tải CSV.")
+    parser.add_argument("--sizes", default="10k", help="danh sách kích thước, vd 10k,100k,1m")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--only", default=None, help="chỉ chạy case có nhóm/tên chứa chuỗi này")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", default=None, help="lưu kết quả ra file JSON")
+    parser.add_argument("--compare", default=None, help="so sánh với file JSON của lần chạy trước")
+    args = parser.parse_args(argv)
+
+    enable_copy_on_write()  # đo cùng chế độ với app/dịch vụ
+    results = run_benchmarks(
+        sizes=[s.strip() for s in args.sizes.split(",") if s.strip()],
+        repeat=args.repeat,
+        only=args.only,
+        seed=args.seed,
+    )
+    if args.compare:
+        results = compare_results(results, load_results(args.compare))
+        print(results[["size", "group", "case", "median_ms", "median_ms_baseline", "ratio"]].to_string(index=False))
+    if args.json:
+        save_results(results, args.json)
+        print(f"💾 Đã lưu kết quả vào {args.json}")
+
+
+if __name__ == "__main__":
+    main()
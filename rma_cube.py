@@ -0,0 +1,155 @@
+import numpy as np
+import pandas as pd
+
+from rma_utils import concat_frames, date_range_bounds, get_schema
+
+# Chiều thời gian + các chiều tra bằng từ khoá giống các hàm trong rma_query_templates
+TIME_DIMENSIONS = ["Năm", "Quý", "Tháng"]
+KEYWORD_DIMENSIONS = ["khách hàng", "sản phẩm", "nhóm hàng", "ktv"]
+MEASURES = ["n", "ok", "fail", "tcbh"]
+
+
+class RmaCube:
+    """
+    Bảng tổng hợp sẵn: mỗi dòng là một tổ hợp năm × quý × tháng × khách × sản phẩm × nhóm × KTV
+    với n (số lượt), ok/fail/tcbh (số dòng có cờ trạng thái = 1).
+    """
+    def __init__(self, table, dims):
+        self.table = table
+        self.dims = dims
+        self._rollups = {}  # các báo cáo dùng chung kết quả gộp theo cùng chiều
+
+    def has(self, *cols):
+        return all(col is not None and col in self.dims for col in cols)
+
+    def rollup(self, by):
+        key = tuple(by) if isinstance(by, list) else by
+        result = self._rollups.get(key)
+        if result is None:
+            column = self.table[by] if isinstance(by, str) else None
+            if column is not None and isinstance(column.dtype, pd.CategoricalDtype):
+                result = self._rollup_codes(column)
+            else:
+                result = self.table.groupby(by, observed=True)[MEASURES].sum()
+            self._rollups[key] = result
+        return result
+
+    def value_counts(self, col):
+        """
+        Số lượt theo một chiều, cùng thứ tự với rma_utils.value_counts trên dòng thô: nhiều nhất trước,
+        bằng nhau thì giá trị xuất hiện trước đứng trước (bảng tổ hợp dựng với sort=False nên giữ thứ tự
+        xuất hiện đầu tiên của dữ liệu).
+        """
+        key = ("value_counts", col)
+        result = self._rollups.get(key)
+        if result is None:
+            codes, uniques = pd.factorize(self.table[col])
+            valid = codes >= 0
+            counts = np.bincount(codes[valid], weights=self.table["n"].to_numpy()[valid],
+                                 minlength=len(uniques)).astype("int64")
+            order = np.argsort(-counts, kind="stable")
+            order = order[counts[order] > 0]
+            result = pd.Series(counts[order], index=pd.Index(uniques.take(order), name=col), name="count")
+            self._rollups[key] = result
+        return result
+
+    def _rollup_codes(self, column):
+        # Một chiều dạng category: cộng thẳng theo mã bằng bincount (như groupby observed=True)
+        codes = column.cat.codes.to_numpy()
+        valid = codes >= 0
+        size = len(column.cat.categories)
+        present = np.flatnonzero(np.bincount(codes[valid], minlength=size))
+        sums = {
+            m: np.bincount(codes[valid], weights=self.table[m].to_numpy()[valid], minlength=size)[present].astype("int64")
+            for m in MEASURES
+        }
+        index = pd.CategoricalIndex(
+            pd.Categorical.from_codes(present, dtype=column.dtype), name=column.name
+        )
+        return pd.DataFrame(sums, index=index)
+
+    def totals(self):
+        return self.table[MEASURES].sum()
+
+    def where(self, col, values):
+        return RmaCube(self.table[self.table[col].isin(values)], self.dims)
+
+    def where_notna(self, col):
+        return RmaCube(self.table[self.table[col].notna()], self.dims)
+
+    def where_period(self, start, end):
+        # Lọc theo tháng: chỉ đúng khi [start, end] trùng ranh giới tháng
+        period = self.table["Năm"].astype("Int64") * 12 + self.table["Tháng"].astype("Int64")
+        lo = start.year * 12 + start.month
+        hi = end.year * 12 + end.month
+        return RmaCube(self.table[(period >= lo) & (period <= hi)], self.dims)
+
+
+def build_cube(df, schema=None, aggregate=True):
+    """
+    aggregate=False: giữ nguyên từng dòng (chỉ tính sẵn cột trạng thái), dùng khi dữ liệu đã lọc nhỏ,
+    bảng tổ hợp gần như không gọn hơn dữ liệu mà lại tốn một lần groupby nhiều chiều.
+    """
+    schema = schema or get_schema(df.columns)
+    dims = [col for col in TIME_DIMENSIONS if col in df.columns]
+    for keyword in KEYWORD_DIMENSIONS:
+        col = schema.find(keyword)
+        if col and col not in dims:
+            dims.append(col)
+
+    frame = pd.DataFrame({col: df[col] for col in dims}, index=df.index)
+    frame["n"] = 1
+    for measure, keyword in [("ok", "đã sửa xong"), ("fail", "không sửa được"), ("tcbh", "từ chối bảo hành")]:
+        col = schema.find(keyword)
+        frame[measure] = (df[col] == 1).astype("int64") if col else 0
+
+    if not aggregate:
+        table = frame.reset_index(drop=True)
+    elif dims:
+        table = frame.groupby(dims, dropna=False, observed=True, sort=False)[MEASURES].sum().reset_index()
+    else:
+        table = frame[MEASURES].sum().to_frame().T
+    return RmaCube(table, dims)
+
+
+def update_cube(cube, added, removed=None, schema=None):
+    """
+    Cube sau khi thêm các dòng added và bỏ các dòng removed (giá trị cũ của các dòng bị sửa):
+    chỉ dựng cube cho phần thay đổi rồi cộng/trừ vào bảng tổ hợp, không quét lại toàn bộ dữ liệu.
+    Trả về None nếu chiều của phần thay đổi khác cube (bên gọi dựng lại từ đầu).
+    """
+    schema = schema or get_schema(added.columns)
+    parts = [cube.table]
+    for frame, sign in ((added, 1), (removed, -1)):
+        if frame is None or not len(frame):
+            continue
+        delta = build_cube(frame, schema)
+        if delta.dims != cube.dims:
+            return None
+        table = delta.table
+        if sign < 0:
+            table = table.assign(**{m: -table[m] for m in MEASURES})
+        parts.append(table)
+    if len(parts) == 1:
+        return cube
+    if not cube.dims:
+        return RmaCube(concat_frames(parts)[MEASURES].sum().to_frame().T, cube.dims)
+    table = concat_frames(parts).groupby(cube.dims, dropna=False, observed=True, sort=False)[MEASURES].sum().reset_index()
+    return RmaCube(table[table["n"] != 0].reset_index(drop=True), cube.dims)
+
+
+def cube_for_date_range(cube, start, end, min_date, max_date):
+    """
+    Cube tương ứng với bộ lọc ngày tiếp nhận [start, end], hoặc None nếu phải tính trên dữ liệu thô.
+    Dòng thô được lọc theo date_range_bounds (start <= ngày < stop, ngày kết thúc tính trọn ngày), nên:
+    - Khoảng phủ toàn bộ dữ liệu: chỉ bỏ các dòng không có ngày (giống phép so sánh trên dòng thô).
+    - Khoảng trùng ranh giới tháng (từ 0h ngày 1 tới hết ngày cuối tháng): lọc theo (Năm, Tháng).
+    """
+    if not cube.has("Năm", "Tháng"):
+        return None
+    start, stop = date_range_bounds(start, end)
+    if start <= pd.Timestamp(min_date) and stop > pd.Timestamp(max_date):
+        return cube.where_notna("Năm")
+    if start == start.normalize() and start.day == 1 and stop == stop.normalize() and stop.day == 1:
+        return cube.where_period(start, stop - pd.Timedelta(days=1))
+    return None
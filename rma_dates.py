@@ -0,0 +1,172 @@
+import datetime
+import re
+
+import numpy as np
+import pandas as pd
+
+# === Parse cột ngày: đoán định dạng một lần, mỗi chuỗi ngày khác nhau chỉ parse một lần ===
+# Thứ tự là thứ tự ưu tiên khi số giá trị đọc được bằng nhau: dữ liệu RMA ghi ngày trước tháng (dd/mm/yyyy)
+DATE_FORMATS = (
+    "%d/%m/%Y",
+    "%d/%m/%Y %H:%M:%S",
+    "%d/%m/%Y %H:%M",
+    "%Y-%m-%d",
+    "%Y-%m-%d %H:%M:%S",
+    "%d-%m-%Y",
+    "%d.%m.%Y",
+    "%m/%d/%Y",
+    "%m/%d/%Y %H:%M:%S",
+)
+# Ngày viết dạng số với ngày/tháng đứng đầu (d/m/y hoặc m/d/y): dùng để kiểm tra pandas có tự đảo ngày-tháng không
+RE_NUMERIC_DATE = re.compile(r"^(\d{1,2})[/.-](\d{1,2})[/.-]\d{2,4}\b")
+DATE_SAMPLE = 500  # số chuỗi khác nhau dùng để đoán định dạng chủ đạo
+# Cột dẫn xuất từ ngày (tên cột -> thuộc tính của DatetimeIndex)
+DATE_PARTS = {"Năm": "year", "Tháng": "month", "Quý": "quarter", "Tuần": "week"}
+
+
+def detect_date_format(values, formats=DATE_FORMATS, sample=DATE_SAMPLE):
+    """Định dạng đọc được nhiều giá trị nhất trong mẫu (None nếu không định dạng nào đọc được)."""
+    values = pd.Index(values[:sample])
+    best, best_count = None, 0
+    for fmt in formats:
+        count = int(pd.to_datetime(values, format=fmt, errors="coerce").notna().sum())
+        if count > best_count:
+            best, best_count = fmt, count
+            if count == len(values):
+                break
+    return best
+
+
+def _fallback_formats(fmt, formats):
+    # Không thử thứ tự ngày/tháng ngược với định dạng chủ đạo: "13/25/2023" là lỗi, không phải tháng 25 kiểu Mỹ
+    opposite = {"%d": "%m", "%m": "%d"}.get(fmt[:2]) if fmt else None
+    return [f for f in formats if f != fmt and f[:2] != opposite]
+
+
+def _parse_uniques(uniques, formats, fmt=None):
+    """
+    (ngày của từng giá trị khác nhau, định dạng chủ đạo, vị trí các giá trị không đọc được).
+    fmt: định dạng chủ đạo đã biết (vd đoán từ khối đầu của file, hoặc của bảng cũ khi nạp tăng dần), không đoán lại.
+    """
+    if isinstance(uniques, pd.DatetimeIndex):
+        return uniques.tz_localize(None) if uniques.tz is not None else uniques, None, []
+    values = np.asarray(uniques, dtype=object)
+    result = np.full(len(values), np.datetime64("NaT"), dtype="datetime64[ns]")
+    is_str = np.fromiter((isinstance(v, str) for v in values), dtype=bool, count=len(values))
+    is_date = np.fromiter(
+        (isinstance(v, (datetime.date, np.datetime64)) for v in values), dtype=bool, count=len(values)
+    )
+    if is_date.any():
+        # Ô ngày của Excel đã là Timestamp/datetime
+        result[is_date] = pd.to_datetime(pd.Index(values[is_date]), errors="coerce").to_numpy(dtype="datetime64[ns]")
+    invalid = list(np.flatnonzero(~is_str & ~is_date & ~pd.isna(values)))
+
+    positions = np.flatnonzero(is_str)
+    text = pd.Index(values[positions]).str.strip()
+    keep = text != ""
+    positions, text = positions[keep], text[keep]
+    if fmt is None:
+        fmt = detect_date_format(text, formats)
+    for f in ([fmt] if fmt else []) + _fallback_formats(fmt, formats):
+        if not len(text):
+            break
+        parsed = pd.to_datetime(text, format=f, errors="coerce")
+        ok = parsed.notna()
+        result[positions[ok]] = parsed[ok].to_numpy(dtype="datetime64[ns]")
+        positions, text = positions[~ok], text[~ok]
+    dayfirst = not (fmt or "").startswith("%m")
+    for pos, value in zip(positions, text):
+        # Còn sót vài giá trị định dạng lạ: để pandas tự đoán từng giá trị theo cùng thứ tự ngày/tháng với định dạng
+        # chủ đạo. dayfirst chỉ là ưu tiên ("12/25/2023" vẫn đọc được thành tháng trước): bị đảo thì coi là lỗi
+        parsed = pd.to_datetime(value, dayfirst=dayfirst, errors="coerce")
+        numeric = RE_NUMERIC_DATE.match(value)
+        if numeric and not pd.isna(parsed):
+            first = parsed.day if dayfirst else parsed.month
+            if first != int(numeric.group(1)):
+                parsed = pd.NaT
+        if pd.isna(parsed):
+            invalid.append(pos)
+        else:
+            result[pos] = np.datetime64(parsed.tz_localize(None) if parsed.tz is not None else parsed, "ns")
+    return pd.DatetimeIndex(result), fmt, invalid
+
+
+class ParsedDates:
+    """
+    Một cột ngày đã parse, lưu dạng (mã từng dòng, ngày của từng giá trị khác nhau):
+    values() trả cột datetime64, part("Năm"/"Tháng"/"Quý"/"Tuần") tính trên giá trị khác nhau rồi ánh xạ về dòng.
+    invalid: các giá trị không đọc được kèm số dòng (nhiều nhất trước), format: định dạng chủ đạo.
+    """
+    def __init__(self, series, formats=DATE_FORMATS, fmt=None):
+        self.index = series.index
+        self.name = series.name
+        self.codes, uniques = pd.factorize(series)
+        self.uniques, self.format, invalid = _parse_uniques(uniques, formats, fmt)
+        invalid = np.asarray(sorted(invalid), dtype="int64")
+        counts = np.bincount(self.codes[self.codes >= 0], minlength=len(uniques))
+        self.invalid = pd.Series(
+            counts[invalid], index=pd.Index(np.asarray(uniques, dtype=object)[invalid], dtype=object),
+            dtype="int64", name="Số dòng",
+        ).sort_values(ascending=False, kind="stable")
+
+    def _take(self, values, fill):
+        # Mã -1 (ô trống) lấy phần tử cuối là giá trị rỗng
+        return np.append(values, np.asarray([fill], dtype=values.dtype))[self.codes]
+
+    def values(self):
+        return pd.Series(self._take(self.uniques.to_numpy(dtype="datetime64[ns]"), np.datetime64("NaT")),
+                         index=self.index, name=self.name)
+
+    def part(self, name, dtype="Int16"):
+        attr = DATE_PARTS[name]
+        if attr == "week":
+            values = self.uniques.isocalendar().week.to_numpy(dtype="float64", na_value=np.nan)
+        else:
+            values = np.asarray(getattr(self.uniques, attr), dtype="float64")
+        return pd.Series(pd.array(self._take(values, np.nan), dtype=dtype), index=self.index, name=name)
+
+
+def parse_dates(series, formats=DATE_FORMATS, fmt=None):
+    return ParsedDates(series if isinstance(series, pd.Series) else pd.Series(series), formats, fmt)
+
+
+def as_datetime(series):
+    """Cột datetime64 (không parse lại nếu đã là ngày)."""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+    return parse_dates(series).values()
+
+
+DATE_ISSUES_LIMIT = 100  # số giá trị lỗi tối đa giữ cho mỗi cột
+
+
+def report_invalid_dates(df, col, parsed, limit=5):
+    """
+    Ghi các giá trị ngày không đọc được vào df.attrs["date_issues"] ({cột: {giá trị: số dòng}})
+    và in cảnh báo thay vì im lặng thành NaT. Dùng dict thường: pandas so sánh/copy attrs khi nối bảng.
+    """
+    if not len(parsed.invalid):
+        return
+    issues = df.attrs.setdefault("date_issues", {})
+    issues[col] = merge_invalid([issues.get(col), parsed.invalid.to_dict()])
+    examples = ", ".join(repr(v) for v in parsed.invalid.index[:limit])
+    print(f"⚠️ {int(parsed.invalid.sum())} ô ở cột {col} không đọc được ngày, vd: {examples}")
+
+
+def merge_invalid(parts):
+    """Gộp các bảng giá trị lỗi (vd của từng khối khi đọc theo khối): cộng số dòng theo giá trị."""
+    merged = {}
+    for part in parts:
+        for value, count in (part or {}).items():
+            merged[value] = merged.get(value, 0) + int(count)
+    top = sorted(merged.items(), key=lambda item: -item[1])[:DATE_ISSUES_LIMIT]
+    return dict(top)
+
+
+def merge_date_issues(frames):
+    """date_issues của nhiều bảng (các khối của cùng một file, các file chi nhánh) gộp theo cột."""
+    issues = {}
+    for frame in frames:
+        for col, invalid in frame.attrs.get("date_issues", {}).items():
+            issues[col] = merge_invalid([issues.get(col), invalid])
+    return issues
@@ -0,0 +1,169 @@
+import numpy as np
+import pandas as pd
+
+from rma_utils import clean_text, clean_text_many, get_schema
+
+# === Nhận diện tên khách hàng / sản phẩm / KTV trong câu hỏi: bỏ dấu, chịu sai chính tả ===
+ENTITY_FIELDS = {"customer": "Tên khách hàng", "product": "Sản phẩm", "ktv": "Kỹ thuật viên"}
+ENTITY_LABELS = {"customer": "khách hàng", "product": "sản phẩm", "ktv": "kỹ thuật viên"}
+MIN_SCORE = 0.5  # điểm tối thiểu khi chỉ khớp gần đúng (không chứa trọn từ khoá)
+MENTION_SCORE = 0.75  # điểm tối thiểu để coi một cụm từ trong câu hỏi là tên
+MENTION_MAX_WORDS = 6
+# Từ thường gặp trong câu hỏi (đã bỏ dấu): cụm chỉ gồm các từ này không phải tên
+QUESTION_WORDS = {
+    "khach", "hang", "san", "pham", "gui", "nhieu", "nhat", "nao", "gi", "bao", "ai", "cua", "trong", "nam",
+    "thang", "quy", "ktv", "ky", "thuat", "vien", "loi", "sua", "xong", "duoc", "co", "la", "va", "cac", "nhung",
+    "top", "so", "luong", "lan", "may", "bi", "hu", "da", "nhan", "tra", "cho", "voi", "theo", "tong", "cong",
+}
+
+
+def _trigrams(key):
+    """Trigram của từng từ, đệm 2 khoảng trắng đầu và 1 cuối (như pg_trgm) để từ 1-2 ký tự cũng có trigram."""
+    grams = set()
+    for word in key.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class EntityIndex:
+    """
+    Chỉ mục trigram trên các giá trị khác nhau của một cột (khoá = clean_text, đã bỏ dấu).
+    resolve() chấm điểm mọi giá trị bằng một lần bincount trên danh sách trigram của từ khoá:
+    khớp hoàn toàn > chứa trọn từ khoá > gần đúng (hệ số Dice trên tập trigram).
+    """
+    def __init__(self, series):
+        codes, uniques = pd.factorize(series)
+        self.values = [str(v) for v in uniques]
+        self.keys = clean_text_many(self.values)
+        self.counts = np.bincount(codes[codes >= 0], minlength=len(self.values))
+        grams = [_trigrams(key) for key in self.keys]
+        self.sizes = np.fromiter((len(g) for g in grams), dtype=np.float64, count=len(grams))
+        self.lengths = np.fromiter((len(k) for k in self.keys), dtype=np.int64, count=len(self.keys))
+        postings = {}
+        for i, gs in enumerate(grams):
+            for g in gs:
+                postings.setdefault(g, []).append(i)
+        self.postings = {g: np.asarray(ids, dtype=np.int32) for g, ids in postings.items()}
+
+    def _scores(self, key):
+        grams = _trigrams(key)
+        lists = [self.postings[g] for g in grams if g in self.postings]
+        if not lists:
+            return None, None
+        shared = np.bincount(np.concatenate(lists), minlength=len(self.values))
+        return shared, 2 * shared / (len(grams) + self.sizes)
+
+    def resolve(self, text, limit=5, min_score=MIN_SCORE):
+        """
+        [(giá trị, điểm, số dòng)] xếp hạng; điểm 1 = khớp hoàn toàn (sau khi bỏ dấu), 0.9 = chứa trọn
+        từ khoá theo ranh giới từ, 0.8 = chứa ở giữa từ; cùng điểm thì giá trị nhiều dòng hơn, ngắn hơn trước.
+        """
+        key = clean_text(text)
+        if not key:
+            return []
+        shared, scores = self._scores(key)
+        if scores is None:
+            return []
+        n_grams = len(_trigrams(key))
+        # Có đủ mọi trigram của từ khoá thì mới có thể chứa trọn từ khoá: chỉ kiểm tra chuỗi con trên các giá trị này
+        bounded = f" {key} "
+        for i in np.flatnonzero(shared == n_grams):
+            value_key = self.keys[i]
+            if value_key == key:
+                scores[i] = 1.0
+            elif bounded in f" {value_key} ":
+                scores[i] = max(scores[i], 0.9)
+            elif key in value_key:
+                scores[i] = max(scores[i], 0.8)
+        candidates = np.flatnonzero(scores >= min_score)
+        order = np.lexsort((self.lengths[candidates], -self.counts[candidates], -scores[candidates]))
+        ranked = candidates[order[:limit]]
+        return [(self.values[i], round(float(scores[i]), 3), int(self.counts[i])) for i in ranked]
+
+    def contains(self, text):
+        """Mọi giá trị có khoá chứa từ khoá đã bỏ dấu (cùng ngữ nghĩa str.contains nhưng không phân biệt dấu)."""
+        key = clean_text(text)
+        if not key:
+            return []
+        shared, _ = self._scores(key)
+        if shared is None:
+            return []
+        n_grams = len(_trigrams(key))
+        return [self.values[i] for i in np.flatnonzero(shared == n_grams) if key in self.keys[i]]
+
+
+class EntityResolver:
+    """
+    Chỉ mục tên cho một phiên bản dữ liệu (dựng một lần, dùng chung): khách hàng, sản phẩm, KTV.
+    - resolve(kind, text): gợi ý xếp hạng
+    - values(kind, text): các giá trị chính xác dùng để lọc (chứa từ khoá, không thì giá trị gần nhất)
+    - mentions(question): các tên nhận ra trong câu hỏi tự do
+    """
+    def __init__(self, df, schema=None):
+        schema = schema or get_schema(df.columns)
+        self.indexes = {}
+        for kind, field in ENTITY_FIELDS.items():
+            col = schema[field]
+            if col:
+                self.indexes[kind] = EntityIndex(df[col])
+
+    def resolve(self, kind, text, limit=5, min_score=MIN_SCORE):
+        index = self.indexes.get(kind)
+        return index.resolve(text, limit=limit, min_score=min_score) if index and text else []
+
+    def values(self, kind, text, fuzzy=True):
+        index = self.indexes.get(kind)
+        if index is None or not text:
+            return []
+        contained = index.contains(text)
+        if contained or not fuzzy:
+            return contained
+        best = index.resolve(text, limit=1)
+        return [best[0][0]] if best else []
+
+    def mentions(self, question, kinds=None, min_score=MENTION_SCORE):
+        """
+        {loại: [giá trị]} nhận ra trong câu hỏi: xét các cụm tối đa MENTION_MAX_WORDS từ liên tiếp,
+        cụm dài trước, cụm đã nhận thì không xét các cụm chồng lên nó.
+        """
+        words = clean_text(question).split()
+        taken = np.zeros(len(words), dtype=bool)
+        found = {}
+        for size in range(min(MENTION_MAX_WORDS, len(words)), 0, -1):
+            for start in range(len(words) - size + 1):
+                if taken[start:start + size].any():
+                    continue
+                window = words[start:start + size]
+                phrase = " ".join(window)
+                if len(phrase) < 3 or all(word in QUESTION_WORDS for word in window):
+                    continue
+                best = None
+                for kind in kinds or self.indexes:
+                    match = self.resolve(kind, phrase, limit=1, min_score=min_score)
+                    if match and (best is None or match[0][1] > best[1][1]):
+                        best = (kind, match[0])
+                if best:
+                    kind, (value, score, _) = best
+                    if size == 1 and score < 0.9:
+                        continue  # một từ chỉ khớp gần đúng/giữa chừng thường là từ thông dụng, không phải tên
+                    found.setdefault(kind, [])
+                    if value not in found[kind]:
+                        found[kind].append(value)
+                    taken[start:start + size] = True
+        return found
+
+    def filter_frame(self, df, matched):
+        """Các dòng của df có giá trị đúng bằng tên đã nhận (mọi loại cùng thoả)."""
+        schema = get_schema(df.columns)
+        mask = np.ones(len(df), dtype=bool)
+        for kind, values in matched.items():
+            col = schema[ENTITY_FIELDS[kind]]
+            if col and values:
+                mask &= df[col].isin(values).to_numpy()
+        return df if mask.all() else df[mask]
+
+
+def describe_matches(matched):
+    """Chuỗi "khách hàng: A, B; sản phẩm: C" để ghi vào prompt."""
+    return "; ".join(f"{ENTITY_LABELS[kind]}: {', '.join(values)}" for kind, values in matched.items() if values)
@@ -0,0 +1,168 @@
+import hashlib
+import io
+import os
+import re
+import threading
+import zipfile
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# === Xuất file (Excel/CSV/Parquet): chỉ tạo khi bấm tải, cache theo (báo cáo, bộ lọc, phiên bản dữ liệu) ===
+EXPORT_CACHE_MB = int(os.getenv("RMA_EXPORT_CACHE_MB", "256"))
+CONSTANT_MEMORY_ROWS = int(os.getenv("RMA_EXPORT_CONSTANT_MEMORY_ROWS", "50000"))  # từ ngưỡng này ghi Excel từng dòng
+EXCEL_MAX_ROWS = 1_048_575  # giới hạn dòng của một sheet Excel (trừ dòng tiêu đề)
+
+EXCEL_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+EXPORT_FORMATS = {
+    "xlsx": ("Excel", EXCEL_MIME),
+    "csv": ("CSV", "text/csv"),
+    "parquet": ("Parquet", "application/vnd.apache.parquet"),
+}
+_EXCEL_SHEET_INVALID = re.compile(r'[\[\]:*?/\\]')
+# Cùng kiểu tiêu đề với DataFrame.to_excel
+_HEADER_FORMAT = {"bold": True, "border": 1, "align": "center", "valign": "top"}
+
+
+def parquet_available():
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def filter_fingerprint(*parts):
+    """Dấu vân tay ngắn của bộ lọc: mảng vị trí dòng, tham số báo cáo... (None = không lọc)."""
+    digest = hashlib.blake2b(digest_size=12)
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            digest.update(np.ascontiguousarray(part).tobytes())
+        else:
+            digest.update(repr(part).encode("utf-8"))
+        digest.update(b"\x1f")
+    return digest.hexdigest()
+
+
+class ExportCache:
+    """LRU trong bộ nhớ cho file đã tạo, dùng chung mọi phiên; giới hạn theo tổng dung lượng."""
+    def __init__(self, max_bytes=EXPORT_CACHE_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key, builder):
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key]
+        payload = builder()
+        if len(payload) > self.max_bytes:
+            return payload
+        with self._lock:
+            if key not in self._items:
+                self._items[key] = payload
+                self._size += len(payload)
+            while self._size > self.max_bytes:
+                _, old = self._items.popitem(last=False)
+                self._size -= len(old)
+        return payload
+
+
+_cache = ExportCache()
+
+
+# === Tạo nội dung file ===
+def excel_sheet_name(name, used=()):
+    """Tên sheet hợp lệ cho Excel (tối đa 31 ký tự, bỏ ký tự cấm), không trùng với used."""
+    base = _EXCEL_SHEET_INVALID.sub(" ", str(name)).strip()[:31] or "Sheet"
+    candidate, i = base, 2
+    while candidate.lower() in {u.lower() for u in used}:
+        suffix = f" ({i})"
+        candidate, i = base[:31 - len(suffix)] + suffix, i + 1
+    return candidate
+
+
+def _cell_values(series):
+    # Giá trị Python cho xlsxwriter: ô trống là None, ngày giờ là datetime
+    if pd.api.types.is_datetime64_any_dtype(series):
+        values = series.dt.tz_localize(None) if series.dt.tz is not None else series
+        values = values.astype(object)
+    else:
+        values = series.astype(object)
+    return values.where(series.notna(), None).tolist()
+
+
+def _write_sheet_rows(workbook, name, df):
+    worksheet = workbook.add_worksheet(name)
+    header = workbook.add_format(_HEADER_FORMAT)
+    worksheet.write_row(0, 0, [str(col) for col in df.columns], header)
+    columns = [_cell_values(df[col]) for col in df.columns]
+    for r, row in enumerate(zip(*columns), start=1):
+        worksheet.write_row(r, 0, row)
+
+
+def excel_bytes(sheets):
+    """
+    Ghi nhiều bảng vào một file Excel; sheets: dict tên sheet -> DataFrame.
+    Bảng lớn ghi từng dòng ở chế độ constant_memory của xlsxwriter (to_excel ghi theo cột nên không dùng được).
+    """
+    buffer = io.BytesIO()
+    used = []
+    if sum(len(df) for df in sheets.values()) < CONSTANT_MEMORY_ROWS:
+        with pd.ExcelWriter(buffer, engine="xlsxwriter") as writer:
+            for name, df in sheets.items():
+                used.append(excel_sheet_name(name, used))
+                df.to_excel(writer, index=False, sheet_name=used[-1])
+        return buffer.getvalue()
+
+    import xlsxwriter
+    workbook = xlsxwriter.Workbook(buffer, {
+        "constant_memory": True,
+        "default_date_format": "yyyy-mm-dd hh:mm:ss",
+        "nan_inf_to_errors": True,
+    })
+    for name, df in sheets.items():
+        used.append(excel_sheet_name(name, used))
+        _write_sheet_rows(workbook, used[-1], df)
+    workbook.close()
+    return buffer.getvalue()
+
+
+def _table_bytes(df, fmt):
+    if fmt == "csv":
+        # BOM để Excel mở đúng tiếng Việt
+        return df.to_csv(index=False).encode("utf-8-sig")
+    buffer = io.BytesIO()
+    try:
+        df.to_parquet(buffer, index=False)
+    except (TypeError, ValueError):
+        # Cột object lẫn kiểu (số + chữ) không ghi được: chuyển thành chuỗi
+        mixed = {col: "str" for col in df.columns if df[col].dtype == object}
+        buffer = io.BytesIO()
+        df.astype(mixed).to_parquet(buffer, index=False)
+    return buffer.getvalue()
+
+
+def export_bytes(sheets, fmt):
+    """Nội dung file theo định dạng; CSV/Parquet nhiều bảng thì gói zip, mỗi bảng một file."""
+    if fmt == "xlsx":
+        return excel_bytes(sheets)
+    if len(sheets) == 1:
+        return _table_bytes(next(iter(sheets.values())), fmt)
+    buffer = io.BytesIO()
+    used = []
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, df in sheets.items():
+            used.append(excel_sheet_name(name, used))
+            archive.writestr(f"{used[-1]}.{fmt}", _table_bytes(df, fmt))
+    return buffer.getvalue()
+
+
+def cached_export_bytes(sheets, fmt, cache_key=None):
+    """export_bytes qua cache dùng chung; cache_key=None thì luôn tạo mới."""
+    if cache_key is None:
+        return export_bytes(sheets, fmt)
+    return _cache.get_or_build((cache_key, fmt), lambda: export_bytes(sheets, fmt))
@@ -0,0 +1,135 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from rma_dates import as_datetime
+from rma_utils import date_range_bounds, get_schema, is_date_range
+
+# Cột thời gian dẫn xuất do ensure_time_columns tạo
+TIME_FILTERS = (("years", "Năm"), ("months", "Tháng"), ("quarters", "Quý"))
+
+
+class DateIndex:
+    """
+    Ngày tiếp nhận đã sắp xếp sẵn kèm vị trí dòng tương ứng (bỏ dòng không có ngày).
+    Khoảng [start, end] tra bằng searchsorted thay vì so sánh cả cột.
+    """
+    def __init__(self, dates):
+        values = as_datetime(pd.Series(dates)).to_numpy(dtype="datetime64[ns]")
+        valid = np.flatnonzero(~np.isnat(values))
+        order = np.argsort(values[valid], kind="stable")
+        self.positions = valid[order]
+        self.sorted = values[valid][order]
+        self.min = pd.Timestamp(self.sorted[0]) if len(self.sorted) else None
+        self.max = pd.Timestamp(self.sorted[-1]) if len(self.sorted) else None
+
+    def range_positions(self, start, end):
+        # Cùng ngữ nghĩa với time_filter_mask: start <= col < stop (ngày kết thúc tính trọn ngày)
+        start, stop = date_range_bounds(start, end)
+        lo = np.searchsorted(self.sorted, np.datetime64(start, "ns"), side="left")
+        hi = np.searchsorted(self.sorted, np.datetime64(stop, "ns"), side="left")
+        return self.positions[lo:hi]
+
+    def range_mask(self, start, end, n_rows):
+        mask = np.zeros(n_rows, dtype=bool)
+        mask[self.range_positions(start, end)] = True
+        return mask
+
+
+class FilterEngine:
+    """
+    Bộ lọc không copy cho một bảng dữ liệu (dùng chung giữa các phiên, chỉ đọc):
+    - mỗi cột được factorize một lần, isin/contains tính trên giá trị khác nhau rồi ánh xạ qua mã
+    - các điều kiện gộp thành một mask bool, kết quả là mảng vị trí dòng
+    - chỉ tạo DataFrame (take) khi cần hiển thị hoặc tính toán
+    """
+    def __init__(self, df, schema=None):
+        self.df = df
+        self.n_rows = len(df)
+        self.schema = schema or get_schema(df.columns)
+        self._codes = {}
+        self._date_index = None
+        self._lock = threading.Lock()
+
+    def codes(self, col):
+        entry = self._codes.get(col)
+        if entry is None:
+            with self._lock:
+                entry = self._codes.get(col)
+                if entry is None:
+                    codes, uniques = pd.factorize(self.df[col])
+                    entry = self._codes[col] = (codes, pd.Index(uniques))
+        return entry
+
+    @property
+    def date_index(self):
+        if self._date_index is None:
+            col_date = self.schema.find("ngày tiếp nhận")
+            if col_date is None:
+                return None
+            with self._lock:
+                if self._date_index is None:
+                    self._date_index = DateIndex(self.df[col_date])
+        return self._date_index
+
+    def _lookup(self, col, hits):
+        codes, _ = self.codes(col)
+        # Mã -1 (NaN) trỏ vào phần tử cuối = False
+        return np.append(hits, False)[codes]
+
+    def isin_mask(self, col, values):
+        _, uniques = self.codes(col)
+        return self._lookup(col, np.asarray(uniques.isin(list(values)), dtype=bool))
+
+    def contains_mask(self, col, keyword):
+        """Như astype(str).str.lower().str.contains(keyword, na=False) nhưng chỉ xét mỗi giá trị một lần."""
+        keyword = keyword.lower()
+        _, uniques = self.codes(col)
+        hits = np.fromiter((keyword in str(v).lower() for v in uniques), dtype=bool, count=len(uniques))
+        # Ô trống không bao giờ khớp (na=False)
+        return self._lookup(col, hits)
+
+    def date_mask(self, start, end):
+        index = self.date_index
+        if index is None:
+            return np.ones(self.n_rows, dtype=bool)
+        return index.range_mask(start, end, self.n_rows)
+
+    def mask(self, years=None, months=None, quarters=None, date_range=None, isin=None, contains=None):
+        """
+        Gộp mọi điều kiện thành một mask:
+        years/months/quarters/date_range như bộ lọc sidebar, isin={cột: giá trị}, contains={cột: từ khoá}.
+        """
+        mask = np.ones(self.n_rows, dtype=bool)
+        selected = {"years": years, "months": months, "quarters": quarters}
+        for name, col in TIME_FILTERS:
+            if selected[name] and col in self.df.columns:
+                mask &= self.isin_mask(col, selected[name])
+        if is_date_range(date_range):
+            mask &= self.date_mask(*date_range)
+        for col, values in (isin or {}).items():
+            if values:
+                mask &= self.isin_mask(col, values)
+        for col, keyword in (contains or {}).items():
+            if keyword:
+                mask &= self.contains_mask(col, keyword)
+        return mask
+
+    def positions(self, rows=None, **predicates):
+        """Vị trí các dòng thoả điều kiện; rows: chỉ lọc tiếp trong các vị trí này."""
+        mask = self.mask(**predicates)
+        if rows is None:
+            return np.flatnonzero(mask)
+        return rows[mask[rows]]
+
+    def unique(self, col, rows=None):
+        """Giá trị khác nhau (bỏ NaN, theo thứ tự xuất hiện) trong các dòng rows."""
+        codes, uniques = self.codes(col)
+        present = pd.unique(codes if rows is None else codes[rows])
+        return uniques[present[present >= 0]].tolist()
+
+    def take(self, rows=None):
+        if rows is None or len(rows) == self.n_rows:
+            return self.df
+        return self.df.take(rows)
@@ -0,0 +1,170 @@
+import hashlib
+import io
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from rma_dates import as_datetime, merge_date_issues
+from rma_utils import (COLUMN_MAPPING, SchemaResolver, compact_dtypes, csv_dtypes, ensure_time_columns,
+                       ensure_turnaround_column, get_schema)
+
+# === Gộp nhiều file Excel/CSV của các chi nhánh thành một bảng, đọc song song bằng nhiều process ===
+SOURCE_COL = "Nguồn file"
+FILE_EXTENSIONS = (".xlsx", ".xlsm", ".xls", ".csv")
+TIME_FIELDS = ("Năm", "Tháng", "Quý")  # tính lại từ ngày tiếp nhận, không lấy theo tên cột của file
+INGEST_WORKERS = int(os.getenv("RMA_INGEST_WORKERS", "0")) or None  # None = số CPU
+
+
+def list_sources(directory):
+    """Các file dữ liệu trong thư mục (sắp theo tên, bỏ file khoá ~$ của Excel)."""
+    names = sorted(
+        name for name in os.listdir(directory)
+        if name.lower().endswith(FILE_EXTENSIONS) and not name.startswith(("~$", "."))
+    )
+    return [os.path.join(directory, name) for name in names]
+
+
+def sources_version(sources):
+    """
+    Phiên bản của cả bộ file: theo tên, kích thước, thời điểm sửa (file trên đĩa)
+    hoặc nội dung (file tải lên dạng (tên, bytes)); không cần đọc lại file để biết có đổi hay không.
+    """
+    h = hashlib.sha256()
+    for source in sources:
+        if isinstance(source, str):
+            stat = os.stat(source)
+            h.update(json.dumps([os.path.basename(source), stat.st_size, stat.st_mtime_ns]).encode("utf-8"))
+        else:
+            name, content = source
+            h.update(name.encode("utf-8"))
+            h.update(hashlib.sha256(content).digest())
+    return h.hexdigest()[:16]
+
+
+def canonical_columns(columns, column_mapping=COLUMN_MAPPING):
+    """
+    Tên cột của file -> tên chuẩn trong COLUMN_MAPPING (theo alias, như SchemaResolver);
+    cột không nhận ra giữ tên gốc, mỗi cột chỉ được gán cho một tên chuẩn.
+    """
+    resolver = SchemaResolver(columns, column_mapping)
+    rename = {}
+    for field, col in resolver.fields.items():
+        if col is None or field in TIME_FIELDS or col in rename or field in columns and field != col:
+            continue
+        rename[col] = field
+    return rename
+
+
+def _read_frame(name, source):
+    handle = source if isinstance(source, str) else io.BytesIO(source)
+    if name.lower().endswith(".csv"):
+        columns = pd.read_csv(handle, nrows=0, encoding="utf-8-sig").columns
+        if not isinstance(source, str):
+            handle.seek(0)
+        return pd.read_csv(handle, dtype=csv_dtypes(columns), encoding="utf-8-sig")
+    return pd.read_excel(handle, sheet_name=0)
+
+
+def read_source(source):
+    """
+    Đọc một file (đường dẫn hoặc (tên, bytes)) về cột chuẩn, gắn tên file vào SOURCE_COL
+    và parse sẵn các cột ngày — phần tốn thời gian nhất, chạy trong process con.
+    """
+    name, content = (os.path.basename(source), source) if isinstance(source, str) else source
+    df = _read_frame(name, content)
+    df.columns = [str(col).strip() for col in df.columns]
+    df = df.dropna(how="all")
+    df = df.rename(columns=canonical_columns(df.columns))
+    if SOURCE_COL in df.columns:
+        df[SOURCE_COL] = df[SOURCE_COL].fillna(name)
+    else:
+        df[SOURCE_COL] = name
+    col_serial = get_schema(df.columns).find("serial")
+    if col_serial:
+        # Serial là mã định danh: file này đọc ra số, file kia ra chuỗi, thống nhất về chuỗi để so trùng
+        serial = df[col_serial]
+        text = serial.astype(str).str.strip()
+        if not pd.api.types.is_string_dtype(serial):
+            text = text.str.removesuffix(".0")  # ô số trong Excel đọc ra float
+        df[col_serial] = text.where(serial.notna())
+    return ensure_turnaround_column(ensure_time_columns(df))
+
+
+def _read_source_safe(source):
+    try:
+        return read_source(source), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def _source_name(source):
+    return os.path.basename(source) if isinstance(source, str) else source[0]
+
+
+def drop_duplicate_rows(df, schema=None):
+    """
+    Bỏ dòng trùng (cùng serial và ngày tiếp nhận) giữa các file, giữ dòng của file sau
+    (file sắp sau theo tên thường là bản cập nhật). Dòng không có serial luôn được giữ.
+    Trả về (bảng, số dòng bị bỏ theo từng file).
+    """
+    schema = schema or get_schema(df.columns)
+    col_serial = schema.find("serial")
+    col_date = schema.find("ngay tiep nhan")
+    if not col_serial or not col_date:
+        return df, {}
+    keys = pd.DataFrame({
+        "serial": df[col_serial].astype("string").str.upper(),
+        "date": df[col_date],
+    })
+    duplicated = keys.duplicated(keep="last") & keys["serial"].notna().to_numpy()
+    if not duplicated.any():
+        return df, {}
+    dropped = df.loc[duplicated, SOURCE_COL].value_counts().to_dict()
+    return df.loc[~duplicated].reset_index(drop=True), dropped
+
+
+def ingest_files(sources, workers=INGEST_WORKERS):
+    """
+    Đọc song song các file (đường dẫn hoặc (tên, bytes)), gộp về cột chuẩn, bỏ dòng trùng.
+    Trả về (bảng, báo cáo từng file: số dòng đọc được, số dòng trùng bị bỏ, lỗi).
+    File lỗi được bỏ qua và ghi vào báo cáo; không đọc được file nào thì ném lỗi.
+    """
+    sources = list(sources)
+    workers = min(workers or os.cpu_count() or 1, len(sources))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_read_source_safe, sources))
+    else:
+        results = [_read_source_safe(source) for source in sources]
+
+    frames, report = [], []
+    for source, (df, error) in zip(sources, results):
+        report.append({SOURCE_COL: _source_name(source), "Số dòng": 0 if df is None else len(df), "Lỗi": error})
+        if error:
+            print(f"⚠️ Không đọc được {_source_name(source)}:", error)
+        elif len(df):
+            frames.append(df)
+    if not frames:
+        raise ValueError("Không đọc được dữ liệu từ file nào")
+
+    # Cột chuẩn theo thứ tự COLUMN_MAPPING trước, cột riêng của từng file nối sau
+    columns = list(dict.fromkeys(col for frame in frames for col in frame.columns))
+    order = [field for field in COLUMN_MAPPING if field in columns]
+    order += [col for col in columns if col not in order]
+    df = pd.concat(frames, ignore_index=True)[order]
+    df.attrs["date_issues"] = merge_date_issues(frames)
+
+    schema = get_schema(df.columns)
+    for keyword in ("ngay tiep nhan", "ngay tra khach"):
+        # File thiếu cột ngày làm cột sau khi gộp thành object: ép lại (giá trị đã là Timestamp, không parse chuỗi)
+        col = schema.find(keyword)
+        if col:
+            df[col] = as_datetime(df[col])
+    df, dropped = drop_duplicate_rows(df, schema)
+    for row in report:
+        row["Trùng bị bỏ"] = dropped.get(row[SOURCE_COL], 0)
+    # Ngày đã parse trong process con, ở đây chỉ tính lại số ngày xử lý cho bảng đã gộp
+    df = compact_dtypes(ensure_turnaround_column(df, schema), schema)
+    return df, pd.DataFrame(report)[[SOURCE_COL, "Số dòng", "Trùng bị bỏ", "Lỗi"]]
@@ -0,0 +1,646 @@
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+import weakref
+
+import numpy as np
+import pandas as pd
+import requests
+
+from rma_cube import update_cube
+from rma_dates import merge_date_issues
+from rma_ingest import ingest_files, list_sources, sources_version
+from rma_snapshot import SNAPSHOT_DIR, append_snapshot, read_manifest, read_snapshot, write_snapshot
+from rma_utils import (align_dtypes, compact_dtypes, concat_frames, csv_dtypes, ensure_time_columns,
+                       ensure_turnaround_column, get_schema)
+
+# === Cấu hình tải dữ liệu ===
+# URL Google Sheet (export CSV) hoặc đường dẫn thư mục chứa file Excel/CSV của các chi nhánh
+SHEET_URL = os.getenv(
+    "RMA_SHEET_URL",
+    "https://docs.google.com/spreadsheets/d/1fWFLZWyCAXn_B8jcZ0oY4KhJ8krbLPsH/export?format=csv",
+)
+CACHE_DIR = os.getenv("RMA_CACHE_DIR", ".rma_cache")
+SHEET_TTL = int(os.getenv("RMA_SHEET_TTL", "300"))  # giây giữa 2 lần kiểm tra lại sheet
+FETCH_RETRIES = 3
+FETCH_BACKOFF = 0.5  # giây, nhân đôi sau mỗi lần thử lại
+FETCH_TIMEOUT = 30
+DELTA_MAX_RATIO = float(os.getenv("RMA_DELTA_MAX_RATIO", "0.2"))  # sửa quá tỉ lệ dòng này thì parse lại toàn bộ
+CSV_ENGINE = os.getenv("RMA_CSV_ENGINE", "c")  # "pyarrow": đọc đa luồng bằng Arrow (nếu đã cài pyarrow)
+CSV_CHUNK_BYTES = int(os.getenv("RMA_CSV_CHUNK_MB", "256")) * 2**20  # file lớn hơn thì đọc theo khối
+CSV_CHUNK_ROWS = 200_000
+
+# Trạng thái dùng chung cho cả process: url -> thông tin lần tải gần nhất
+_state = {}
+_lock = threading.Lock()  # chỉ giữ khi đọc/ghi _state, không giữ trong lúc tải
+_refresh_locks = {}  # nguồn -> khoá của lượt làm mới đang chạy
+
+
+def content_version(content):
+    return hashlib.sha256(content).hexdigest()[:16]
+
+
+def _csv_engine(engine):
+    if engine == "pyarrow":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            return "c"
+    return engine
+
+
+def _prepare_frame(df, date_format=None):
+    df.columns = [col.strip() for col in df.columns]
+    return ensure_turnaround_column(ensure_time_columns(df, date_format))
+
+
+def read_csv_bytes(content, engine=None, chunk_bytes=CSV_CHUNK_BYTES):
+    """
+    Đọc CSV thẳng từ bytes (BytesIO dùng chung bộ đệm, không decode ra str) với dtype khai báo trước (csv_dtypes).
+    File lớn hơn chunk_bytes đọc theo khối CSV_CHUNK_ROWS dòng, mỗi khối parse ngày xong mới nối
+    nên không giữ cả cột ngày dạng chuỗi của toàn bộ file; định dạng ngày đoán một lần ở khối đầu
+    rồi dùng cho mọi khối (không để hai khối đọc cùng một chuỗi thành hai ngày khác nhau).
+    engine="pyarrow" luôn đọc một lượt.
+    """
+    engine = _csv_engine(engine or CSV_ENGINE)
+    columns = pd.read_csv(io.BytesIO(content), nrows=0, encoding="utf-8").columns
+    options = {"dtype": csv_dtypes(columns), "encoding": "utf-8", "engine": engine}
+    if engine == "pyarrow" or len(content) <= chunk_bytes:
+        return _prepare_frame(pd.read_csv(io.BytesIO(content), **options))
+    reader = pd.read_csv(io.BytesIO(content), chunksize=CSV_CHUNK_ROWS, **options)
+    chunks = [_prepare_frame(next(reader))]
+    date_format = chunks[0].attrs.get("date_format")
+    chunks += [_prepare_frame(chunk, date_format) for chunk in reader]
+    df = concat_frames(chunks)
+    df.attrs["date_issues"] = merge_date_issues(chunks)
+    if date_format:
+        df.attrs["date_format"] = date_format
+    return df
+
+
+def parse_sheet_bytes(content):
+    return compact_dtypes(read_csv_bytes(content))
+
+
+def fetch_sheet(url, etag=None, last_modified=None, retries=FETCH_RETRIES, backoff=FETCH_BACKOFF):
+    """
+    Tải file CSV, gửi kèm ETag/Last-Modified để server trả 304 nếu không đổi.
+    Trả về (status_code, content, headers); thử lại với backoff khi lỗi mạng hoặc 5xx/429.
+    """
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    last_error = None
+    for attempt in range(retries):
+        try:
+            response = requests.get(url, headers=headers, timeout=FETCH_TIMEOUT)
+            if response.status_code == 304:
+                return 304, None, response.headers
+            if response.status_code == 200:
+                return 200, response.content, response.headers
+            last_error = RuntimeError(f"HTTP {response.status_code}")
+            if response.status_code < 500 and response.status_code != 429:
+                break
+        except requests.RequestException as e:
+            last_error = e
+        if attempt < retries - 1:
+            time.sleep(backoff * (2 ** attempt))
+    raise last_error
+
+
+def _local_paths(url):
+    key = hashlib.sha1(url.encode("utf-8")).hexdigest()[:12]
+    base = os.path.join(CACHE_DIR, f"sheet_{key}")
+    return base + ".csv", base + ".json"
+
+
+def _save_local_copy(url, content, meta):
+    csv_path, meta_path = _local_paths(url)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        for path, payload, mode in [(csv_path, content, "wb"), (meta_path, json.dumps(meta), "w")]:
+            tmp_path = path + ".tmp"
+            with open(tmp_path, mode) as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+    except OSError as e:
+        print("⚠️ Không ghi được bản lưu cục bộ:", e)
+
+
+def _read_local_copy(url):
+    csv_path, meta_path = _local_paths(url)
+    if not os.path.exists(csv_path):
+        return None, {}
+    with open(csv_path, "rb") as f:
+        content = f.read()
+    meta = {}
+    if os.path.exists(meta_path):
+        try:
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = {}
+    return content, meta
+
+
+def _snapshot_dir(url):
+    key = hashlib.sha1(url.encode("utf-8")).hexdigest()[:12]
+    return os.path.join(SNAPSHOT_DIR, key)
+
+
+def _frame_for_version(url, version, content):
+    # Ưu tiên snapshot cột (không parse CSV/ngày); thiếu hoặc lỗi thời thì parse và ghi lại
+    directory = _snapshot_dir(url)
+    df = read_snapshot(version, directory)
+    if df is not None:
+        return df
+    if content is None:
+        content, _ = _read_local_copy(url)
+        if content is None:
+            return None
+    df = parse_sheet_bytes(content)
+    try:
+        write_snapshot(df, version, directory)
+    except Exception as e:
+        print("⚠️ Không ghi được snapshot:", e)
+    return df
+
+
+# === Nạp tăng dần: chỉ parse các dòng thêm/sửa so với lần tải trước ===
+class SheetDelta:
+    """
+    Khác biệt giữa hai phiên bản liên tiếp của sheet (base -> data):
+    changed là vị trí các dòng bị sửa, các dòng từ appended_from trở đi là dòng mới,
+    before là giá trị cũ của các dòng bị sửa (để trừ khỏi các bảng tổng hợp).
+    """
+    def __init__(self, base, data, changed, appended_from, before):
+        self.base = base
+        self.data = data
+        self.changed = changed
+        self.appended_from = appended_from
+        self.before = before
+
+    @property
+    def appended_only(self):
+        return len(self.changed) == 0
+
+    def after(self):
+        """Giá trị mới của các dòng bị sửa và các dòng mới."""
+        return self.data.take(np.concatenate([self.changed, np.arange(self.appended_from, len(self.data))]))
+
+
+def split_records(text):
+    """
+    (tiêu đề, các dòng dữ liệu) của nội dung CSV; None nếu không tách theo dòng được
+    (ô có xuống dòng hoặc dòng trống giữa chừng) — khi đó luôn parse lại toàn bộ.
+    """
+    lines = text.split("\n")
+    while lines and not lines[-1].strip():
+        lines.pop()
+    if len(lines) < 2:
+        return None
+    records = pd.Series(lines[1:], dtype=object)
+    if (records.str.strip() == "").any():
+        return None
+    if '"' in text and (records.str.count('"') % 2).any():
+        return None
+    return lines[0], lines[1:]
+
+
+def row_hashes(records):
+    return pd.util.hash_array(np.asarray(records, dtype=object))
+
+
+def parse_delta(df, header, records, prev_hashes, hashes):
+    """
+    Bảng mới = df (phiên bản trước, có prev_hashes) + các dòng thêm/sửa; chỉ parse các dòng đó.
+    Trả về (bảng mới, changed, appended_from) hoặc None khi phải parse lại toàn bộ
+    (sheet bị bớt dòng, sửa quá DELTA_MAX_RATIO số dòng, kiểu cột không khớp).
+    """
+    n_old = len(prev_hashes)
+    if len(hashes) < n_old:
+        return None
+    changed = np.flatnonzero(hashes[:n_old] != prev_hashes)
+    if len(changed) > n_old * DELTA_MAX_RATIO:
+        return None
+    positions = np.concatenate([changed, np.arange(n_old, len(hashes))])
+    if not len(positions):
+        return df, changed, n_old
+
+    # Đọc như lần đọc toàn bộ (cùng csv_dtypes), parse ngày theo định dạng của bảng cũ (vài dòng không đủ để
+    # đoán lại định dạng) rồi ép về kiểu của bảng cũ
+    text = "\n".join([header] + [records[i] for i in positions])
+    columns = pd.read_csv(io.StringIO(header), nrows=0).columns
+    delta = pd.read_csv(io.StringIO(text), dtype=csv_dtypes(columns))
+    delta = _prepare_frame(delta, df.attrs.get("date_format"))
+    issues = merge_date_issues([df, delta])
+    delta = align_dtypes(delta, df)
+    if delta is None or len(delta) != len(positions):
+        return None
+
+    merged = concat_frames([df, delta])
+    if len(changed):
+        # Dòng bị sửa lấy bản mới (nằm ngay sau bảng cũ), dòng mới nối tiếp
+        order = np.arange(len(hashes))
+        order[changed] = n_old + np.arange(len(changed))
+        order[n_old:] = n_old + len(changed) + np.arange(len(hashes) - n_old)
+        merged = merged.take(order).reset_index(drop=True)
+    # Giá trị ngày lỗi của các dòng mới cộng vào bảng cũ (dòng bị sửa vẫn giữ số đếm cũ)
+    merged.attrs["date_issues"] = issues
+    if "date_format" in df.attrs:
+        merged.attrs["date_format"] = df.attrs["date_format"]
+    return merged, changed, n_old
+
+
+def _previous_records(url, entry):
+    # Mốc của lần tải trước: trong bộ nhớ, hoặc tính lại từ bản lưu cục bộ nếu cùng phiên bản
+    if entry.get("records"):
+        return entry["records"]
+    content, meta = _read_local_copy(url)
+    if content is None or meta.get("version") != entry["version"]:
+        return None
+    split = split_records(content.decode("utf-8"))
+    return (split[0], row_hashes(split[1])) if split else None
+
+
+def _save_delta_snapshot(url, df, delta, version):
+    directory = _snapshot_dir(url)
+    try:
+        if delta.appended_only:
+            append_snapshot(df, df.iloc[delta.appended_from:], version, delta.base, directory)
+        else:
+            write_snapshot(df, version, directory)
+    except Exception as e:
+        print("⚠️ Không ghi được snapshot:", e)
+
+
+def _ingest(url, entry, version, content):
+    """
+    Bảng cho nội dung mới: nạp tăng dần từ bản trong bộ nhớ nếu được, không thì snapshot/parse toàn bộ.
+    Trả về (df, delta, records); records = (tiêu đề, hash từng dòng) là mốc cho lần tải sau.
+    """
+    split = split_records(content.decode("utf-8"))
+    if split is None:
+        return _frame_for_version(url, version, content), None, None
+    header, lines = split
+    hashes = row_hashes(lines)
+
+    if entry is not None and len(entry["df"]):
+        prev = _previous_records(url, entry)
+        if prev is not None and prev[0] == header and len(prev[1]) == len(entry["df"]):
+            result = parse_delta(entry["df"], header, lines, prev[1], hashes)
+            if result is not None:
+                df, changed, appended_from = result
+                delta = SheetDelta(entry["version"], df, changed, appended_from, entry["df"].take(changed))
+                _save_delta_snapshot(url, df, delta, version)
+                return df, delta, (header, hashes)
+
+    df = _frame_for_version(url, version, content)
+    records = (header, hashes) if df is not None and len(lines) == len(df) else None
+    return df, None, records
+
+
+def _publish(key, entry):
+    with _lock:
+        _state[key] = entry
+    return entry
+
+
+def _refresh_once(key, ttl, force, refresh):
+    """
+    Bản trong _state nếu còn hạn ttl; hết hạn thì gọi refresh(key, entry, now) -> (df, version).
+    Mỗi nguồn chỉ một lượt làm mới tại một thời điểm và lượt đó chạy ngoài _lock (tải mạng/đọc file lâu):
+    trong lúc đó luồng khác nhận ngay bản đang có, chỉ chờ khi chưa có bản nào hoặc bị ép tải lại.
+    """
+    with _lock:
+        entry = _state.get(key)
+        if entry and not force and time.time() - entry["checked_at"] < ttl:
+            return entry["df"], entry["version"]
+        refresh_lock = _refresh_locks.setdefault(key, threading.Lock())
+    if not refresh_lock.acquire(blocking=entry is None or force):
+        return entry["df"], entry["version"]
+    try:
+        with _lock:
+            entry = _state.get(key)
+        now = time.time()
+        if entry and not force and now - entry["checked_at"] < ttl:
+            return entry["df"], entry["version"]  # lượt trước vừa làm mới xong trong lúc chờ
+        return refresh(key, entry, now)
+    finally:
+        refresh_lock.release()
+
+
+def load_sheet(url, ttl=SHEET_TTL, force=False):
+    """
+    Trả về (df, version) cho Google Sheet, dùng chung cho mọi phiên trong process.
+    - Trong thời gian ttl: trả lại bản đã tải, không gọi mạng.
+    - Hết ttl: kiểm tra lại bằng ETag/Last-Modified, hoặc so hash nội dung nếu server không trả header.
+    - Nội dung không đổi so với snapshot trên đĩa: đọc snapshot, không parse lại CSV.
+    - Nội dung đổi: so hash từng dòng với lần tải trước, chỉ parse các dòng thêm/sửa (SheetDelta),
+      các kết quả dẫn xuất có derived_updater được cập nhật theo delta thay vì dựng lại.
+    - Tải lỗi: dùng bản trong bộ nhớ, nếu chưa có thì dùng snapshot/bản lưu cục bộ gần nhất.
+    - Mỗi URL chỉ một lượt tải lại cùng lúc, chạy ngoài khoá chung (_refresh_once): các phiên khác
+      nhận ngay bản đang có, URL khác không phải chờ.
+    version là hash nội dung, dùng làm khoá cache cho các bước tính sau.
+    """
+    return _refresh_once(url, ttl, force, _refresh_sheet)
+
+
+def _refresh_sheet(url, entry, now):
+    if entry:
+        validators = entry
+    else:
+        # Khởi động: dùng ETag/Last-Modified của lần tải trước để có thể nhận 304
+        _, validators = _read_local_copy(url)
+
+    try:
+        status, content, headers = fetch_sheet(
+            url,
+            etag=validators.get("etag"),
+            last_modified=validators.get("last_modified"),
+        )
+    except Exception as e:
+        if entry:
+            print("⚠️ Không tải lại được sheet, dùng dữ liệu đang có:", e)
+            entry["checked_at"] = now
+            return entry["df"], entry["version"]
+        version = validators.get("version")
+        df = read_snapshot(None, _snapshot_dir(url))
+        if df is None:
+            df = _frame_for_version(url, version, None)
+        else:
+            version = read_manifest(_snapshot_dir(url)).get("source_version")
+        if df is None:
+            raise
+        print("⚠️ Không tải được sheet, dùng bản lưu cục bộ:", e)
+        entry = {
+            "df": df,
+            "version": version,
+            "etag": None,
+            "last_modified": None,
+            "checked_at": now,
+        }
+        _publish(url, entry)
+        return entry["df"], entry["version"]
+
+    if status == 304:
+        if entry is None:
+            version = validators.get("version")
+            df = _frame_for_version(url, version, None)
+            if df is None:
+                # Mất bản lưu cục bộ: tải lại toàn bộ, không gửi điều kiện
+                status, content, headers = fetch_sheet(url)
+            else:
+                entry = _publish(url, {
+                    "df": df,
+                    "version": version,
+                    "etag": validators.get("etag"),
+                    "last_modified": validators.get("last_modified"),
+                    "checked_at": now,
+                })
+        else:
+            entry["checked_at"] = now
+        if entry is not None:
+            return entry["df"], entry["version"]
+
+    version = content_version(content)
+    records = entry.get("records") if entry else None
+    if entry and entry["version"] == version:
+        df = entry["df"]
+    else:
+        df, delta, records = _ingest(url, entry, version, content)
+        if delta is not None:
+            with _derived_lock:
+                _deltas[version] = delta
+        _save_local_copy(url, content, {
+            "version": version,
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "fetched_at": now,
+        })
+
+    _publish(url, {
+        "df": df,
+        "version": version,
+        "etag": headers.get("ETag"),
+        "last_modified": headers.get("Last-Modified"),
+        "checked_at": now,
+        "records": records,
+    })
+    return df, version
+
+
+def load_directory(directory, ttl=SHEET_TTL, force=False):
+    """
+    Trả về (df, version) cho một thư mục file Excel/CSV của các chi nhánh (gộp bằng ingest_files),
+    dùng chung cho mọi phiên như load_sheet. Hết ttl thì so tên/kích thước/thời điểm sửa các file,
+    chỉ đọc lại khi bộ file đổi; báo cáo từng file xem bằng ingest_report(directory).
+    """
+    return _refresh_once(directory, ttl, force, _refresh_directory)
+
+
+def _refresh_directory(directory, entry, now):
+    sources = list_sources(directory)
+    version = sources_version(sources)
+    if entry and entry["version"] == version:
+        entry["checked_at"] = now
+        return entry["df"], entry["version"]
+    try:
+        df, report = ingest_files(sources)
+    except Exception as e:
+        if entry:
+            print("⚠️ Không đọc lại được thư mục dữ liệu, dùng dữ liệu đang có:", e)
+            entry["checked_at"] = now
+            return entry["df"], entry["version"]
+        raise
+    _publish(directory, {"df": df, "version": version, "checked_at": now, "report": report})
+    return df, version
+
+
+def load_source(source, ttl=SHEET_TTL, force=False):
+    """Nguồn dữ liệu là thư mục cục bộ (nhiều file chi nhánh) hoặc URL Google Sheet."""
+    if os.path.isdir(source):
+        return load_directory(source, ttl=ttl, force=force)
+    return load_sheet(source, ttl=ttl, force=force)
+
+
+def ingest_report(source):
+    """Báo cáo của lần gộp file gần nhất cho nguồn này (None nếu nguồn là sheet)."""
+    entry = _state.get(source)
+    return entry.get("report") if entry else None
+
+
+# === Kết quả dẫn xuất theo phiên bản dữ liệu (cube, chỉ mục...) ===
+_derived = {}
+_deltas = {}  # version -> SheetDelta so với phiên bản trước (khi nạp tăng dần)
+_updaters = {}
+_derived_lock = threading.Lock()
+
+
+def derived_updater(name):
+    """
+    Đăng ký cách cập nhật kết quả dẫn xuất name của phiên bản trước theo SheetDelta.
+    Hàm nhận (giá trị cũ, delta) và trả về giá trị mới, hoặc None để dựng lại bằng builder.
+    """
+    def decorator(func):
+        _updaters[name] = func
+        return func
+    return decorator
+
+
+def _evict_locked(live):
+    # Phiên bản trước được giữ tới khi mọi kết quả cập nhật được của nó đã chuyển sang phiên bản mới
+    keep = set(live)
+    for version in live:
+        delta = _deltas.get(version)
+        if delta is None or delta.base not in _derived:
+            continue
+        pending = (_derived[delta.base].keys() & _updaters.keys()) - _derived.get(version, {}).keys()
+        if pending:
+            keep.add(delta.base)
+    for old in [v for v in _derived if v not in keep]:
+        del _derived[old]
+    for old in [v for v in _deltas if v not in keep]:
+        del _deltas[old]
+
+
+def get_derived(version, name, builder):
+    """
+    Tính builder() một lần cho mỗi (version, name) và dùng chung cho mọi phiên.
+    Phiên bản đến từ nạp tăng dần: cập nhật từ giá trị của phiên bản trước nếu name có derived_updater.
+    Chỉ giữ phiên bản vừa dùng và các phiên bản còn sống (xem live_versions); version=None thì không cache.
+    """
+    if version is None:
+        return builder()
+    with _derived_lock:
+        per_version = _derived.get(version)
+        if per_version is not None and name in per_version:
+            return per_version[name]
+        delta = _deltas.get(version)
+        previous = _derived.get(delta.base, {}).get(name) if delta is not None else None
+    value = None
+    if previous is not None and name in _updaters:
+        value = _updaters[name](previous, delta)
+    if value is None:
+        value = builder()
+    live = live_versions() | {version}
+    with _derived_lock:
+        per_version = _derived.setdefault(version, {})
+        per_version.setdefault(name, value)
+        _evict_locked(live)
+        return per_version[name]
+
+
+@derived_updater("cube")
+def _update_cube(cube, delta):
+    return update_cube(cube, delta.after(), delta.before)
+
+
+@derived_updater("serials")
+def _update_serials(serials, delta):
+    col = get_schema(delta.data.columns).find("serial")
+    if col is None or not delta.appended_only:
+        return None
+    return serials.extended(delta.data[col].iloc[delta.appended_from:])
+
+
+# === Bản dữ liệu dùng chung cho cả process, mỗi phiên chỉ giữ một view ===
+def enable_copy_on_write():
+    """
+    Bật Copy-on-Write của pandas: lấy cột/lát cắt từ bản dùng chung không copy, ghi vào thì mới copy
+    nên bản gốc không bị sửa. Là tuỳ chọn toàn cục nên chỉ điểm vào (app Streamlit, rma_service) gọi,
+    không bật khi import module này. Từ pandas 3 luôn bật.
+    """
+    if int(pd.__version__.split(".")[0]) >= 3:
+        return
+    try:
+        pd.set_option("mode.copy_on_write", True)
+    except (AttributeError, KeyError):
+        pass
+
+
+_views = {}  # version -> WeakSet các DatasetView còn được phiên nào đó giữ
+_views_lock = threading.Lock()
+
+
+class DatasetView:
+    """
+    Tham chiếu của một phiên tới bản dữ liệu dùng chung (chỉ đọc) của một phiên bản.
+    Phiên lọc bằng vị trí dòng trên data, không giữ bản copy riêng; bản dữ liệu và kết quả dẫn xuất
+    của phiên bản cũ được giải phóng khi sheet đã có phiên bản mới và không còn view nào trỏ tới.
+    """
+    def __init__(self, data, version):
+        self.data = data
+        self.version = version
+        self.report = None
+
+    def derived(self, name, builder):
+        return get_derived(self.version, name, builder)
+
+
+def live_versions():
+    """Phiên bản hiện tại của mỗi sheet đã tải + các phiên bản còn view."""
+    live = {entry["version"] for entry in dict(_state).values()}
+    with _views_lock:
+        for version, views in list(_views.items()):
+            if len(views):
+                live.add(version)
+            else:
+                del _views[version]
+    return live
+
+
+def release_unused_versions():
+    """Bỏ kết quả dẫn xuất của các phiên bản không còn sống (bản dữ liệu được giải phóng theo)."""
+    live = live_versions()
+    with _derived_lock:
+        _evict_locked(live)
+
+
+def open_view(url, current=None, ttl=SHEET_TTL, force=False):
+    """
+    View tới bản mới nhất của nguồn (sheet hoặc thư mục file, xem load_source); current là view phiên đang giữ,
+    dùng lại nếu vẫn cùng bản.
+    Trả về view mới khi sheet đổi phiên bản (view cũ mất tham chiếu thì phiên bản cũ được giải phóng).
+    """
+    df, version = load_source(url, ttl=ttl, force=force)
+    if current is not None and current.version == version and current.data is df:
+        return current
+    view = _register_view(df, version)
+    view.report = ingest_report(url)
+    return view
+
+
+def open_files_view(files, current=None):
+    """
+    View tới bảng gộp từ các file tải lên [(tên, bytes), ...]; cùng bộ file thì dùng lại current.
+    Bảng chỉ sống theo các view của nó (không vào _state), báo cáo gộp nằm ở view.report.
+    """
+    version = sources_version(files)
+    if current is not None and current.version == version:
+        return current
+    df, report = ingest_files(files)
+    view = _register_view(df, version)
+    view.report = report
+    return view
+
+
+def _register_view(df, version):
+    view = DatasetView(df, version)
+    if version is not None:
+        with _views_lock:
+            _views.setdefault(version, weakref.WeakSet()).add(view)
+    release_unused_versions()
+    return view
+
+
+def view_stats():
+    """Số view đang sống theo phiên bản dữ liệu (cho bảng theo dõi bộ nhớ)."""
+    with _views_lock:
+        return {version: len(views) for version, views in _views.items() if len(views)}
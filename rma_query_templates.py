@@ -1,61 +1,77 @@
+import numpy as np
 import pandas as pd
-from rma_utils import find_col
+from rma_serials import SerialIndex
+from rma_turnaround import TurnaroundEngine
+from rma_utils import get_schema, value_counts
 
-def query_1_total_by_group(df, group_by):
-    count_df = df.groupby(group_by).size().reset_index(name="Số lượng")
+def query_1_total_by_group(df, group_by, cube=None):
+    if cube is not None and cube.has(group_by):
+        count_df = cube.rollup(group_by)["n"].reset_index(name="Số lượng")
+    else:
+        count_df = df.groupby(group_by, observed=True).size().reset_index(name="Số lượng")
     return f"Tổng số sản phẩm tiếp nhận theo {group_by.lower()}", count_df
 
-def query_2_success_rate_by_group(df, group_by):
-    ok_col = find_col(df.columns, "đã sửa xong")
-    fail_col = find_col(df.columns, "không sửa được")
-    tcbh_col = find_col(df.columns, "từ chối bảo hành")
+def query_2_success_rate_by_group(df, group_by, schema=None, cube=None):
+    schema = schema or get_schema(df.columns)
+    ok_col = schema.find("đã sửa xong")
+    fail_col = schema.find("không sửa được")
+    tcbh_col = schema.find("từ chối bảo hành")
     if not all([ok_col, fail_col, tcbh_col]):
         return "Không đủ cột trạng thái!", pd.DataFrame()
-    df2 = df.copy()
-    df2["OK"] = (df2[ok_col] == 1).astype(int)
-    df2["FAIL"] = (df2[fail_col] == 1).astype(int)
-    df2["TCBH"] = (df2[tcbh_col] == 1).astype(int)
-    g = df2.groupby(group_by).agg(
-        ok=("OK", "sum"),
-        fail=("FAIL", "sum"),
-        tcbh=("TCBH", "sum"),
-    ).reset_index()
+    if cube is not None and cube.has(group_by):
+        g = cube.rollup(group_by)[["ok", "fail", "tcbh"]].reset_index()
+    else:
+        df2 = df.copy()
+        df2["OK"] = (df2[ok_col] == 1).astype(int)
+        df2["FAIL"] = (df2[fail_col] == 1).astype(int)
+        df2["TCBH"] = (df2[tcbh_col] == 1).astype(int)
+        g = df2.groupby(group_by, observed=True).agg(
+            ok=("OK", "sum"),
+            fail=("FAIL", "sum"),
+            tcbh=("TCBH", "sum"),
+        ).reset_index()
     g["Tỷ lệ sửa thành công (%)"] = round(g["ok"] / (g["ok"] + g["fail"] + g["tcbh"]) * 100, 2)
     return f"Tỷ lệ sửa chữa thành công theo {group_by.lower()}", g[[group_by, "ok", "fail", "tcbh", "Tỷ lệ sửa thành công (%)"]]
 
-def query_3_unrepaired_products(df):
-    ok_col = find_col(df.columns, "đã sửa xong")
-    date_col = find_col(df.columns, "ngày tiếp nhận")
-    customer_col = find_col(df.columns, "khách hàng")
-    product_col = find_col(df.columns, "sản phẩm")
+def query_3_unrepaired_products(df, schema=None):
+    schema = schema or get_schema(df.columns)
+    ok_col = schema.find("đã sửa xong")
+    date_col = schema.find("ngày tiếp nhận")
+    customer_col = schema.find("khách hàng")
+    product_col = schema.find("sản phẩm")
     if not all([ok_col, date_col]):
         return "Thiếu cột trạng thái hoặc ngày!", pd.DataFrame()
     df3 = df[df[ok_col] != 1]
     return "Danh sách sản phẩm chưa sửa xong", df3[[date_col, customer_col, product_col, ok_col]]
 
-def query_4_top_customers(df, top_n=10):
-    customer_col = find_col(df.columns, "khách hàng")
+def query_4_top_customers(df, top_n=10, schema=None, cube=None):
+    schema = schema or get_schema(df.columns)
+    customer_col = schema.find("khách hàng")
     if not customer_col:
         return "Không có cột 'Khách hàng'", pd.DataFrame()
-    top_kh = df[customer_col].value_counts().head(top_n)
+    if cube is not None and cube.has(customer_col):
+        top_kh = cube.value_counts(customer_col).head(top_n)
+    else:
+        top_kh = value_counts(df[customer_col]).head(top_n)
     return f"Top {top_n} khách hàng gửi nhiều sản phẩm nhất", pd.DataFrame({"Khách hàng": top_kh.index, "Số lượng": top_kh.values})
 
-def query_5_top_products_by_customer(df, customer_name, top_n=30):
-    customer_col = find_col(df.columns, "khách hàng")
-    product_col = find_col(df.columns, "sản phẩm")
-    ok_col = find_col(df.columns, "đã sửa xong")  # Cột Đã sửa xong
+def query_5_top_products_by_customer(df, customer_name, top_n=30, schema=None):
+    schema = schema or get_schema(df.columns)
+    customer_col = schema.find("khách hàng")
+    product_col = schema.find("sản phẩm")
+    ok_col = schema.find("đã sửa xong")  # Cột Đã sửa xong
     if not all([customer_col, product_col, ok_col]):
         return f"Thiếu cột khách hàng hoặc sản phẩm!", pd.DataFrame()
 
     df_filtered = df[df[customer_col] == customer_name]
-    top_sp = df_filtered[product_col].value_counts().head(top_n)
+    top_sp = value_counts(df_filtered[product_col]).head(top_n)
 
     # Tính Đã sửa xong và Tỷ lệ sửa thành công
     df_out = pd.DataFrame({
         "Sản phẩm": top_sp.index,
         "Số lượt gửi": top_sp.values,
-        "Đã sửa xong": df_filtered.groupby(product_col)[ok_col].sum().reindex(top_sp.index).values,
-        "Tỷ lệ sửa thành công (%)": (df_filtered.groupby(product_col)[ok_col].sum().reindex(top_sp.index).values / top_sp.values * 100).round(1)
+        "Đã sửa xong": df_filtered.groupby(product_col, observed=True)[ok_col].sum().reindex(top_sp.index).values,
+        "Tỷ lệ sửa thành công (%)": (df_filtered.groupby(product_col, observed=True)[ok_col].sum().reindex(top_sp.index).values / top_sp.values * 100).round(1)
     })
 
     return f"Top sản phẩm khách hàng {customer_name} đã gửi", df_out
@@ -65,41 +81,53 @@ def query_5_top_products_by_customer(df, customer_name, top_n=30):
 def query_6_to_21_placeholder():
     return "Các truy vấn từ 6 đến 21 đang được hoàn thiện...", pd.DataFrame()
 
-def query_6_total_by_customer_and_time(df, customer_name, group_by):
-    customer_col = find_col(df.columns, "khách hàng")
+def query_6_total_by_customer_and_time(df, customer_name, group_by, schema=None):
+    schema = schema or get_schema(df.columns)
+    customer_col = schema.find("khách hàng")
     if customer_col is None or group_by not in df.columns:
         return "Thiếu cột khách hàng hoặc nhóm thời gian!", pd.DataFrame()
     df_filtered = df[df[customer_col] == customer_name]
-    result = df_filtered.groupby(group_by).size().reset_index(name="Số lượng")
+    result = df_filtered.groupby(group_by, observed=True).size().reset_index(name="Số lượng")
     return f"Tổng sản phẩm khách hàng {customer_name} gửi theo {group_by.lower()}", result
 
-def query_7_top_products(df, top_n=10):
-    product_col = find_col(df.columns, "sản phẩm")
-    ok_col = find_col(df.columns, "đã sửa xong")
+def query_7_top_products(df, top_n=10, schema=None, cube=None):
+    """
+    "Đã sửa xong" = số dòng có cờ đã sửa xong đúng bằng 1 (như cột ok của cube, query_3 và tóm tắt trạng thái),
+    không phải tổng giá trị của cột: ô ghi số khác 1 hay chữ không được tính là đã sửa.
+    """
+    schema = schema or get_schema(df.columns)
+    product_col = schema.find("sản phẩm")
+    ok_col = schema.find("đã sửa xong")
     if not product_col or not ok_col:
         return "Top sản phẩm bảo hành nhiều nhất", pd.DataFrame()
 
-    df_count = df.groupby(product_col).size().reset_index(name="Số lượt gửi")
-    df_fixed = df.groupby(product_col)[ok_col].sum().reset_index(name="Đã sửa xong")
-    df_out = pd.merge(df_count, df_fixed, on=product_col)
+    if cube is not None and cube.has(product_col):
+        df_out = cube.rollup(product_col)[["n", "ok"]].reset_index()
+        df_out.columns = [product_col, "Số lượt gửi", "Đã sửa xong"]
+    else:
+        df_count = df.groupby(product_col, observed=True).size().reset_index(name="Số lượt gửi")
+        df_fixed = (df[ok_col] == 1).groupby(df[product_col], observed=True).sum().reset_index(name="Đã sửa xong")
+        df_out = pd.merge(df_count, df_fixed, on=product_col)
     df_out["Tỷ lệ sửa thành công (%)"] = (df_out["Đã sửa xong"] / df_out["Số lượt gửi"] * 100).round(1)
-    df_out = df_out.sort_values("Số lượt gửi", ascending=False).head(top_n)
+    df_out = df_out.sort_values("Số lượt gửi", ascending=False, kind="stable").head(top_n)
     return f"Top {top_n} sản phẩm bảo hành nhiều nhất", df_out
 
 
-def query_8_top_rejected_products(df, top_n=5):
-    product_col = find_col(df.columns, "sản phẩm")
-    tcbh_col = find_col(df.columns, "từ chối bảo hành")
+def query_8_top_rejected_products(df, top_n=5, schema=None):
+    schema = schema or get_schema(df.columns)
+    product_col = schema.find("sản phẩm")
+    tcbh_col = schema.find("từ chối bảo hành")
     if not all([product_col, tcbh_col]):
         return "Thiếu cột sản phẩm hoặc từ chối bảo hành!", pd.DataFrame()
-    top = df[df[tcbh_col] == 1][product_col].value_counts().head(top_n)
+    top = value_counts(df[df[tcbh_col] == 1][product_col]).head(top_n)
     return "Top sản phẩm bị từ chối bảo hành nhiều nhất", pd.DataFrame({"Sản phẩm": top.index, "Số lượng": top.values})
 
-def query_9_product_status_counts(df, product_name):
-    product_col = find_col(df.columns, "sản phẩm")
-    ok_col = find_col(df.columns, "đã sửa xong")
-    fail_col = find_col(df.columns, "không sửa được")
-    tcbh_col = find_col(df.columns, "từ chối bảo hành")
+def query_9_product_status_counts(df, product_name, schema=None):
+    schema = schema or get_schema(df.columns)
+    product_col = schema.find("sản phẩm")
+    ok_col = schema.find("đã sửa xong")
+    fail_col = schema.find("không sửa được")
+    tcbh_col = schema.find("từ chối bảo hành")
     if not all([product_col, ok_col, fail_col, tcbh_col]):
         return "Thiếu các cột xử lý sản phẩm!", pd.DataFrame()
     df_filtered = df[df[product_col] == product_name]
@@ -112,79 +140,92 @@ def query_9_product_status_counts(df, product_name):
     })
     return f"Số lượt xử lý của {product_name}", result
 
-def query_10_top_errors(df, top_n=5):
-    error_col = find_col(df.columns, "tên lỗi")
+def query_10_top_errors(df, top_n=5, schema=None):
+    schema = schema or get_schema(df.columns)
+    error_col = schema.find("tên lỗi")
     if not error_col:
         return "Không có cột tên lỗi!", pd.DataFrame()
-    top = df[error_col].value_counts().head(top_n)
+    top = value_counts(df[error_col]).head(top_n)
     return "Top lỗi kỹ thuật thường gặp nhất", pd.DataFrame({"Lỗi kỹ thuật": top.index, "Số lần": top.values})
 
-def query_11_top_errors_by_product(df, product_name, top_n=5):
-    product_col = find_col(df.columns, "sản phẩm")
-    error_col = find_col(df.columns, "tên lỗi")
+def query_11_top_errors_by_product(df, product_name, top_n=5, schema=None):
+    schema = schema or get_schema(df.columns)
+    product_col = schema.find("sản phẩm")
+    error_col = schema.find("tên lỗi")
     if not product_col or not error_col:
         return "Thiếu cột sản phẩm hoặc tên lỗi!", pd.DataFrame()
-    top = df[df[product_col] == product_name][error_col].value_counts().head(top_n)
+    top = value_counts(df[df[product_col] == product_name][error_col]).head(top_n)
     return f"Top lỗi thường gặp nhất của sản phẩm {product_name}", pd.DataFrame({"Lỗi kỹ thuật": top.index, "Số lần": top.values})
 
-def query_12_errors_by_customer_and_product(df, customer_name, product_name, top_n=5):
-    customer_col = find_col(df.columns, "khách hàng")
-    product_col = find_col(df.columns, "sản phẩm")
-    error_col = find_col(df.columns, "tên lỗi")
+def query_12_errors_by_customer_and_product(df, customer_name, product_name, top_n=5, schema=None):
+    schema = schema or get_schema(df.columns)
+    customer_col = schema.find("khách hàng")
+    product_col = schema.find("sản phẩm")
+    error_col = schema.find("tên lỗi")
     if not all([customer_col, product_col, error_col]):
         return "Thiếu cột khách hàng, sản phẩm hoặc lỗi!", pd.DataFrame()
     df_filtered = df[(df[customer_col] == customer_name) & (df[product_col] == product_name)]
-    top = df_filtered[error_col].value_counts().head(top_n)
+    top = value_counts(df_filtered[error_col]).head(top_n)
     return f"Top lỗi khách hàng {customer_name} gặp với {product_name}", pd.DataFrame({"Lỗi kỹ thuật": top.index, "Số lần": top.values})
 
-def query_13_status_summary(df):
-    ok_col = find_col(df.columns, "đã sửa xong")
-    fail_col = find_col(df.columns, "không sửa được")
-    tcbh_col = find_col(df.columns, "từ chối bảo hành")
+def query_13_status_summary(df, schema=None, cube=None):
+    schema = schema or get_schema(df.columns)
+    ok_col = schema.find("đã sửa xong")
+    fail_col = schema.find("không sửa được")
+    tcbh_col = schema.find("từ chối bảo hành")
     if not all([ok_col, fail_col, tcbh_col]):
         return "Thiếu cột trạng thái xử lý!", pd.DataFrame()
-    ok = (df[ok_col] == 1).sum()
-    fail = (df[fail_col] == 1).sum()
-    tcbh = (df[tcbh_col] == 1).sum()
+    if cube is not None:
+        ok, fail, tcbh = cube.totals()[["ok", "fail", "tcbh"]]
+    else:
+        ok = (df[ok_col] == 1).sum()
+        fail = (df[fail_col] == 1).sum()
+        tcbh = (df[tcbh_col] == 1).sum()
     result = pd.DataFrame({
         "Trạng thái": ["Sửa xong", "Không sửa được", "Từ chối BH"],
         "Số lượng": [ok, fail, tcbh]
     })
     return "Thống kê số lượng xử lý theo trạng thái", result
 
-def query_14_success_rate_overall(df):
-    ok_col = find_col(df.columns, "đã sửa xong")
-    fail_col = find_col(df.columns, "không sửa được")
-    tcbh_col = find_col(df.columns, "từ chối bảo hành")
+def query_14_success_rate_overall(df, schema=None, cube=None):
+    schema = schema or get_schema(df.columns)
+    ok_col = schema.find("đã sửa xong")
+    fail_col = schema.find("không sửa được")
+    tcbh_col = schema.find("từ chối bảo hành")
     if not all([ok_col, fail_col, tcbh_col]):
         return "Thiếu cột trạng thái!", pd.DataFrame()
-    ok = (df[ok_col] == 1).sum()
-    fail = (df[fail_col] == 1).sum()
-    tcbh = (df[tcbh_col] == 1).sum()
+    if cube is not None:
+        ok, fail, tcbh = cube.totals()[["ok", "fail", "tcbh"]]
+    else:
+        ok = (df[ok_col] == 1).sum()
+        fail = (df[fail_col] == 1).sum()
+        tcbh = (df[tcbh_col] == 1).sum()
     total = ok + fail + tcbh
     percent = round(ok / total * 100, 2) if total > 0 else 0
     return "Tỷ lệ sửa thành công trên tổng số tiếp nhận", pd.DataFrame({"Tổng xử lý": [total], "Sửa thành công (%)": [percent]})
 
 # Các truy vấn 15–21 sẽ tiếp tục ở bước sau nếu cần
 
-def query_15_rejected_products_by_time(df):
-    product_col = find_col(df.columns, "sản phẩm")
-    customer_col = find_col(df.columns, "khách hàng")
-    tcbh_col = find_col(df.columns, "từ chối bảo hành")
+def query_15_rejected_products_by_time(df, schema=None):
+    schema = schema or get_schema(df.columns)
+    product_col = schema.find("sản phẩm")
+    customer_col = schema.find("khách hàng")
+    tcbh_col = schema.find("từ chối bảo hành")
     if not all([product_col, customer_col, tcbh_col]):
         return "Thiếu cột cần thiết!", pd.DataFrame()
     df15 = df[df[tcbh_col] == 1]
     return "Sản phẩm bị từ chối bảo hành", df15[[product_col, customer_col, "Tháng", "Năm"]]
 
-def query_16_top_customers_by_product(df, product_name, top_n=10):
-    product_col = find_col(df.columns, "sản phẩm")
-    customer_col = find_col(df.columns, "khách hàng")
-    ok_col = find_col(df.columns, "đã sửa xong")  # Cột Đã sửa xong
+def query_16_top_customers_by_product(df, product_name, top_n=10, schema=None):
+    schema = schema or get_schema(df.columns)
+    product_col = schema.find("sản phẩm")
+    customer_col = schema.find("khách hàng")
+    ok_col = schema.find("đã sửa xong")  # Cột Đã sửa xong
     if not all([product_col, customer_col, ok_col]):
         return "Thiếu cột sản phẩm hoặc khách hàng!", pd.DataFrame()
 
-    top_kh = df[df[product_col] == product_name].groupby(customer_col).size().reset_index(name="Số lượt gửi")
-    top_kh_fixed = df[df[product_col] == product_name].groupby(customer_col)[ok_col].sum().reset_index(name="Đã sửa xong")
+    top_kh = df[df[product_col] == product_name].groupby(customer_col, observed=True).size().reset_index(name="Số lượt gửi")
+    top_kh_fixed = df[df[product_col] == product_name].groupby(customer_col, observed=True)[ok_col].sum().reset_index(name="Đã sửa xong")
     
     # Merge để có số lượt gửi và Đã sửa xong
     df_out = pd.merge(top_kh, top_kh_fixed, on=customer_col)
@@ -198,21 +239,23 @@ def query_16_top_customers_by_product(df, product_name, top_n=10):
     return f"Top {top_n} khách hàng gửi {product_name} nhiều nhất", df_out
 
 
-def query_17_top_errors_by_customer_and_quarter(df, customer_name, quarter):
-    customer_col = find_col(df.columns, "khách hàng")
-    error_col = find_col(df.columns, "tên lỗi")
+def query_17_top_errors_by_customer_and_quarter(df, customer_name, quarter, schema=None):
+    schema = schema or get_schema(df.columns)
+    customer_col = schema.find("khách hàng")
+    error_col = schema.find("tên lỗi")
     if not all([customer_col, error_col]):
         return "Thiếu cột khách hàng hoặc lỗi!", pd.DataFrame()
     df_filtered = df[(df[customer_col] == customer_name) & (df["Quý"] == quarter)]
-    top = df_filtered[error_col].value_counts().head(5)
+    top = value_counts(df_filtered[error_col]).head(5)
     return f"Top lỗi của {customer_name} trong quý {quarter}", pd.DataFrame({"Lỗi kỹ thuật": top.index, "Số lần": top.values})
 
-def query_18_success_rate_by_customer_product_month(df, customer_name, product_name, month):
-    customer_col = find_col(df.columns, "khách hàng")
-    product_col = find_col(df.columns, "sản phẩm")
-    ok_col = find_col(df.columns, "đã sửa xong")
-    fail_col = find_col(df.columns, "không sửa được")
-    tcbh_col = find_col(df.columns, "từ chối bảo hành")
+def query_18_success_rate_by_customer_product_month(df, customer_name, product_name, month, schema=None):
+    schema = schema or get_schema(df.columns)
+    customer_col = schema.find("khách hàng")
+    product_col = schema.find("sản phẩm")
+    ok_col = schema.find("đã sửa xong")
+    fail_col = schema.find("không sửa được")
+    tcbh_col = schema.find("từ chối bảo hành")
     if not all([customer_col, product_col, ok_col, fail_col, tcbh_col]):
         return "Thiếu cột cần thiết!", pd.DataFrame()
     df18 = df[
@@ -227,46 +270,59 @@ def query_18_success_rate_by_customer_product_month(df, customer_name, product_n
     percent = round(ok / total * 100, 2) if total > 0 else 0
     return f"Tỷ lệ sửa thành công {product_name} của {customer_name} trong tháng {month}", pd.DataFrame({"Tổng xử lý": [total], "Sửa thành công (%)": [percent]})
 
-def query_19_top_technicians(df, top_n=5):
-    tech_col = find_col(df.columns, "kỹ thuật viên")
+def query_19_top_technicians(df, top_n=5, schema=None, cube=None):
+    schema = schema or get_schema(df.columns)
+    tech_col = schema.find("kỹ thuật viên")
     if not tech_col:
         return "Không có cột 'Kỹ thuật viên'", pd.DataFrame()
-    top_ktv = df[tech_col].value_counts().head(top_n)
+    if cube is not None and cube.has(tech_col):
+        top_ktv = cube.value_counts(tech_col).head(top_n)
+    else:
+        top_ktv = value_counts(df[tech_col]).head(top_n)
     return f"Top kỹ thuật viên xử lý nhiều sản phẩm nhất", pd.DataFrame({"Kỹ thuật viên": top_ktv.index, "Số lượng": top_ktv.values})
 
-def query_20_success_rate_by_technician_and_group(df, group_by):
-    tech_col = find_col(df.columns, "ktv")
-    ok_col = find_col(df.columns, "đã sửa xong")
-    fail_col = find_col(df.columns, "không sửa được")
-    tcbh_col = find_col(df.columns, "từ chối bảo hành")
+def query_20_success_rate_by_technician_and_group(df, group_by, schema=None, cube=None):
+    schema = schema or get_schema(df.columns)
+    tech_col = schema.find("ktv")
+    ok_col = schema.find("đã sửa xong")
+    fail_col = schema.find("không sửa được")
+    tcbh_col = schema.find("từ chối bảo hành")
     if not all([tech_col, ok_col, fail_col, tcbh_col]):
         return "Thiếu cột kỹ thuật viên hoặc trạng thái!", pd.DataFrame()
-    df2 = df.copy()
-    df2["OK"] = (df2[ok_col] == 1).astype(int)
-    df2["FAIL"] = (df2[fail_col] == 1).astype(int)
-    df2["TCBH"] = (df2[tcbh_col] == 1).astype(int)
-    g = df2.groupby([group_by, tech_col]).agg(
-        ok=("OK", "sum"),
-        fail=("FAIL", "sum"),
-        tcbh=("TCBH", "sum")
-    ).reset_index()
+    if cube is not None and cube.has(group_by, tech_col):
+        g = cube.rollup([group_by, tech_col])[["ok", "fail", "tcbh"]].reset_index()
+    else:
+        df2 = df.copy()
+        df2["OK"] = (df2[ok_col] == 1).astype(int)
+        df2["FAIL"] = (df2[fail_col] == 1).astype(int)
+        df2["TCBH"] = (df2[tcbh_col] == 1).astype(int)
+        g = df2.groupby([group_by, tech_col], observed=True).agg(
+            ok=("OK", "sum"),
+            fail=("FAIL", "sum"),
+            tcbh=("TCBH", "sum")
+        ).reset_index()
     g["Tỷ lệ sửa thành công (%)"] = round(g["ok"] / (g["ok"] + g["fail"] + g["tcbh"]) * 100, 2)
     return f"Tỷ lệ sửa thành công của kỹ thuật viên theo {group_by.lower()}", g[[group_by, tech_col, "ok", "fail", "tcbh", "Tỷ lệ sửa thành công (%)"]]
 
-def query_21_technician_status_summary(df):
-    tech_col = find_col(df.columns, "ktv")
-    ok_col = find_col(df.columns, "đã sửa xong")
-    fail_col = find_col(df.columns, "không sửa được")
-    tcbh_col = find_col(df.columns, "từ chối bảo hành")
+def query_21_technician_status_summary(df, schema=None, cube=None):
+    schema = schema or get_schema(df.columns)
+    tech_col = schema.find("ktv")
+    ok_col = schema.find("đã sửa xong")
+    fail_col = schema.find("không sửa được")
+    tcbh_col = schema.find("từ chối bảo hành")
 
     if not all([tech_col, ok_col, fail_col, tcbh_col]):
         return "Thiếu cột kỹ thuật viên hoặc trạng thái!", pd.DataFrame()
 
-    g = df.groupby(tech_col).agg({
-        ok_col:   lambda x: (x == 1).sum(),
-        fail_col: lambda x: (x == 1).sum(),
-        tcbh_col: lambda x: (x == 1).sum()
-    }).reset_index()
+    if cube is not None and cube.has(tech_col):
+        g = cube.rollup(tech_col)[["ok", "fail", "tcbh"]].reset_index()
+        g.columns = [tech_col, ok_col, fail_col, tcbh_col]
+    else:
+        g = df.groupby(tech_col, observed=True).agg({
+            ok_col:   lambda x: (x == 1).sum(),
+            fail_col: lambda x: (x == 1).sum(),
+            tcbh_col: lambda x: (x == 1).sum()
+        }).reset_index()
 
     g["Tổng sản phẩm"] = g[ok_col] + g[fail_col] + g[tcbh_col]
     g["Tỷ lệ thành công (%)"] = g.apply(
@@ -284,84 +340,127 @@ def query_21_technician_status_summary(df):
 
     return "Thống kê số lượng sản phẩm mỗi kỹ thuật viên đã xử lý", g
 
-def query_top_errors(data, top_n=10):
-    col_error = find_col(data.columns, "tên lỗi (báo lỗi)")
+def query_top_errors(data, top_n=10, schema=None):
+    schema = schema or get_schema(data.columns)
+    col_error = schema.find("tên lỗi (báo lỗi)")
     if col_error:
-        df = data[col_error].dropna().value_counts().reset_index()
+        df = value_counts(data[col_error].dropna()).reset_index()
         df.columns = ["Lỗi", "Số lần gặp"]
         return f"Top {top_n} lỗi kỹ thuật phổ biến", df.head(top_n)
     else:
         return "Không tìm thấy cột lỗi", pd.DataFrame()
 
 
-def query_avg_processing_time(data):
-    col_nhan = find_col(data.columns, "ngay tiep nhan")
-    col_tra = find_col(data.columns, "ngay tra khach")
-    
-    if not col_nhan or not col_tra:
+def _turnaround_engine(data, schema, turnaround, rows):
+    # Không có engine dựng sẵn: dựng tạm trên data (dùng cột số ngày xử lý đã tính khi tải nếu có)
+    if turnaround is None:
+        return TurnaroundEngine(data, schema), None
+    return turnaround, rows
+
+def query_avg_processing_time(data, schema=None, turnaround=None, rows=None):
+    """
+    turnaround: TurnaroundEngine của bảng gốc (dựng sẵn khi tải dữ liệu);
+    rows: vị trí của các dòng data trong bảng gốc (None = data chính là bảng gốc).
+    """
+    schema = schema or get_schema(data.columns)
+    turnaround, rows = _turnaround_engine(data, schema, turnaround, rows)
+    if not turnaround.available:
         return "Thiếu cột 'ngay tiep nhan' hoặc 'ngay tra khach'", pd.DataFrame()
+    return "⏱️ Thời gian xử lý (ngày)", turnaround.summary(rows)
+
+def query_turnaround_breakdown(data, by, schema=None, turnaround=None, rows=None):
+    """Thời gian xử lý theo từng giá trị của cột tìm bằng từ khoá by (khách hàng, sản phẩm, ktv, nhóm hàng)."""
+    schema = schema or get_schema(data.columns)
+    col = schema.find(by)
+    turnaround, rows = _turnaround_engine(data, schema, turnaround, rows)
+    if not col or not turnaround.available:
+        return "Thiếu cột cần thiết", pd.DataFrame()
+    return f"⏱️ Thời gian xử lý theo {by}", turnaround.breakdown(col, rows)
 
-    df = data.dropna(subset=[col_nhan, col_tra]).copy()
-
-    # Ép kiểu datetime để đảm bảo tính toán không lỗi
-    df[col_nhan] = pd.to_datetime(df[col_nhan], errors='coerce')
-    df[col_tra] = pd.to_datetime(df[col_tra], errors='coerce')
-
-    df["số ngày xử lý"] = (df[col_tra] - df[col_nhan]).dt.days
-    avg_days = df["số ngày xử lý"].mean()
-    
-    return "⏱️ Thời gian xử lý trung bình (ngày)", pd.DataFrame({"Trung bình (ngày)": [round(avg_days, 2)]})
+def query_turnaround_histogram(data, schema=None, turnaround=None, rows=None):
+    schema = schema or get_schema(data.columns)
+    turnaround, rows = _turnaround_engine(data, schema, turnaround, rows)
+    if not turnaround.available:
+        return "Thiếu cột 'ngay tiep nhan' hoặc 'ngay tra khach'", pd.DataFrame()
+    return "⏱️ Phân bố thời gian xử lý", turnaround.histogram(rows)
 
-    
-def query_top_products_in_group(df, selected_group):
-    group_col = find_col(df.columns, "nhóm")
-    product_col = find_col(df.columns, "sản phẩm")
-    ok_col = find_col(df.columns, "đã sửa xong")
+def query_top_products_in_group(df, selected_group, schema=None):
+    schema = schema or get_schema(df.columns)
+    group_col = schema.find("nhóm")
+    product_col = schema.find("sản phẩm")
+    ok_col = schema.find("đã sửa xong")
     if not group_col or not product_col or not ok_col:
         return f"Top sản phẩm trong nhóm: {selected_group}", pd.DataFrame()
 
     df_group = df[df[group_col] == selected_group]
-    df_count = df_group.groupby(product_col).size().reset_index(name="Số lượt gửi")
-    df_fixed = df_group.groupby(product_col)[ok_col].sum().reset_index(name="Đã sửa xong")
+    df_count = df_group.groupby(product_col, observed=True).size().reset_index(name="Số lượt gửi")
+    df_fixed = df_group.groupby(product_col, observed=True)[ok_col].sum().reset_index(name="Đã sửa xong")
     df_out = pd.merge(df_count, df_fixed, on=product_col)
     df_out["Tỷ lệ sửa thành công (%)"] = (df_out["Đã sửa xong"] / df_out["Số lượt gửi"] * 100).round(1)
     df_out = df_out.sort_values("Số lượt gửi", ascending=False).head(20)
     return f"Top sản phẩm trong nhóm: {selected_group}", df_out
 
 
-def query_avg_time_by_customer(data, selected_khach=None):
-    col_nhan = find_col(data.columns, "ngay tiep nhan")
-    col_tra = find_col(data.columns, "ngay tra khach")
-    col_khach = find_col(data.columns, "tên khách hàng")
+def query_product_warranty_count(df, product_name, schema=None):
+    schema = schema or get_schema(df.columns)
+    product_col = schema.find("sản phẩm")
+    ok_col = schema.find("đã sửa xong")
+    if not product_col or not ok_col:
+        return "Thiếu cột sản phẩm hoặc cột 'Đã sửa xong'!", pd.DataFrame()
 
-    if not col_nhan or not col_tra or not col_khach:
-        return "Thiếu cột cần thiết", pd.DataFrame()
+    # Đếm số lượt gửi và số lượng đã sửa xong
+    df_product = df[df[product_col] == product_name]
+    count = df_product.shape[0]
+    fixed = df_product[ok_col].sum()
+    ratio = round(fixed / count * 100, 1) if count else 0
+    df_out = pd.DataFrame({
+        "Sản phẩm": [product_name],
+        "Số lượt gửi": [count],
+        "Đã sửa xong": [fixed],
+        "Tỷ lệ sửa thành công (%)": [ratio]
+    })
+    return f"Kết quả cho sản phẩm: {product_name}", df_out
 
-    df = data.dropna(subset=[col_nhan, col_tra, col_khach]).copy()
-    df[col_nhan] = pd.to_datetime(df[col_nhan], errors='coerce')
-    df[col_tra] = pd.to_datetime(df[col_tra], errors='coerce')
 
-    df["số ngày xử lý"] = (df[col_tra] - df[col_nhan]).dt.days
+def query_avg_time_by_customer(data, selected_khach=None, schema=None, turnaround=None, rows=None):
+    schema = schema or get_schema(data.columns)
+    col_khach = schema.find("tên khách hàng")
+    turnaround, rows = _turnaround_engine(data, schema, turnaround, rows)
+    if not col_khach or not turnaround.available:
+        return "Thiếu cột cần thiết", pd.DataFrame()
 
-    # Nếu chọn khách hàng cụ thể → lọc trước
+    avg_df = turnaround.breakdown(col_khach, rows)
+    # Nếu chọn khách hàng cụ thể → chỉ giữ dòng của khách đó
     if selected_khach:
-        df = df[df[col_khach] == selected_khach]
-
-    avg_df = df.groupby(col_khach)["số ngày xử lý"].mean().reset_index()
-    avg_df.columns = ["Khách hàng", "Thời gian xử lý trung bình (ngày)"]
-    avg_df = avg_df.sort_values(by="Thời gian xử lý trung bình (ngày)", ascending=False)
-
-    return f"⏱️ Thời gian xử lý trung bình theo khách", avg_df
-
-def query_serial_lap_lai(data):
-    col_serial = find_col(data.columns, "serial")
+        avg_df = avg_df[avg_df[col_khach] == selected_khach].reset_index(drop=True)
+    avg_df = avg_df.rename(columns={col_khach: "Khách hàng"})
+
+    return f"⏱️ Thời gian xử lý theo khách", avg_df
+
+def query_serial_lap_lai(data, schema=None, serials=None, rows=None):
+    """
+    serials: SerialIndex của bảng gốc (dựng sẵn khi tải dữ liệu);
+    rows: vị trí tăng dần của các dòng data trong bảng gốc (None = data chính là bảng gốc).
+    """
+    schema = schema or get_schema(data.columns)
+    col_serial = schema.find("serial")
     if not col_serial:
         return "Không tìm thấy cột serial", pd.DataFrame()
 
-    serial_counts = data[col_serial].value_counts().reset_index()
-    serial_counts.columns = ["Serial", "Số lần gặp"]
-    serial_lap = serial_counts[serial_counts["Số lần gặp"] > 1]
-
-    df_serial_info = pd.merge(serial_lap, data, left_on="Serial", right_on=col_serial, how="left")
+    if serials is None:
+        serials, rows = SerialIndex(data[col_serial]), None
+    if rows is not None and len(rows) == serials.n_rows:
+        rows = None
+    codes, counts, positions = serials.repeats(min_count=2, rows=rows)
+    if rows is not None:
+        positions = np.searchsorted(rows, positions)
+
+    # Lấy thẳng các dòng theo chỉ mục, không merge lại với bảng dữ liệu
+    df_serial_info = data.take(positions).reset_index(drop=True)
+    df_serial_info.insert(0, "Số lần gặp", np.repeat(counts, counts))
+    # Các cách viết khác nhau (hoa/thường, khoảng trắng) được gộp chung một serial;
+    # cột Serial hiển thị giá trị gốc gặp đầu tiên của nhóm, cột serial của từng dòng giữ nguyên
+    first_raw = data[col_serial].to_numpy()[positions[np.cumsum(counts) - counts]]
+    df_serial_info.insert(0, "Serial", np.repeat(first_raw, counts))
     return "Danh sách serial bị lặp lại (gửi nhiều hơn 1 lần)", df_serial_info
 
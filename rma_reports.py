@@ -0,0 +1,293 @@
+import threading
+from collections import defaultdict, deque
+from datetime import date
+
+import pandas as pd
+
+import rma_query_templates as q
+from rma_cube import build_cube
+from rma_export import filter_fingerprint
+
+ROLES_ALL = ("admin", "mod", "user")
+ROLES_STAFF = ("admin", "mod")
+ROLES_ADMIN = ("admin",)
+GROUP_BY_OPTIONS = ["Năm", "Tháng", "Quý"]
+TURNAROUND_BY_OPTIONS = ["khách hàng", "sản phẩm", "nhóm hàng", "ktv"]
+TIMING_HISTORY = 200  # số lần chạy gần nhất giữ lại cho mỗi báo cáo
+DASHBOARD_KEY = "dashboard"
+DASHBOARD_LABEL = "Tổng hợp (tất cả báo cáo)"
+
+
+class ReportDef:
+    """
+    Một báo cáo ở tab 3.
+    - params(ctx): vẽ widget chọn tham số, trả về dict kwargs cho run, hoặc None nếu chưa đủ
+    - run(ctx, **params): trả về (title, df_out) như các hàm trong rma_query_templates
+    - export_name(params): tên file Excel
+    - chart(df_out): hình plotly vẽ thêm phía trên bảng (tuỳ chọn)
+    - dashboard: tham số dùng trong chế độ tổng hợp (None = không đưa vào tổng hợp)
+    - uses_today: kết quả đổi theo ngày hiện tại (tuổi phiếu đang mở, SLA) dù dữ liệu không đổi
+    ctx là dict gồm data, schema, cube, selected_nhoms của phiên hiện tại;
+    rows là vị trí của data trong bảng gốc (None = toàn bộ), serials là SerialIndex của bảng gốc,
+    version là phiên bản dữ liệu (dùng làm khoá cache file xuất), turnaround là TurnaroundEngine của bảng gốc.
+    """
+    def __init__(self, key, label, roles, run, export_name, params=None, chart=None, dashboard=None, uses_today=False):
+        self.key = key
+        self.label = label
+        self.roles = roles
+        self.run = run
+        self.export_name = export_name
+        self.params = params or (lambda ctx: {})
+        self.chart = chart
+        self.dashboard = dashboard
+        self.uses_today = uses_today
+
+
+REPORTS = []
+
+
+def register_report(report):
+    REPORTS.append(report)
+    return report
+
+
+def reports_for_role(role):
+    role = role if role in ROLES_ALL else "user"
+    return [r for r in REPORTS if role in r.roles]
+
+
+def dashboard_reports(role):
+    return [r for r in reports_for_role(role) if r.dashboard is not None]
+
+
+def get_report(key):
+    for report in REPORTS:
+        if report.key == key:
+            return report
+    return None
+
+
+# === Đo thời gian chạy: tra tham số, tính toán, hiển thị (ms) ===
+_timings = defaultdict(lambda: deque(maxlen=TIMING_HISTORY))
+_timings_lock = threading.Lock()
+
+
+def record_timing(key, **phases_ms):
+    with _timings_lock:
+        _timings[key].append(phases_ms)
+
+
+def timing_summary():
+    rows = []
+    with _timings_lock:
+        items = [(key, list(runs)) for key, runs in _timings.items()]
+    for key, runs in items:
+        report = get_report(key)
+        frame = pd.DataFrame(runs)
+        label = report.label if report else DASHBOARD_LABEL if key == DASHBOARD_KEY else key
+        row = {"Báo cáo": label, "Số lần chạy": len(frame)}
+        for phase in frame.columns:
+            row[f"{phase} TB (ms)"] = round(frame[phase].mean(), 1)
+            row[f"{phase} p95 (ms)"] = round(frame[phase].quantile(0.95), 1)
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def export_cache_key(key, ctx, params=None, reports=()):
+    """
+    (báo cáo, dấu vân tay bộ lọc, phiên bản dữ liệu, các báo cáo trong file, ngày); None khi không biết phiên bản dữ liệu.
+    File tổng hợp khác nhau theo quyền (admin có thêm sheet) nên khoá gồm cả danh sách báo cáo;
+    báo cáo có uses_today thì khoá theo ngày hiện tại để file tạo hôm qua không bị dùng lại.
+    """
+    if ctx.get("version") is None:
+        return None
+    fingerprint = filter_fingerprint(sorted((params or {}).items()), ctx.get("rows"))
+    today = date.today() if any(report.uses_today for report in reports) else None
+    return key, fingerprint, ctx["version"], tuple(sorted(report.key for report in reports)), today
+
+
+def dashboard_context(ctx):
+    """
+    ctx dùng chung cho chế độ tổng hợp: nếu chưa có cube cho bộ lọc hiện tại thì tính cột trạng thái
+    của dữ liệu đã lọc một lần (cube theo dòng), các báo cáo theo nhóm/trạng thái đều gộp từ đó.
+    """
+    shared = dict(ctx)
+    if shared.get("cube") is None:
+        shared["cube"] = build_cube(ctx["data"], ctx["schema"], aggregate=False)
+    return shared
+
+
+def compute_dashboard(reports, shared):
+    return [(report, *report.run(shared, **report.dashboard)) for report in reports]
+
+
+# === Widget chọn tham số và biểu đồ: chỉ giao diện Streamlit gọi (rma_ui), nên import streamlit/plotly tại chỗ
+# để dịch vụ HTTP và benchmark dùng danh sách báo cáo mà không cần cài streamlit ===
+def _group_by_param(ctx):
+    import streamlit as st
+    return {"group_by": st.selectbox("Nhóm theo:", GROUP_BY_OPTIONS)}
+
+
+def _turnaround_by_param(ctx):
+    import streamlit as st
+    return {"by": st.selectbox("Theo:", TURNAROUND_BY_OPTIONS)}
+
+
+def _single_group_param(ctx):
+    import streamlit as st
+    selected_nhoms = ctx.get("selected_nhoms") or []
+    if len(selected_nhoms) == 1:
+        return {"selected_group": selected_nhoms[0]}
+    if len(selected_nhoms) > 1:
+        st.warning("⚠️ Truy vấn này chỉ hỗ trợ khi chọn đúng 1 nhóm hàng.")
+    else:
+        st.warning("⚠️ Vui lòng chọn nhóm hàng cần phân tích.")
+    return None
+
+
+def _select_param(name, keyword, label, required, error, sort=False):
+    """Selectbox chọn giá trị trong cột tìm theo keyword; required là các từ khoá cột bắt buộc phải có."""
+    def params(ctx):
+        import streamlit as st
+        schema = ctx["schema"]
+        if not all(schema.find(k) for k in required):
+            st.error(error)
+            return None
+        values = ctx["data"][schema.find(keyword)].dropna().unique().tolist()
+        selected = st.selectbox(label, sorted(values) if sort else values)
+        return {name: selected} if selected else None
+    return params
+
+
+def _turnaround_histogram_chart(df_out):
+    import plotly.express as px
+    fig = px.bar(df_out, x="Khoảng", y=["Đã trả", "Đang mở"], title="Phân bố thời gian xử lý",
+                 barmode="group", text_auto=True, template="plotly_dark")
+    fig.update_layout(height=450, yaxis_title="Số phiếu", legend_title="")
+    return fig
+
+
+def _top_errors_chart(df_out):
+    import plotly.express as px
+    fig = px.bar(df_out, x="Lỗi", y="Số lần gặp", title="Biểu đồ lỗi kỹ thuật phổ biến",
+                 text_auto=True, template="plotly_dark")
+    fig.update_layout(xaxis_tickangle=-45, height=500, margin=dict(l=30, r=30, t=60, b=150))
+    return fig
+
+
+# === Danh sách báo cáo (thứ tự hiển thị) ===
+register_report(ReportDef(
+    "total_by_group", "Tổng số sản phẩm tiếp nhận theo tháng/năm/quý", ROLES_STAFF,
+    run=lambda ctx, group_by: q.query_1_total_by_group(ctx["data"], group_by, cube=ctx.get("cube")),
+    params=_group_by_param,
+    export_name=lambda p: "tong_so_tiep_nhan.xlsx",
+    dashboard={"group_by": "Tháng"},
+))
+register_report(ReportDef(
+    "success_rate_by_group", "Tỷ lệ sửa chữa thành công theo tháng/năm/quý", ROLES_ADMIN,
+    run=lambda ctx, group_by: q.query_2_success_rate_by_group(ctx["data"], group_by, schema=ctx["schema"], cube=ctx.get("cube")),
+    params=_group_by_param,
+    export_name=lambda p: "ti_le_sua_chua.xlsx",
+    dashboard={"group_by": "Tháng"},
+))
+register_report(ReportDef(
+    "unrepaired", "Danh sách sản phẩm chưa sửa xong", ROLES_ADMIN,
+    run=lambda ctx: q.query_3_unrepaired_products(ctx["data"], schema=ctx["schema"]),
+    export_name=lambda p: "chua_sua_xong.xlsx",
+))
+register_report(ReportDef(
+    "top_customers", "Top 10 khách hàng gửi nhiều nhất", ROLES_STAFF,
+    run=lambda ctx: q.query_4_top_customers(ctx["data"], schema=ctx["schema"], cube=ctx.get("cube")),
+    export_name=lambda p: "top_khach_hang.xlsx",
+    dashboard={},
+))
+register_report(ReportDef(
+    "top_products", "Top 10 sản phẩm bảo hành nhiều nhất", ROLES_STAFF,
+    run=lambda ctx: q.query_7_top_products(ctx["data"], schema=ctx["schema"], cube=ctx.get("cube")),
+    export_name=lambda p: "top_san_pham.xlsx",
+    dashboard={},
+))
+register_report(ReportDef(
+    "top_errors", "Top lỗi phổ biến theo nhóm hàng", ROLES_ALL,
+    run=lambda ctx: q.query_top_errors(ctx["data"], schema=ctx["schema"]),
+    export_name=lambda p: "top_loi_pop.xlsx",
+    chart=_top_errors_chart,
+    dashboard={},
+))
+register_report(ReportDef(
+    "avg_processing_time", "Thời gian xử lý (trung bình, phân vị, SLA)", ROLES_ADMIN,
+    run=lambda ctx: q.query_avg_processing_time(ctx["data"], schema=ctx["schema"], turnaround=ctx.get("turnaround"), rows=ctx.get("rows")),
+    export_name=lambda p: "thoi_gian_xu_ly_tb.xlsx",
+    dashboard={},
+    uses_today=True,
+))
+register_report(ReportDef(
+    "turnaround_breakdown", "Thời gian xử lý theo khách hàng/sản phẩm/nhóm hàng/KTV", ROLES_ADMIN,
+    run=lambda ctx, by: q.query_turnaround_breakdown(ctx["data"], by, schema=ctx["schema"], turnaround=ctx.get("turnaround"), rows=ctx.get("rows")),
+    params=_turnaround_by_param,
+    export_name=lambda p: f"thoi_gian_xu_ly_theo_{p['by'].replace(' ', '_')}.xlsx",
+    uses_today=True,
+))
+register_report(ReportDef(
+    "turnaround_histogram", "Phân bố thời gian xử lý", ROLES_ADMIN,
+    run=lambda ctx: q.query_turnaround_histogram(ctx["data"], schema=ctx["schema"], turnaround=ctx.get("turnaround"), rows=ctx.get("rows")),
+    export_name=lambda p: "phan_bo_thoi_gian_xu_ly.xlsx",
+    chart=_turnaround_histogram_chart,
+    dashboard={},
+    uses_today=True,
+))
+register_report(ReportDef(
+    "top_products_in_group", "Top sản phẩm bảo hành nhiều trong nhóm hàng đã chọn", ROLES_ALL,
+    run=lambda ctx, selected_group: q.query_top_products_in_group(ctx["data"], selected_group, schema=ctx["schema"]),
+    params=_single_group_param,
+    export_name=lambda p: f"top_san_pham_{p['selected_group']}.xlsx",
+))
+register_report(ReportDef(
+    "avg_time_by_customer", "Thời gian xử lý trung bình theo khách hàng", ROLES_ADMIN,
+    run=lambda ctx, customer_name: q.query_avg_time_by_customer(
+        ctx["data"], customer_name, schema=ctx["schema"], turnaround=ctx.get("turnaround"), rows=ctx.get("rows")),
+    params=_select_param(
+        "customer_name", "tên khách hàng", "🔍 Chọn khách hàng cần xem:", ["tên khách hàng"],
+        "❌ Không tìm thấy cột 'tên khách hàng' trong dữ liệu.",
+    ),
+    export_name=lambda p: "tg_xu_ly_theo_khach.xlsx",
+    uses_today=True,
+))
+register_report(ReportDef(
+    "serial_repeats", "Serial bị gửi nhiều lần", ROLES_STAFF,
+    run=lambda ctx: q.query_serial_lap_lai(ctx["data"], schema=ctx["schema"], serials=ctx.get("serials"), rows=ctx.get("rows")),
+    export_name=lambda p: "serial_lap_lai.xlsx",
+))
+register_report(ReportDef(
+    "technician_summary", "Hiệu suất sửa chữa theo kỹ thuật viên", ROLES_STAFF,
+    run=lambda ctx: q.query_21_technician_status_summary(ctx["data"], schema=ctx["schema"], cube=ctx.get("cube")),
+    export_name=lambda p: "hieu_suat_ktv.xlsx",
+    dashboard={},
+))
+register_report(ReportDef(
+    "product_warranty_count", "Số lượng bảo hành theo sản phẩm", ROLES_ALL,
+    run=lambda ctx, product_name: q.query_product_warranty_count(ctx["data"], product_name, schema=ctx["schema"]),
+    params=_select_param(
+        "product_name", "sản phẩm", "🧱 Chọn sản phẩm cần thống kê:", ["sản phẩm", "đã sửa xong"],
+        "❌ Không tìm thấy cột sản phẩm hoặc cột 'Đã sửa xong' trong dữ liệu.", sort=True,
+    ),
+    export_name=lambda p: f"bao_hanh_{p['product_name']}.xlsx",
+))
+register_report(ReportDef(
+    "customers_by_product", "Khách hàng gửi bảo hành bao nhiêu tính theo sản phẩm", ROLES_ALL,
+    run=lambda ctx, product_name: q.query_16_top_customers_by_product(ctx["data"], product_name, schema=ctx["schema"]),
+    params=_select_param(
+        "product_name", "sản phẩm", "📦 Chọn sản phẩm", ["sản phẩm"],
+        "❌ Không tìm thấy cột tên sản phẩm trong dữ liệu.", sort=True,
+    ),
+    export_name=lambda p: f"top_khach_{p['product_name']}.xlsx",
+))
+register_report(ReportDef(
+    "products_by_customer", "Sản phẩm nhận bảo hành bao nhiêu tính theo khách hàng", ROLES_ALL,
+    run=lambda ctx, customer_name: q.query_5_top_products_by_customer(ctx["data"], customer_name, top_n=30, schema=ctx["schema"]),
+    params=_select_param(
+        "customer_name", "tên khách hàng", "👤 Chọn khách hàng", ["tên khách hàng", "sản phẩm"],
+        "❌ Không tìm thấy cột 'tên khách hàng' hoặc 'sản phẩm' trong dữ liệu.", sort=True,
+    ),
+    export_name=lambda p: f"top_san_pham_{p['customer_name']}.xlsx",
+))
@@ -0,0 +1,130 @@
+import heapq
+
+import numpy as np
+import pandas as pd
+
+from rma_utils import clean_text, clean_text_many
+
+EMPTY_POSITIONS = np.array([], dtype=np.int64)
+
+
+def _trigram_codes(buffer):
+    # Mỗi trigram (3 byte UTF-8 liên tiếp) gói vào một số nguyên 24 bit
+    b = buffer.astype(np.int32)
+    return (b[:-2] << 16) | (b[1:-1] << 8) | b[2:]
+
+
+class SearchIndex:
+    """
+    Chỉ mục trigram trên các giá trị khác nhau của một cột (khách hàng, sản phẩm, serial...).
+    - Khoá tìm là clean_text(giá trị): bỏ dấu, chữ thường, nên "cong ty" tìm được "Công ty".
+    - Từ khoá khớp khi là chuỗi con của khoá; trigram chỉ dùng để thu hẹp ứng viên.
+    - Mỗi giá trị ánh xạ thẳng tới vị trí các dòng chứa nó.
+    """
+    def __init__(self, series):
+        codes, uniques = pd.factorize(series)
+        self.codes = codes
+        self.values = [str(v) for v in uniques]
+        self.keys = clean_text_many(self.values)
+        self.counts = np.bincount(codes[codes >= 0], minlength=len(self.values))
+
+        # Vị trí dòng theo từng giá trị (dạng CSR): order[offsets[i]:offsets[i + 1]]
+        self.order = np.argsort(codes, kind="stable")[np.count_nonzero(codes < 0):]
+        self.offsets = np.concatenate([[0], np.cumsum(self.counts)])
+
+        self._build_trigrams()
+
+    def _build_trigrams(self):
+        encoded = [key.encode("utf-8") for key in self.keys]
+        lengths = np.fromiter((len(e) for e in encoded), dtype=np.int64, count=len(encoded))
+        buffer = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        if len(buffer) < 3:
+            self.trigrams = np.array([], dtype=np.int32)
+            self.postings = np.array([], dtype=np.int32)
+            self.trigram_offsets = np.array([0], dtype=np.int64)
+            return
+
+        # Chỉ giữ trigram nằm trọn trong một khoá (không vắt qua khoá kế tiếp)
+        owner = np.repeat(np.arange(len(encoded), dtype=np.int64), lengths)
+        position = np.arange(len(buffer)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        valid = (position <= np.repeat(lengths, lengths) - 3)[:-2]
+        pairs = (_trigram_codes(buffer)[valid].astype(np.int64) << 32) | owner[:-2][valid]
+        # Sắp theo trigram rồi theo giá trị, bỏ trùng (sort nhanh hơn np.unique dạng hash)
+        pairs.sort()
+        pairs = pairs[np.concatenate([[True], pairs[1:] != pairs[:-1]])]
+
+        trigram_of_pair = (pairs >> 32).astype(np.int32)
+        self.trigrams, starts = np.unique(trigram_of_pair, return_index=True)
+        self.postings = (pairs & 0xFFFFFFFF).astype(np.int32)
+        self.trigram_offsets = np.append(starts, len(pairs))
+
+    def _candidates(self, key):
+        encoded = np.frombuffer(key.encode("utf-8"), dtype=np.uint8)
+        if len(encoded) < 3:
+            return None  # từ khoá quá ngắn: xét mọi giá trị
+        wanted = np.unique(_trigram_codes(encoded))
+        slots = np.searchsorted(self.trigrams, wanted)
+        if (slots >= len(self.trigrams)).any() or (self.trigrams[np.minimum(slots, len(self.trigrams) - 1)] != wanted).any():
+            return np.array([], dtype=np.int32)
+        lists = sorted(
+            (self.postings[self.trigram_offsets[s]:self.trigram_offsets[s + 1]] for s in slots),
+            key=len,
+        )
+        result = lists[0]
+        for other in lists[1:]:
+            if not len(result):
+                break
+            result = np.intersect1d(result, other, assume_unique=True)
+        return result
+
+    def match(self, keyword):
+        """Mã các giá trị có khoá chứa từ khoá (đã bỏ dấu)."""
+        key = clean_text(keyword)
+        if not key:
+            return np.array([], dtype=np.int64)
+        candidates = self._candidates(key)
+        if candidates is None:
+            candidates = range(len(self.keys))
+        return np.array([i for i in candidates if key in self.keys[i]], dtype=np.int64)
+
+    def suggest(self, keyword, limit=5):
+        """
+        Gợi ý xếp hạng: khớp hoàn toàn, khớp đầu chuỗi, khớp đầu một từ, rồi khớp giữa chừng;
+        cùng hạng thì giá trị xuất hiện nhiều hơn, ngắn hơn đứng trước.
+        """
+        key = clean_text(keyword)
+        matches = self.match(keyword)
+
+        def rank(i):
+            value_key = self.keys[i]
+            if value_key == key:
+                level = 0
+            elif value_key.startswith(key):
+                level = 1
+            elif (" " + key) in value_key:
+                level = 2
+            else:
+                level = 3
+            return level, -self.counts[i], len(value_key)
+
+        return [self.values[i] for i in heapq.nsmallest(limit, matches, key=rank)]
+
+    def positions(self, keyword):
+        """Vị trí (tăng dần) các dòng có giá trị khớp từ khoá."""
+        matches = self.match(keyword)
+        if not len(matches):
+            return EMPTY_POSITIONS
+        if len(matches) * 8 > len(self.values):
+            # Khớp nhiều giá trị: quét mã một lượt rẻ hơn ghép từng danh sách
+            hits = np.zeros(len(self.values) + 1, dtype=bool)
+            hits[matches] = True
+            return np.flatnonzero(hits[self.codes])
+        parts = [self.order[self.offsets[i]:self.offsets[i + 1]] for i in matches]
+        return np.sort(np.concatenate(parts))
+
+    def filter_rows(self, rows, keyword):
+        """Giữ lại trong rows (vị trí tăng dần, None = mọi dòng) các dòng khớp từ khoá."""
+        positions = self.positions(keyword)
+        if rows is None:
+            return positions
+        return np.intersect1d(rows, positions, assume_unique=True)
@@ -0,0 +1,156 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+EMPTY_POSITIONS = np.array([], dtype=np.int64)
+_PREFIX_END = "\U0010ffff"  # ký tự lớn nhất: mọi khoá bắt đầu bằng prefix đều < prefix + _PREFIX_END
+
+
+def normalize_serials(values):
+    """
+    Chuẩn hoá serial để so khớp: bỏ khoảng trắng, viết hoa; số nguyên đọc từ CSV (12345.0) về "12345".
+    Trả về Series object, ô trống/không hợp lệ là None.
+    """
+    values = pd.Series(values)
+    if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        text = values.map(lambda v: str(int(v)) if pd.notna(v) and float(v).is_integer() else str(v))
+    else:
+        text = values.astype(str)
+    text = text.str.replace(r"\s+", "", regex=True).str.upper()
+    text = text.astype(object).where(values.notna() & (text != ""), None)
+    return text
+
+
+class SerialIndex:
+    """
+    Chỉ mục serial dựng một lần khi tải dữ liệu (dùng chung, chỉ đọc):
+    - keys: các serial đã chuẩn hoá theo thứ tự xuất hiện; mã của serial là vị trí trong keys
+    - codes: mã serial của từng dòng (-1 = trống); counts: số lần gặp của từng serial
+    - vị trí các dòng theo từng serial dạng CSR: order[offsets[i]:offsets[i + 1]]
+    Tra chính xác qua dict; tra theo tiền tố qua bản sắp xếp của keys (dựng khi cần lần đầu).
+    """
+    def __init__(self, series=None, _state=None):
+        if _state is None:
+            codes, uniques = pd.factorize(pd.Series(series) if series is not None else pd.Series([], dtype=object))
+            # Gộp các cách viết khác nhau của cùng một serial (thứ tự xuất hiện được giữ nguyên)
+            key_codes, keys = pd.factorize(normalize_serials(pd.Series(uniques, dtype=uniques.dtype)))
+            keys = np.asarray(keys, dtype=object)
+            _state = (keys, np.append(key_codes, -1)[codes].astype(np.int32), None)
+        self.keys, self.codes, self._code = _state
+        if self._code is None:
+            self._code = dict(zip(self.keys, range(len(self.keys))))
+        self.n_rows = len(self.codes)
+        valid = self.codes >= 0
+        self.counts = np.bincount(self.codes[valid], minlength=len(self.keys))
+        self.order = np.argsort(self.codes, kind="stable")[np.count_nonzero(~valid):]
+        self.offsets = np.concatenate([[0], np.cumsum(self.counts)])
+        self._sorted = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.keys)
+
+    # === Tra cứu ===
+    def code(self, serial):
+        """Mã của serial (đã chuẩn hoá), -1 nếu không có."""
+        return self._code.get(normalize_serials([serial])[0], -1)
+
+    def count(self, serial):
+        code = self.code(serial)
+        return int(self.counts[code]) if code >= 0 else 0
+
+    def lookup(self, serial):
+        """Vị trí (tăng dần) các dòng có đúng serial này."""
+        code = self.code(serial)
+        if code < 0:
+            return EMPTY_POSITIONS
+        return self.order[self.offsets[code]:self.offsets[code + 1]]
+
+    def _sorted_keys(self):
+        # (mã sắp theo khoá, khoá đã sắp); sắp trên kiểu str (Arrow) nhanh hơn argsort mảng object,
+        # thứ tự theo mã ký tự giống so sánh chuỗi Python mà searchsorted dùng
+        if self._sorted is None:
+            with self._lock:
+                if self._sorted is None:
+                    by_key = pd.Series(self.keys, dtype="str").argsort().to_numpy()
+                    self._sorted = (by_key, self.keys[by_key])
+        return self._sorted
+
+    def prefix_codes(self, prefix):
+        """Mã các serial bắt đầu bằng prefix."""
+        key = normalize_serials([prefix])[0]
+        if key is None:
+            return np.arange(0)
+        by_key, sorted_keys = self._sorted_keys()
+        lo = np.searchsorted(sorted_keys, key, side="left")
+        hi = np.searchsorted(sorted_keys, key + _PREFIX_END, side="left")
+        return by_key[lo:hi]
+
+    def prefix(self, prefix, limit=None):
+        """Các serial bắt đầu bằng prefix kèm số lần gặp, nhiều lần nhất trước."""
+        codes = np.sort(self.prefix_codes(prefix))
+        codes = codes[np.argsort(-self.counts[codes], kind="stable")]
+        if limit is not None:
+            codes = codes[:limit]
+        return [(self.keys[c], int(self.counts[c])) for c in codes]
+
+    def prefix_positions(self, prefix):
+        codes = self.prefix_codes(prefix)
+        if not len(codes):
+            return EMPTY_POSITIONS
+        return np.sort(np.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c in codes]))
+
+    # === Serial gửi nhiều lần ===
+    def repeats(self, min_count=2, rows=None):
+        """
+        Serial gặp ít nhất min_count lần, trong toàn bộ dữ liệu hoặc chỉ trong rows (vị trí tăng dần).
+        Trả về (codes, counts, positions): serial xếp theo số lần giảm dần, cùng số lần thì serial
+        xuất hiện trước đứng trước; positions là vị trí các dòng của chúng theo đúng thứ tự đó.
+        """
+        if rows is None:
+            sub, counts = self.codes, self.counts
+        else:
+            rows = np.asarray(rows, dtype=np.int64)
+            sub = self.codes[rows]
+            counts = np.bincount(sub[sub >= 0], minlength=len(self.keys))
+        codes = np.flatnonzero(counts >= min_count)
+        if not len(codes):
+            return codes, counts[codes], EMPTY_POSITIONS
+        if rows is None:
+            # Mã theo thứ tự xuất hiện nên sắp ổn định theo số lần là đủ
+            codes = codes[np.argsort(-counts[codes], kind="stable")]
+            positions = np.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c in codes])
+            return codes, counts[codes], positions
+
+        uniq, first_local = np.unique(sub, return_index=True)
+        first = np.full(len(self.keys), len(rows), dtype=np.int64)
+        first[uniq[uniq >= 0]] = first_local[uniq >= 0]
+        codes = codes[np.lexsort((first[codes], -counts[codes]))]
+        rank = np.full(len(self.keys) + 1, -1, dtype=np.int64)
+        rank[codes] = np.arange(len(codes))
+        row_rank = rank[sub]
+        selected = np.flatnonzero(row_rank >= 0)
+        selected = selected[np.argsort(row_rank[selected], kind="stable")]
+        return codes, counts[codes], rows[selected]
+
+    # === Cập nhật khi có dòng mới ===
+    def extended(self, series):
+        """
+        Chỉ mục mới sau khi nối thêm các dòng series vào cuối bảng (vị trí tiếp theo n_rows).
+        Chỉ chuẩn hoá các dòng mới; mã serial cũ giữ nguyên, serial mới nhận mã tiếp theo.
+        Chỉ mục cũ không bị sửa nên các phiên đang đọc không bị ảnh hưởng.
+        """
+        added = SerialIndex(series)
+        lookup = self._code.copy()
+        mapping = np.empty(len(added.keys) + 1, dtype=np.int32)
+        mapping[-1] = -1
+        new_keys = []
+        for i, key in enumerate(added.keys):
+            code = lookup.get(key)
+            if code is None:
+                code = lookup[key] = len(self.keys) + len(new_keys)
+                new_keys.append(key)
+            mapping[i] = code
+        keys = np.concatenate([self.keys, np.array(new_keys, dtype=object)]) if new_keys else self.keys
+        return SerialIndex(_state=(keys, np.concatenate([self.codes, mapping[added.codes]]), lookup))
@@ -0,0 +1,544 @@
+import argparse
+import hmac
+import inspect
+import json
+import os
+import re
+import signal
+import threading
+from datetime import date, datetime
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+import numpy as np
+import pandas as pd
+
+from intent_handler import handle_intent
+from rma_ai import chuan_hoa_ten_cot, query_openai
+from rma_cube import build_cube, cube_for_date_range
+from rma_entities import ENTITY_FIELDS, EntityResolver
+from rma_export import EXPORT_FORMATS, cached_export_bytes, filter_fingerprint
+from rma_filters import FilterEngine
+from rma_loader import SHEET_URL, enable_copy_on_write, get_derived, load_source
+from rma_reports import ROLES_ALL, compute_dashboard, dashboard_context, dashboard_reports, get_report, reports_for_role
+from rma_serials import SerialIndex
+from rma_turnaround import TurnaroundEngine
+from rma_utils import get_schema
+
+# === Dịch vụ HTTP (JSON) không cần Streamlit: báo cáo, hỏi đáp intent/AI, xuất dòng đã lọc ===
+# Chạy: python rma_service.py --port 8000 --workers 4
+#   hoặc gunicorn -w 4 -k gthread --threads 8 "rma_service:app"
+# Mỗi worker tải dữ liệu một lần (load_sheet dùng chung theo TTL) và giữ cube/chỉ mục theo phiên bản dữ liệu.
+# Quyền như app Streamlit: mỗi token một vai trò, header "Authorization: Bearer <token>".
+#   RMA_SERVICE_TOKENS="admin:<token1>,mod:<token2>,user:<token3>"; RMA_SERVICE_TOKEN=<token> là token admin.
+# Không đặt token nào thì chỉ nhận request từ máy cục bộ (loopback, quyền admin) và không mở trên host khác.
+SERVICE_HOST = os.getenv("RMA_SERVICE_HOST", "127.0.0.1")
+SERVICE_PORT = int(os.getenv("RMA_SERVICE_PORT", "8000"))
+SERVICE_WORKERS = int(os.getenv("RMA_SERVICE_WORKERS", "1"))
+SERVICE_TOKEN = os.getenv("RMA_SERVICE_TOKEN")
+
+
+def _parse_tokens(spec, admin_token=None):
+    """"admin:abc,mod:def" -> {token: vai trò}; vai trò không hợp lệ thì báo lỗi khi khởi động."""
+    tokens = {admin_token: "admin"} if admin_token else {}
+    for item in (spec or "").split(","):
+        if not item.strip():
+            continue
+        role, _, token = item.strip().partition(":")
+        if role not in ROLES_ALL or not token:
+            raise ValueError(f"RMA_SERVICE_TOKENS không hợp lệ: {item.strip()!r} (dạng <vai trò>:<token>)")
+        tokens[token] = role
+    return tokens
+
+
+SERVICE_TOKENS = _parse_tokens(os.getenv("RMA_SERVICE_TOKENS"), SERVICE_TOKEN)
+LOOPBACK_HOSTS = ("127.0.0.1", "::1", "localhost")
+ROLE_ARG = "_role"  # vai trò của request, do server gán sau khi đọc tham số (client không tự đặt được)
+SERVICE_PAGE_ROWS = int(os.getenv("RMA_SERVICE_PAGE_ROWS", "1000"))  # số dòng JSON mặc định mỗi trang
+SERVICE_MAX_ROWS = int(os.getenv("RMA_SERVICE_MAX_ROWS", "10000"))  # tối đa cho ?limit=
+MAX_BODY_BYTES = 1024 * 1024
+
+# Các luồng xử lý request đọc chung một bản dữ liệu (gunicorn import thẳng module này, không qua main)
+enable_copy_on_write()
+
+STATUS_TEXT = {
+    200: "200 OK",
+    400: "400 Bad Request",
+    401: "401 Unauthorized",
+    403: "403 Forbidden",
+    404: "404 Not Found",
+    405: "405 Method Not Allowed",
+    413: "413 Payload Too Large",
+    500: "500 Internal Server Error",
+    503: "503 Service Unavailable",
+}
+
+
+class ServiceError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class Dataset:
+    """Dữ liệu của một phiên bản kèm schema, bộ lọc, cube, chỉ mục serial và thời gian xử lý (dùng chung, chỉ đọc)."""
+    def __init__(self, data, version):
+        self.data = data
+        self.version = version
+        self.schema = get_schema(data.columns)
+        # Cùng tên với các bước dẫn xuất trong nwh_rma_app để dùng chung khi chạy chung process
+        self.engine = get_derived(version, "filters", lambda: FilterEngine(data, self.schema))
+        self.cube = get_derived(version, "cube", lambda: build_cube(data, self.schema))
+        col_serial = self.schema.find("serial")
+        self.serials = get_derived(version, "serials", lambda: SerialIndex(data[col_serial])) if col_serial else None
+        self.turnaround = get_derived(version, "turnaround", lambda: TurnaroundEngine(data, self.schema, filters=self.engine))
+        self.df_raw = get_derived(version, "df_raw", lambda: chuan_hoa_ten_cot(data))
+        self.entities = get_derived(version, "entities", lambda: EntityResolver(data, self.schema))
+
+
+def current_dataset():
+    data, version = load_source(SHEET_URL)
+    if data.empty:
+        raise ServiceError(503, "Chưa có dữ liệu")
+    return get_derived(version, "service_dataset", lambda: Dataset(data, version))
+
+
+# === Đọc tham số (query string + JSON body) ===
+def _values(args, name, cast=str):
+    """Danh sách giá trị: ?years=2023,2024, lặp lại ?years=2023&years=2024 hoặc mảng JSON."""
+    value = args.get(name)
+    if value is None or value == "":
+        return []
+    items = value if isinstance(value, list) else [value]
+    out = []
+    for item in items:
+        parts = item.split(",") if isinstance(item, str) and cast is not str else [item]
+        for part in parts:
+            if isinstance(part, str):
+                part = part.strip()
+                if not part:
+                    continue
+            try:
+                out.append(cast(part))
+            except (TypeError, ValueError):
+                raise ServiceError(400, f"Giá trị không hợp lệ cho '{name}': {part}")
+    return out
+
+
+def _int_arg(args, name, default):
+    values = _values(args, name, int)
+    return values[0] if values else default
+
+
+def _date_arg(args, name):
+    values = _values(args, name)
+    if not values:
+        return None
+    try:
+        return pd.Timestamp(values[0]).date()
+    except ValueError:
+        raise ServiceError(400, f"Ngày không hợp lệ cho '{name}': {values[0]}")
+
+
+def _flag(args, name):
+    values = _values(args, name)
+    return bool(values) and str(values[0]).lower() in ("1", "true", "yes", "on")
+
+
+def filter_rows(dataset, args):
+    """
+    Vị trí dòng và cube theo bộ lọc giống sidebar + tab 3:
+    years/months/quarters, date_from/date_to (ngày tiếp nhận), nhom (nhóm hàng), isin={cột: [giá trị]}.
+    cube=None khi bộ lọc không gộp được từ cube (báo cáo tự tính trên dòng thô).
+    """
+    engine, schema = dataset.engine, dataset.schema
+    years, months, quarters = _values(args, "years", int), _values(args, "months", int), _values(args, "quarters", int)
+    date_from, date_to = _date_arg(args, "date_from"), _date_arg(args, "date_to")
+    isin = args.get("isin") or {}
+    if not isinstance(isin, dict):
+        raise ServiceError(400, "isin phải là object {cột: [giá trị]}")
+    isin = {col: values if isinstance(values, list) else [values] for col, values in isin.items()}
+    unknown = [col for col in isin if col not in dataset.data.columns]
+    if unknown:
+        raise ServiceError(400, "Không có cột: " + ", ".join(unknown))
+
+    cube = dataset.cube
+    col_nhom = schema.find("nhóm hàng")
+    nhoms = _values(args, "nhom")
+    if nhoms:
+        if not col_nhom:
+            raise ServiceError(400, "Không có cột nhóm hàng")
+        isin[col_nhom] = nhoms
+
+    date_range = None
+    if date_from or date_to:
+        index = engine.date_index
+        if index is None or index.min is None:
+            raise ServiceError(400, "Không có cột ngày tiếp nhận")
+        date_range = (date_from or index.min.date(), date_to or index.max.date())
+        if cube is not None:
+            cube = cube_for_date_range(cube, date_range[0], date_range[1], index.min, index.max)
+
+    for col, values in (("Năm", years), ("Tháng", months), ("Quý", quarters)):
+        if values and cube is not None:
+            cube = cube.where(col, values) if cube.has(col) else None
+    for col, values in isin.items():
+        if values and cube is not None:
+            cube = cube.where(col, values) if cube.has(col) else None
+
+    filtered = years or months or quarters or date_range or any(isin.values())
+    rows = engine.positions(years=years, months=months, quarters=quarters, date_range=date_range, isin=isin) if filtered else None
+    return rows, cube, nhoms
+
+
+def report_context(dataset, args):
+    rows, cube, nhoms = filter_rows(dataset, args)
+    return {
+        "data": dataset.engine.take(rows),
+        "schema": dataset.schema,
+        "cube": cube,
+        "selected_nhoms": nhoms,
+        "rows": rows,
+        "serials": dataset.serials,
+        "turnaround": dataset.turnaround,
+        "version": dataset.version,
+    }
+
+
+def report_params(report):
+    """Tên tham số của report.run (bỏ ctx) — thay cho widget chọn tham số ở tab 3."""
+    return list(inspect.signature(report.run).parameters)[1:]
+
+
+# === Chuyển kết quả sang JSON ===
+def _json_default(value):
+    if value is pd.NA or value is pd.NaT:
+        return None
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.floating):
+        return None if np.isnan(value) else float(value)
+    if isinstance(value, (pd.Timestamp, datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def frame_payload(df, offset=0, limit=None):
+    """{"columns", "data", "total"}: bảng theo trang, ngày dạng ISO, ô trống là null."""
+    total = len(df)
+    page = df.iloc[offset:offset + limit] if limit is not None else df.iloc[offset:]
+    split = json.loads(page.to_json(orient="split", index=False, date_format="iso", force_ascii=False))
+    return {"columns": [str(col) for col in page.columns], "data": split["data"], "total": total}
+
+
+# === Định tuyến ===
+ROUTES = []
+
+
+def route(methods, pattern):
+    """Đăng ký một endpoint; hàm nhận (args, *nhóm trong pattern) và trả về dict JSON hoặc (bytes, mime, tên file)."""
+    def decorator(func):
+        ROUTES.append((methods, re.compile(f"^{pattern}$"), func))
+        return func
+    return decorator
+
+
+@route(("GET",), "/health")
+def _health(args):
+    dataset = current_dataset()
+    return {"status": "ok", "version": dataset.version, "rows": len(dataset.data), "pid": os.getpid()}
+
+
+@route(("GET",), "/reports")
+def _list_reports(args):
+    return {"reports": [
+        {
+            "key": report.key,
+            "label": report.label,
+            "roles": list(report.roles),
+            "params": report_params(report),
+            "dashboard": report.dashboard is not None,
+        }
+        for report in reports_for_role(args[ROLE_ARG])
+    ]}
+
+
+@route(("GET", "POST"), "/reports/([\\w-]+)")
+def _run_report(args, key):
+    report = get_report(key)
+    if report is None:
+        raise ServiceError(404, f"Không có báo cáo '{key}'")
+    if args[ROLE_ARG] not in report.roles:
+        raise ServiceError(403, f"Vai trò '{args[ROLE_ARG]}' không được xem báo cáo '{key}'")
+    params = args.get("params") or {}
+    if not isinstance(params, dict):
+        raise ServiceError(400, "params phải là object JSON {tên: giá trị}")
+    params = dict(params)
+    dataset = current_dataset()
+    ctx = report_context(dataset, args)
+    for name in report_params(report):
+        values = _values(args, name) if name not in params else []
+        if values:
+            params[name] = values[0]  # ?name= rỗng coi như thiếu tham số (báo lỗi 400 bên dưới)
+    # Như widget ở tab 3: báo cáo theo nhóm hàng dùng nhóm duy nhất đang lọc
+    if "selected_group" in report_params(report) and "selected_group" not in params and len(ctx["selected_nhoms"]) == 1:
+        params["selected_group"] = ctx["selected_nhoms"][0]
+    missing = [name for name in report_params(report) if name not in params]
+    if missing:
+        raise ServiceError(400, "Thiếu tham số: " + ", ".join(missing))
+    title, df_out = report.run(ctx, **params)
+    return {"report": key, "title": title, "version": dataset.version, **frame_payload(df_out)}
+
+
+@route(("GET", "POST"), "/dashboard")
+def _run_dashboard(args):
+    dataset = current_dataset()
+    shared = dashboard_context(report_context(dataset, args))
+    results = compute_dashboard(dashboard_reports(args[ROLE_ARG]), shared)
+    return {"version": dataset.version, "reports": [
+        {"report": report.key, "title": title, **frame_payload(df_out)}
+        for report, title, df_out in results
+    ]}
+
+
+@route(("GET", "POST"), "/ask")
+def _ask(args):
+    """
+    Hỏi đáp như tab 2: ai=1 thì câu không nhận ra intent được gửi OpenAI (cần OPENAI_API_KEY),
+    mặc định chỉ trả lời bằng intent.
+    """
+    question = (_values(args, "question") or [""])[0].strip()
+    if not question:
+        raise ServiceError(400, "Thiếu câu hỏi (question)")
+    dataset = current_dataset()
+    if not _flag(args, "ai"):
+        df_result, answer, intent = handle_intent(question, dataset.df_raw, version=dataset.version,
+                                                  resolver=dataset.entities)
+        return {"intent": intent, "answer": answer, "rows": len(df_result), "version": dataset.version}
+    rows, _, _ = filter_rows(dataset, args)
+    answer, info = query_openai(
+        user_question=question,
+        df_summary=dataset.engine.take(rows),
+        df_raw=dataset.df_raw,
+        api_key=os.getenv("OPENAI_API_KEY"),
+        data_version=dataset.version,
+        use_cache=not (args[ROLE_ARG] == "admin" and _flag(args, "no_cache")),  # như tab 2: chỉ admin bỏ qua cache
+        max_rows=_int_arg(args, "max_rows", 200),
+        resolver=dataset.entities,
+    )
+    info = info or {}
+    return {"intent": info.get("intent"), "answer": answer, "cache": info.get("cache"), "version": dataset.version}
+
+
+@route(("GET", "POST"), "/entities")
+def _entities(args):
+    """Tên đúng trong dữ liệu cho một từ khoá (kind=customer|product|ktv, bỏ dấu, chịu sai chính tả) hoặc cả câu hỏi."""
+    dataset = current_dataset()
+    question = (_values(args, "question") or [""])[0].strip()
+    if question:
+        return {"mentions": dataset.entities.mentions(question), "version": dataset.version}
+    text = (_values(args, "q") or [""])[0].strip()
+    kind = (_values(args, "kind") or ["customer"])[0]
+    if kind not in ENTITY_FIELDS:
+        raise ServiceError(400, "kind phải là một trong: " + ", ".join(ENTITY_FIELDS))
+    if not text:
+        raise ServiceError(400, "Thiếu từ khoá (q) hoặc câu hỏi (question)")
+    matches = dataset.entities.resolve(kind, text, limit=min(max(_int_arg(args, "limit", 5), 1), 50))
+    return {
+        "kind": kind,
+        "matches": [{"value": value, "score": score, "rows": rows} for value, score, rows in matches],
+        "version": dataset.version,
+    }
+
+
+@route(("GET", "POST"), "/rows")
+def _rows(args):
+    dataset = current_dataset()
+    rows, _, _ = filter_rows(dataset, args)
+    offset = max(_int_arg(args, "offset", 0), 0)
+    limit = min(max(_int_arg(args, "limit", SERVICE_PAGE_ROWS), 0), SERVICE_MAX_ROWS)
+    # Chỉ lấy các dòng của trang, không tạo cả bảng đã lọc
+    page_rows = rows[offset:offset + limit] if rows is not None else np.arange(offset, min(offset + limit, len(dataset.data)))
+    payload = frame_payload(dataset.data.take(page_rows))
+    payload.update(total=len(rows) if rows is not None else len(dataset.data), offset=offset, version=dataset.version)
+    return payload
+
+
+@route(("GET", "POST"), "/export")
+def _export(args):
+    fmt = (_values(args, "format") or ["csv"])[0]
+    if fmt not in EXPORT_FORMATS:
+        raise ServiceError(400, "format phải là một trong: " + ", ".join(EXPORT_FORMATS))
+    dataset = current_dataset()
+    rows, _, _ = filter_rows(dataset, args)
+    # Dùng chung cache file xuất với giao diện Streamlit
+    cache_key = ("service_rows", filter_fingerprint(rows), dataset.version)
+    payload = cached_export_bytes({"RMA_Loc": dataset.engine.take(rows)}, fmt, cache_key)
+    return payload, EXPORT_FORMATS[fmt][1], f"RMA_Ketqua_Loc.{fmt}"
+
+
+# === Ứng dụng WSGI ===
+def _request_role(environ):
+    """Vai trò của request theo token; không cấu hình token thì chỉ máy cục bộ (quyền admin). None = từ chối."""
+    if not SERVICE_TOKENS:
+        return "admin" if environ.get("REMOTE_ADDR") in LOOPBACK_HOSTS else None
+    header = environ.get("HTTP_AUTHORIZATION", "")
+    role = None
+    for token, token_role in SERVICE_TOKENS.items():
+        # So hết mọi token (không dừng sớm) để thời gian trả lời không lộ token nào gần đúng
+        if hmac.compare_digest(header, f"Bearer {token}"):
+            role = token_role
+    return role
+
+
+def _read_args(environ):
+    args = {}
+    for name, values in parse_qs(environ.get("QUERY_STRING", "")).items():
+        args[name] = values if len(values) > 1 else values[0]
+    if environ.get("REQUEST_METHOD") == "POST":
+        try:
+            length = int(environ.get("CONTENT_LENGTH") or 0)
+        except ValueError:
+            length = 0
+        if length > MAX_BODY_BYTES:
+            raise ServiceError(413, "Body quá lớn")
+        if length:
+            try:
+                body = json.loads(environ["wsgi.input"].read(length).decode("utf-8"))
+            except ValueError:
+                raise ServiceError(400, "Body không phải JSON hợp lệ")
+            if not isinstance(body, dict):
+                raise ServiceError(400, "Body JSON phải là object")
+            args.update(body)
+    return args
+
+
+def _dispatch(method, path):
+    allowed = False
+    for methods, pattern, func in ROUTES:
+        match = pattern.match(path)
+        if match:
+            if method in methods:
+                return func, match.groups()
+            allowed = True
+    raise ServiceError(405 if allowed else 404, f"Không hỗ trợ {method} {path}")
+
+
+def app(environ, start_response):
+    method = environ.get("REQUEST_METHOD", "GET")
+    path = environ.get("PATH_INFO", "/").rstrip("/") or "/"
+    try:
+        role = _request_role(environ)
+        if role is None:
+            raise ServiceError(401, "Thiếu hoặc sai token")
+        func, groups = _dispatch(method, path)
+        args = _read_args(environ)
+        args[ROLE_ARG] = role
+        result = func(args, *groups)
+    except ServiceError as e:
+        status, result = e.status, {"error": str(e)}
+    except Exception as e:
+        print(f"❌ Lỗi xử lý {method} {path}:", e)
+        status, result = 500, {"error": f"{type(e).__name__}: {e}"}
+    else:
+        status = 200
+
+    if isinstance(result, tuple):
+        body, mime, filename = result
+        headers = [("Content-Type", mime), ("Content-Disposition", f'attachment; filename="{filename}"')]
+    else:
+        body = json.dumps(result, ensure_ascii=False, default=_json_default).encode("utf-8")
+        headers = [("Content-Type", "application/json; charset=utf-8")]
+    headers.append(("Content-Length", str(len(body))))
+    start_response(STATUS_TEXT.get(status, f"{status} Error"), headers)
+    return [body]
+
+
+# === Server đa luồng, nhiều worker process ===
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+    def get_request(self):
+        # Socket nghe có thể ở chế độ không chặn (nhiều worker); kết nối nhận được luôn để chặn
+        conn, addr = self.socket.accept()
+        conn.setblocking(True)
+        return conn, addr
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_request(self, code="-", size="-"):
+        # Chỉ ghi log các request lỗi
+        if str(code)[:1] not in ("2", "3"):
+            super().log_request(code, size)
+
+
+def _warm_up():
+    # Tải dữ liệu và dựng cube/chỉ mục ngay khi worker khởi động, không đợi request đầu tiên
+    try:
+        dataset = current_dataset()
+        print(f"✅ Worker {os.getpid()}: {len(dataset.data)} dòng, phiên bản {dataset.version}")
+    except Exception as e:
+        print(f"⚠️ Worker {os.getpid()} chưa tải được dữ liệu:", e)
+
+
+def _serve_worker(server):
+    threading.Thread(target=_warm_up, daemon=True).start()
+    server.serve_forever()
+
+
+def serve(host=SERVICE_HOST, port=SERVICE_PORT, workers=SERVICE_WORKERS):
+    """
+    Mở socket một lần rồi fork workers process cùng nhận kết nối (mỗi process đa luồng,
+    giữ dữ liệu riêng). Không có os.fork (Windows) thì chạy một process.
+    Không cấu hình token thì chỉ được mở trên loopback.
+    """
+    if not SERVICE_TOKENS and host not in LOOPBACK_HOSTS:
+        raise SystemExit(f"❌ Không mở dịch vụ trên {host} khi chưa đặt RMA_SERVICE_TOKEN/RMA_SERVICE_TOKENS")
+    server = make_server(host, port, app, server_class=ThreadingWSGIServer, handler_class=QuietHandler)
+    print(f"🚀 RMA service tại http://{host}:{port} ({workers} worker)")
+    if workers <= 1 or not hasattr(os, "fork"):
+        _serve_worker(server)
+        return
+
+    # Socket không chặn: worker không giành được kết nối thì quay lại chờ, không bị treo ở accept()
+    server.socket.setblocking(False)
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            try:
+                _serve_worker(server)
+            finally:
+                os._exit(0)
+        children.append(pid)
+    server.socket.close()
+
+    def stop(signum, frame):
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        for pid in children:
+            os.waitpid(pid, 0)
+    except KeyboardInterrupt:
+        stop(signal.SIGINT, None)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Dịch vụ HTTP JSON cho báo cáo, hỏi đáp và xuất dữ liệu RMA.")
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    parser.add_argument("--workers", type=int, default=SERVICE_WORKERS, help="số process phục vụ song song")
+    args = parser.parse_args(argv)
+    serve(args.host, args.port, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+import json
+import os
+import time
+
+import pandas as pd
+
+from rma_utils import concat_frames
+
+# Tăng số này khi thay đổi cách chuẩn hoá dữ liệu (cột dẫn xuất, kiểu dữ liệu...)
+# để các snapshot cũ tự bị coi là lỗi thời và được tạo lại.
+SNAPSHOT_FORMAT_VERSION = 6
+
+SNAPSHOT_DIR = os.getenv(
+    "RMA_SNAPSHOT_DIR",
+    os.path.join(os.getenv("RMA_CACHE_DIR", ".rma_cache"), "snapshot"),
+)
+MANIFEST_NAME = "manifest.json"
+SNAPSHOT_MAX_PARTS = 32  # số file nối thêm tối đa trước khi ghi lại toàn bộ
+
+
+def _parquet_available():
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def read_manifest(directory=SNAPSHOT_DIR):
+    path = os.path.join(directory, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def is_fresh(manifest, source_version=None):
+    """Snapshot dùng được khi cùng định dạng và (nếu có) cùng phiên bản nguồn."""
+    if not manifest or manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+        return False
+    if source_version is not None and manifest.get("source_version") != source_version:
+        return False
+    return True
+
+
+def _write_frame(df, directory, stem):
+    """Ghi một bảng ra stem.parquet (ưu tiên) hoặc stem.pkl, trả về (engine, tên file)."""
+    engine = None
+    file_name = None
+    if _parquet_available():
+        file_name = stem + ".parquet"
+        tmp_path = os.path.join(directory, file_name + ".tmp")
+        try:
+            df.to_parquet(tmp_path, index=False)
+            engine = "parquet"
+        except Exception as e:
+            print("⚠️ Không ghi được Parquet, chuyển sang pickle:", e)
+    if engine is None:
+        file_name = stem + ".pkl"
+        tmp_path = os.path.join(directory, file_name + ".tmp")
+        df.to_pickle(tmp_path)
+        engine = "pickle"
+    os.replace(tmp_path, os.path.join(directory, file_name))
+    return engine, file_name
+
+
+def _read_frame(directory, file_name):
+    path = os.path.join(directory, file_name)
+    if file_name.endswith(".parquet"):
+        return pd.read_parquet(path)
+    return pd.read_pickle(path)
+
+
+def _write_manifest(manifest, directory):
+    tmp_manifest = os.path.join(directory, MANIFEST_NAME + ".tmp")
+    with open(tmp_manifest, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_manifest, os.path.join(directory, MANIFEST_NAME))
+
+
+def _describe(df):
+    return {
+        "rows": len(df),
+        "columns": [str(c) for c in df.columns],
+        "dtypes": {str(c): str(t) for c, t in df.dtypes.items()},
+    }
+
+
+def write_snapshot(df, source_version, directory=SNAPSHOT_DIR):
+    """
+    Ghi bảng đã chuẩn hoá (ngày đã parse, có Năm/Tháng/Quý) ra file cột nhị phân.
+    Ưu tiên Parquet (pyarrow); nếu không có pyarrow hoặc cột có kiểu hỗn hợp thì ghi pickle.
+    Manifest được ghi sau cùng nên snapshot dở dang không bao giờ được đọc.
+    """
+    os.makedirs(directory, exist_ok=True)
+    engine, file_name = _write_frame(df, directory, "data")
+    manifest = {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "source_version": source_version,
+        "engine": engine,
+        "file": file_name,
+        "parts": [],
+        **_describe(df),
+        "created_at": time.time(),
+    }
+    _write_manifest(manifest, directory)
+    # Các phần nối thêm của snapshot trước không còn được manifest trỏ tới
+    for name in os.listdir(directory):
+        if name.startswith("part-"):
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+    return manifest
+
+
+def append_snapshot(df, added, source_version, base_version, directory=SNAPSHOT_DIR):
+    """
+    Nối các dòng added (đã cùng kiểu với df) vào snapshot của base_version dưới dạng một file phần mới,
+    không ghi lại toàn bộ; df là bảng đầy đủ sau khi nối, dùng để ghi lại từ đầu khi snapshot
+    không khớp hoặc đã có quá SNAPSHOT_MAX_PARTS phần.
+    """
+    manifest = read_manifest(directory)
+    parts = (manifest or {}).get("parts", [])
+    if (not is_fresh(manifest, base_version) or len(parts) >= SNAPSHOT_MAX_PARTS
+            or manifest.get("rows", 0) + len(added) != len(df)):
+        return write_snapshot(df, source_version, directory)
+    _, file_name = _write_frame(added, directory, f"part-{len(parts) + 1:04d}")
+    manifest.update({
+        "source_version": source_version,
+        "parts": parts + [file_name],
+        **_describe(df),
+        "created_at": time.time(),
+    })
+    _write_manifest(manifest, directory)
+    return manifest
+
+
+def read_snapshot(source_version=None, directory=SNAPSHOT_DIR):
+    """
+    Đọc snapshot nếu còn mới; trả về None khi thiếu, lỗi thời hoặc hỏng để bên gọi tạo lại.
+    source_version=None: chấp nhận bất kỳ phiên bản nguồn nào (dùng khi mất mạng).
+    """
+    manifest = read_manifest(directory)
+    if not is_fresh(manifest, source_version):
+        return None
+    try:
+        frames = [_read_frame(directory, name) for name in [manifest["file"]] + manifest.get("parts", [])]
+    except Exception as e:
+        print("⚠️ Snapshot hỏng, sẽ tạo lại:", e)
+        return None
+    df = concat_frames(frames) if len(frames) > 1 else frames[0]
+    if len(df) != manifest.get("rows") or [str(c) for c in df.columns] != manifest.get("columns"):
+        return None
+    return df
@@ -0,0 +1,187 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+# === Sinh dữ liệu RMA giả lập (giống Google Sheet thật) cho benchmark, chạy offline ===
+COLUMNS = [
+    "STT",
+    "Ngày tiếp nhận",
+    "Tên khách hàng",
+    "Sản phẩm",
+    "Nhóm hàng",
+    "Số serial",
+    "Tên lỗi (báo lỗi)",
+    "KTV",
+    "Loại dịch vụ",
+    "Đã sửa xong",
+    "Không sửa được",
+    "Từ chối bảo hành",
+    "Ngày trả khách",
+]
+
+CUSTOMER_PREFIXES = ["Công ty TNHH", "Công ty CP", "Cty", "Cửa hàng", "Trung tâm", "Tin học"]
+CUSTOMER_NAMES = [
+    "An Phát", "Hoàng Long", "Đức Minh", "Ngôi Sao", "Phúc Thịnh", "Thành Công", "Việt Tiến",
+    "Hưng Thịnh", "Minh Khoa", "Quang Trung", "Bảo Ngọc", "Đại Việt", "Tân Phú", "Kim Long",
+    "Sao Việt", "Hải Âu", "Trường Sơn", "Nam Á", "Phương Đông", "Ánh Dương",
+]
+CUSTOMER_CITIES = ["", " Hà Nội", " Đà Nẵng", " Sài Gòn", " Cần Thơ", " Hải Phòng", " Huế", " Nha Trang"]
+
+# nhóm hàng -> (tiền tố serial, sản phẩm)
+PRODUCT_GROUPS = {
+    "Thiết bị mạng": ("NW", [
+        "Router Wifi AX3000", "Router Wifi AC1200", "Switch 8 cổng", "Switch 24 cổng PoE",
+        "Bộ phát Mesh AX1800", "Modem quang GPON", "Access Point trần", "Card mạng USB",
+    ]),
+    "Camera": ("CM", [
+        "Camera IP Dome 2MP", "Camera IP Bullet 4MP", "Camera Wifi 360 độ", "Camera ngoài trời 5MP",
+        "Đầu ghi 8 kênh", "Đầu ghi 16 kênh", "Camera hành trình",
+    ]),
+    "Lưu trữ": ("ST", [
+        "Ổ cứng HDD 2TB", "Ổ cứng HDD 4TB", "SSD 512GB", "SSD NVMe 1TB", "NAS 2 khay", "USB 64GB",
+    ]),
+    "Máy tính": ("PC", [
+        "Laptop văn phòng 14 inch", "Laptop gaming 15 inch", "Màn hình 24 inch", "Màn hình 27 inch",
+        "Mini PC", "Bàn phím cơ", "Chuột không dây",
+    ]),
+    "Nguồn điện": ("PW", [
+        "Bộ lưu điện UPS 1000VA", "Bộ lưu điện UPS 2000VA", "Adapter 12V 2A", "Ổn áp 5KVA",
+    ]),
+}
+
+ERRORS = [
+    "Không lên nguồn", "Mất kết nối", "Lỗi firmware", "Chập chờn", "Không nhận ổ cứng",
+    "Hỏng cổng LAN", "Mất hình", "Nóng máy", "Kêu lạ", "Rớt mạng liên tục",
+    "Màn hình sọc", "Không sạc được", "Vỡ vỏ", "Lỗi bad sector", "Không nhận thẻ nhớ",
+]
+TECHNICIANS = ["Nguyễn Văn Tuấn", "Trần Minh Hùng", "Lê Quốc Đạt", "Phạm Thị Hoa", "Võ Thanh Sơn",
+               "Đặng Hữu Phước", "Bùi Anh Khoa", "Hồ Thị Lan"]
+SERVICE_TYPES = ["Bảo hành", "Sửa dịch vụ", "Đổi mới"]
+
+SIZES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+
+
+def _zipf_weights(n, s=1.1):
+    # Phân phối lệch: vài khách/sản phẩm chiếm phần lớn lượt gửi như dữ liệu thật
+    weights = 1.0 / np.arange(1, n + 1) ** s
+    return weights / weights.sum()
+
+
+def _customer_names(n_customers, rng):
+    names = []
+    seen = set()
+    while len(names) < n_customers:
+        name = (rng.choice(CUSTOMER_PREFIXES) + " " + rng.choice(CUSTOMER_NAMES)
+                + rng.choice(CUSTOMER_CITIES))
+        if name in seen:
+            name = f"{name} {len(names)}"
+        seen.add(name)
+        names.append(name)
+    return np.array(names, dtype=object)
+
+
+def _format_dates(days, start):
+    # Chỉ format mỗi ngày khác nhau một lần rồi ánh xạ ngược (dd/mm/yyyy như Google Sheet)
+    uniques, inverse = np.unique(days, return_inverse=True)
+    labels = (pd.Timestamp(start) + pd.to_timedelta(uniques, unit="D")).strftime("%d/%m/%Y")
+    return np.asarray(labels, dtype=object)[inverse]
+
+
+def generate_rma_frame(n_rows, seed=0, start="2022-01-01", years=3, repeat_rate=0.12,
+                       return_rate=0.85, n_customers=None):
+    """
+    Bảng RMA giả lập đúng định dạng sheet gốc (chưa qua ensure_time_columns):
+    ngày dd/mm/yyyy, cờ trạng thái 1/rỗng, serial lặp lại theo repeat_rate,
+    khách hàng và sản phẩm phân phối lệch (Zipf).
+    """
+    rng = np.random.default_rng(seed)
+    n_customers = n_customers or int(min(5000, max(50, n_rows // 40)))
+
+    customers = _customer_names(n_customers, rng)
+    customer_idx = rng.choice(n_customers, size=n_rows, p=_zipf_weights(n_customers))
+
+    product_names, product_groups, product_prefix = [], [], []
+    for group, (prefix, products) in PRODUCT_GROUPS.items():
+        product_names += products
+        product_groups += [group] * len(products)
+        product_prefix += [prefix] * len(products)
+    product_names = np.array(product_names, dtype=object)
+    order = rng.permutation(len(product_names))  # sản phẩm "hot" thay đổi theo seed
+    product_idx = order[rng.choice(len(product_names), size=n_rows, p=_zipf_weights(len(product_names), 0.9))]
+
+    # Ngày tiếp nhận tăng dần theo STT (sheet ghi theo thời gian), có dao động nhỏ
+    total_days = int(365 * years)
+    days = np.sort(rng.integers(0, total_days, size=n_rows))
+    days = np.clip(days + rng.integers(-2, 3, size=n_rows), 0, total_days - 1)
+
+    # Serial: phần lớn là mới, một phần là máy cũ gửi lại (cùng sản phẩm, cùng khách)
+    serial_num = rng.integers(10_000_000, 99_999_999, size=n_rows)
+    repeats = np.flatnonzero(rng.random(n_rows) < repeat_rate)
+    repeats = repeats[repeats > 0]
+    if len(repeats):
+        sources = (rng.random(len(repeats)) * repeats).astype(np.int64)
+        for target, source in zip(repeats, sources):
+            serial_num[target] = serial_num[source]
+            product_idx[target] = product_idx[source]
+            customer_idx[target] = customer_idx[source]
+    prefixes = np.array(product_prefix, dtype=object)[product_idx]
+    serials = prefixes + pd.Series(serial_num).astype(str).to_numpy(dtype=object)
+
+    # Trạng thái: chỉ máy đã trả khách mới có kết quả sửa chữa
+    returned = rng.random(n_rows) < return_rate
+    turnaround = np.ceil(rng.lognormal(mean=2.0, sigma=0.7, size=n_rows)).astype(np.int64)
+    status = rng.choice(3, size=n_rows, p=[0.75, 0.1, 0.15])
+    flags = {}
+    for value, col in enumerate(["Đã sửa xong", "Không sửa được", "Từ chối bảo hành"]):
+        flags[col] = np.where(returned & (status == value), 1.0, np.nan)
+
+    return_days = days + turnaround
+    return_dates = _format_dates(return_days, start)
+    return_dates[~returned] = None
+
+    error_p = _zipf_weights(len(ERRORS), 0.8)
+    errors = np.array(ERRORS, dtype=object)[rng.choice(len(ERRORS), size=n_rows, p=error_p)]
+    errors[rng.random(n_rows) < 0.03] = None  # một ít dòng bỏ trống như sheet thật
+
+    frame = pd.DataFrame({
+        "STT": np.arange(1, n_rows + 1),
+        "Ngày tiếp nhận": _format_dates(days, start),
+        "Tên khách hàng": customers[customer_idx],
+        "Sản phẩm": product_names[product_idx],
+        "Nhóm hàng": np.array(product_groups, dtype=object)[product_idx],
+        "Số serial": serials,
+        "Tên lỗi (báo lỗi)": errors,
+        "KTV": np.array(TECHNICIANS, dtype=object)[rng.choice(len(TECHNICIANS), size=n_rows)],
+        "Loại dịch vụ": np.array(SERVICE_TYPES, dtype=object)[rng.choice(3, size=n_rows, p=[0.7, 0.25, 0.05])],
+        **flags,
+        "Ngày trả khách": return_dates,
+    })
+    return frame[COLUMNS]
+
+
+def generate_rma_csv(n_rows, seed=0, **kwargs):
+    """Nội dung CSV (bytes UTF-8) giống file export của Google Sheet."""
+    return generate_rma_frame(n_rows, seed=seed, **kwargs).to_csv(index=False).encode("utf-8")
+
+
+def _parse_size(value):
+    return SIZES.get(value.lower()) or int(value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sinh file CSV RMA giả lập.")
+    parser.add_argument("size", help="số dòng hoặc 10k/100k/1m")
+    parser.add_argument("-o", "--output", default=None, help="đường dẫn file CSV (mặc định rma_<size>.csv)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    n_rows = _parse_size(args.size)
+    output = args.output or f"rma_{args.size}.csv"
+    with open(output, "wb") as f:
+        f.write(generate_rma_csv(n_rows, seed=args.seed))
+    print(f"✅ Đã ghi {n_rows} dòng vào {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from rma_dates import as_datetime
+from rma_utils import TURNAROUND_COL, ensure_turnaround_column, get_schema
+
+# === Thời gian xử lý (ngày trả khách - ngày tiếp nhận): phân vị, phân bố, SLA ===
+SLA_DAYS = int(os.getenv("RMA_SLA_DAYS", "14"))
+PERCENTILES = (50, 90, 95)
+HISTOGRAM_BINS = (0, 3, 7, 14, 30, 60)  # cận dưới của từng khoảng (ngày), khoảng cuối không có cận trên
+
+
+def _group_percentiles(codes, values, n_groups, qs):
+    """
+    Phân vị của values trong từng nhóm (nội suy tuyến tính như np.percentile) với một lần sắp xếp:
+    sắp theo (mã nhóm, giá trị), vị trí phân vị của nhóm g nằm trong đoạn [starts[g], starts[g] + counts[g]).
+    Nhóm rỗng trả NaN.
+    """
+    counts = np.bincount(codes, minlength=n_groups)
+    result = {q: np.full(n_groups, np.nan) for q in qs}
+    if not len(values):
+        return counts, result
+    sorted_values = values[np.lexsort((values, codes))].astype("float64")
+    starts = np.cumsum(counts) - counts
+    present = counts > 0
+    last = len(sorted_values) - 1
+    for q in qs:
+        pos = np.maximum(counts - 1, 0) * (q / 100)
+        lo = np.floor(pos).astype("int64")
+        hi = np.ceil(pos).astype("int64")
+        low = sorted_values[np.minimum(starts + lo, last)]
+        high = sorted_values[np.minimum(starts + hi, last)]
+        result[q] = np.where(present, low + (high - low) * (pos - lo), np.nan)
+    return counts, result
+
+
+def _today(today=None):
+    # Tính lúc gọi (không lúc dựng) vì engine được cache nhiều ngày theo phiên bản dữ liệu
+    return np.datetime64(pd.Timestamp(today if today is not None else "today").normalize(), "D")
+
+
+def _bin_labels(bins):
+    labels = [f"{lo}–{hi - 1} ngày" for lo, hi in zip(bins[:-1], bins[1:])]
+    return labels + [f"≥ {bins[-1]} ngày"]
+
+
+class TurnaroundEngine:
+    """
+    Thời gian xử lý dựng một lần cho mỗi phiên bản dữ liệu (dùng chung, chỉ đọc):
+    - days: số ngày xử lý của phiếu đã trả (int32, -1 = chưa trả/không hợp lệ), lấy từ cột TURNAROUND_COL
+    - received: ngày tiếp nhận (datetime64[D]) để tính tuổi phiếu đang mở so với hôm nay
+    Mọi thống kê nhận rows (vị trí dòng trong bảng gốc, None = toàn bộ) nên không cần tạo bảng đã lọc.
+    filters: FilterEngine của cùng bảng để dùng lại mã factorize của các cột nhóm.
+    """
+    def __init__(self, df, schema=None, filters=None):
+        schema = schema or get_schema(df.columns)
+        self.df = df
+        self.n_rows = len(df)
+        self.filters = filters
+        self.col_received = schema.find("ngay tiep nhan")
+        self.col_returned = schema.find("ngay tra khach")
+        self.available = bool(self.col_received and self.col_returned)
+        if not self.available:
+            self.days = np.full(self.n_rows, -1, dtype=np.int32)
+            self.closed = self.open = np.zeros(self.n_rows, dtype=bool)
+            self.received = np.full(self.n_rows, np.datetime64("NaT"), dtype="datetime64[D]")
+            return
+        if TURNAROUND_COL not in df.columns:
+            # Bảng không đi qua parse_sheet_bytes: tính trên bản nông, không sửa bảng dùng chung
+            df = ensure_turnaround_column(df.copy(deep=False), schema)
+        self.days = df[TURNAROUND_COL].to_numpy(dtype=np.int32, na_value=-1)
+        self.closed = self.days >= 0
+        self.received = as_datetime(df[self.col_received]).to_numpy(dtype="datetime64[D]")
+        returned = as_datetime(df[self.col_returned]).notna().to_numpy()
+        self.open = ~returned & ~np.isnat(self.received)
+
+    def _positions(self, mask, rows):
+        if rows is None:
+            return np.flatnonzero(mask)
+        return rows[mask[rows]]
+
+    def _codes(self, col):
+        if self.filters is not None:
+            return self.filters.codes(col)
+        codes, uniques = pd.factorize(self.df[col])
+        return codes, pd.Index(uniques)
+
+    def open_ages(self, positions, today=None):
+        """Tuổi (ngày) của các phiếu đang mở tại positions, tính tới hôm nay."""
+        return (_today(today) - self.received[positions]).astype("int64")
+
+    def summary(self, rows=None, sla=SLA_DAYS, today=None):
+        """Một dòng: số phiếu đã trả, trung bình, phân vị, lâu nhất, vượt SLA, phiếu mở và tuổi của chúng."""
+        closed = self._positions(self.closed, rows)
+        opened = self._positions(self.open, rows)
+        days = self.days[closed]
+        ages = self.open_ages(opened, today)
+        row = {"Số phiếu đã trả": len(days), "Trung bình (ngày)": None}
+        row.update({f"P{q} (ngày)": None for q in PERCENTILES})
+        row["Lâu nhất (ngày)"] = None
+        if len(days):
+            row["Trung bình (ngày)"] = round(float(days.mean()), 2)
+            for q, value in zip(PERCENTILES, np.percentile(days, PERCENTILES)):
+                row[f"P{q} (ngày)"] = round(float(value), 1)
+            row["Lâu nhất (ngày)"] = int(days.max())
+        row[f"Vượt SLA {sla} ngày"] = int((days > sla).sum())
+        row["Đang mở"] = len(ages)
+        row["Đang mở quá SLA"] = int((ages > sla).sum())
+        row["Tuổi phiếu mở lâu nhất (ngày)"] = int(ages.max()) if len(ages) else None
+        return pd.DataFrame([row])
+
+    def breakdown(self, col, rows=None, sla=SLA_DAYS, today=None):
+        """
+        Theo từng giá trị của col (khách hàng, sản phẩm, KTV...) trong một lượt nhóm:
+        số phiếu, trung bình, phân vị, lâu nhất, vượt SLA, phiếu mở và phiếu mở quá SLA.
+        """
+        codes, uniques = self._codes(col)
+        n_groups = len(uniques)
+
+        closed = self._positions(self.closed, rows)
+        closed = closed[codes[closed] >= 0]
+        closed_codes, days = codes[closed], self.days[closed]
+        counts, pct = _group_percentiles(closed_codes, days, n_groups, PERCENTILES + (100,))
+        sums = np.bincount(closed_codes, weights=days, minlength=n_groups)
+        breaches = np.bincount(closed_codes[days > sla], minlength=n_groups)
+
+        opened = self._positions(self.open, rows)
+        opened = opened[codes[opened] >= 0]
+        ages = self.open_ages(opened, today)
+        open_counts = np.bincount(codes[opened], minlength=n_groups)
+        open_over = np.bincount(codes[opened][ages > sla], minlength=n_groups)
+
+        keep = np.flatnonzero((counts > 0) | (open_counts > 0))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = sums / counts
+        out = pd.DataFrame({
+            col: uniques.take(keep),
+            "Số phiếu đã trả": counts[keep],
+            "Trung bình (ngày)": np.round(mean[keep], 2),
+            **{f"P{q} (ngày)": np.round(pct[q][keep], 1) for q in PERCENTILES},
+            "Lâu nhất (ngày)": pct[100][keep],
+            f"Vượt SLA {sla} ngày": breaches[keep],
+            "Đang mở": open_counts[keep],
+            "Đang mở quá SLA": open_over[keep],
+        })
+        return out.sort_values(["Trung bình (ngày)", "Số phiếu đã trả"], ascending=False, na_position="last").reset_index(drop=True)
+
+    def histogram(self, rows=None, bins=HISTOGRAM_BINS, today=None):
+        """Phân bố số ngày xử lý (phiếu đã trả) và tuổi phiếu đang mở theo cùng các khoảng."""
+        edges = np.asarray(bins)
+        days = self.days[self._positions(self.closed, rows)]
+        ages = self.open_ages(self._positions(self.open, rows), today)
+        closed_counts = np.bincount(np.searchsorted(edges, days, side="right") - 1, minlength=len(edges))
+        open_counts = np.bincount(np.maximum(np.searchsorted(edges, ages, side="right") - 1, 0), minlength=len(edges))
+        total = closed_counts.sum()
+        return pd.DataFrame({
+            "Khoảng": _bin_labels(list(bins)),
+            "Đã trả": closed_counts,
+            "Tỷ lệ đã trả (%)": np.round(closed_counts / total * 100, 1) if total else 0.0,
+            "Đang mở": open_counts,
+        })
@@ -0,0 +1,161 @@
+import time
+
+import streamlit as st
+
+from rma_export import EXCEL_MAX_ROWS, EXPORT_FORMATS, cached_export_bytes, parquet_available
+from rma_reports import DASHBOARD_KEY, compute_dashboard, dashboard_context, export_cache_key, record_timing
+from rma_utils import time_filter_mask
+
+# === Phần giao diện Streamlit: bộ lọc, nút tải, chạy báo cáo ===
+# Phần tính toán (rma_reports, rma_export, rma_utils) không import streamlit để rma_service dùng được.
+def bo_loc_da_nang(df, prefix_key=""):
+    with st.sidebar.expander("📕 Bộ lọc nâng cao", expanded=False):
+        col1, col2 = st.columns(2)
+        years = sorted(df["Năm"].dropna().unique())
+        months = sorted(df["Tháng"].dropna().unique())
+        selected_years = col1.multiselect("Năm", years, key=prefix_key + "_loc_nam")
+        selected_months = col2.multiselect("Tháng", months, key=prefix_key + "_loc_thang")
+
+        col3, col4 = st.columns(2)
+        quarters = sorted(df["Quý"].dropna().unique())
+        selected_quarters = col3.multiselect("Quý", quarters, key=prefix_key + "_loc_quy")
+        date_range = col4.date_input("Ngày tiếp nhận (Từ – Đến)", [], key=prefix_key + "_loc_ngay")
+
+        mask = time_filter_mask(df, selected_years, selected_months, selected_quarters, date_range)
+
+    return df if mask.all() else df[mask]
+
+
+def render_bo_loc_sidebar(df, prefix_key=""):
+    with st.expander("📕 Bộ lọc nâng cao", expanded=False):
+        col1, col2 = st.columns(2)
+        years = sorted(df["Năm"].dropna().unique())
+        months = sorted(df["Tháng"].dropna().unique())
+        selected_years = col1.multiselect("Năm", years, key=prefix_key + "_loc_nam")
+        selected_months = col2.multiselect("Tháng", months, key=prefix_key + "_loc_thang")
+
+        col3, col4 = st.columns(2)
+        quarters = sorted(df["Quý"].dropna().unique())
+        selected_quarters = col3.multiselect("Quý", quarters, key=prefix_key + "_loc_quy")
+        date_range = col4.date_input("Ngày tiếp nhận (Từ – Đến)", [], key=prefix_key + "_loc_ngay")
+
+        return {
+            "years": selected_years,
+            "months": selected_months,
+            "quarters": selected_quarters,
+            "date_range": date_range
+        }
+
+
+# === Nút tải trong Streamlit ===
+def export_buttons(sheets, filename, cache_key=None, formats=("xlsx", "csv", "parquet"), label="📥 Tải"):
+    """
+    Các nút tải cho một hoặc nhiều bảng (sheets: dict tên -> DataFrame, bỏ qua bảng rỗng).
+    File chỉ được tạo khi người dùng bấm (chạy ở luồng riêng, không chặn trang) và được cache theo
+    cache_key = (báo cáo, dấu vân tay bộ lọc, phiên bản dữ liệu); cache_key=None thì không cache.
+    """
+    sheets = {name: df for name, df in sheets.items() if not df.empty}
+    if not sheets:
+        return
+    base = filename.rsplit(".", 1)[0]
+    if any(len(df) > EXCEL_MAX_ROWS for df in sheets.values()):
+        formats = [fmt for fmt in formats if fmt != "xlsx"]
+    if not parquet_available():
+        formats = [fmt for fmt in formats if fmt != "parquet"]
+
+    columns = st.columns(len(formats))
+    for column, fmt in zip(columns, formats):
+        name, mime = EXPORT_FORMATS[fmt]
+        ext = fmt if fmt == "xlsx" or len(sheets) == 1 else "zip"
+
+        def build(fmt=fmt):
+            return cached_export_bytes(sheets, fmt, cache_key)
+
+        column.download_button(
+            label=f"{label} {name}",
+            data=build,
+            file_name=f"{base}.{ext}",
+            mime=mime if ext != "zip" else "application/zip",
+            key=f"export_{base}_{fmt}",
+            on_click="ignore",
+        )
+
+
+def run_report(report, ctx):
+    """Chạy báo cáo trong Streamlit và ghi lại thời gian từng bước; trả về (title, df_out) hoặc None."""
+    role = ctx.get("role")
+    if role is not None and role not in report.roles:
+        st.error("⛔ Bạn không có quyền xem báo cáo này.")
+        return None
+    t0 = time.perf_counter()
+    params = report.params(ctx)
+    t1 = time.perf_counter()
+    if params is None:
+        return None
+    with st.spinner("🔄 Đang truy vấn dữ liệu..."):
+        title, df_out = report.run(ctx, **params)
+    t2 = time.perf_counter()
+
+    if not df_out.empty:
+        st.toast("✅ Đã xử lý xong truy vấn!", icon="🎉")
+        st.subheader(title)
+        if report.chart is not None:
+            st.plotly_chart(report.chart(df_out), use_container_width=True)
+        st.dataframe(df_out)
+        export_buttons({"RMA_Report": df_out}, report.export_name(params),
+                       cache_key=export_cache_key(report.key, ctx, params, reports=(report,)))
+    else:
+        st.warning("⚠️ Không tìm thấy dữ liệu phù hợp.")
+    t3 = time.perf_counter()
+
+    timing = {
+        "resolve": (t1 - t0) * 1000,
+        "compute": (t2 - t1) * 1000,
+        "render": (t3 - t2) * 1000,
+    }
+    record_timing(report.key, **timing)
+    if st.session_state.get("debug_mode", False):
+        st.caption(
+            f"⏱️ Tham số {timing['resolve']:.0f} ms · Tính toán {timing['compute']:.0f} ms · "
+            f"Hiển thị {timing['render']:.0f} ms"
+        )
+    return title, df_out
+
+
+def run_dashboard(reports, ctx):
+    """Chạy mọi báo cáo tổng hợp trong một lượt, hiển thị cùng lúc kèm một file Excel nhiều sheet."""
+    role = ctx.get("role")
+    if role is not None:
+        reports = [report for report in reports if role in report.roles]
+    t0 = time.perf_counter()
+    shared = dashboard_context(ctx)
+    t1 = time.perf_counter()
+    with st.spinner("🔄 Đang tổng hợp dữ liệu..."):
+        results = compute_dashboard(reports, shared)
+    t2 = time.perf_counter()
+
+    sheets = {}
+    for report, title, df_out in results:
+        st.subheader(title)
+        if df_out.empty:
+            st.caption("⚠️ Không tìm thấy dữ liệu phù hợp.")
+            continue
+        if report.chart is not None:
+            st.plotly_chart(report.chart(df_out), use_container_width=True)
+        st.dataframe(df_out)
+        sheets[report.export_name(report.dashboard).rsplit(".", 1)[0]] = df_out
+    export_buttons(sheets, "bao_cao_tong_hop.xlsx", cache_key=export_cache_key(DASHBOARD_KEY, ctx, reports=reports))
+    t3 = time.perf_counter()
+
+    timing = {
+        "resolve": (t1 - t0) * 1000,
+        "compute": (t2 - t1) * 1000,
+        "render": (t3 - t2) * 1000,
+    }
+    record_timing(DASHBOARD_KEY, **timing)
+    if st.session_state.get("debug_mode", False):
+        st.caption(
+            f"⏱️ Dựng cube {timing['resolve']:.0f} ms · Tính toán {timing['compute']:.0f} ms · "
+            f"Hiển thị {timing['render']:.0f} ms"
+        )
+    return results
@@ -81,30 +81,120 @@ COLUMN_MAPPING = {
         "file name",
         "ten file",
         "nguon"
+    ],
+    "Số serial": [
+        "serial",
+        "so serial",
+        "serial number",
+        "sn"
+    ],
+    "Ngày trả khách": [
+        "ngay tra khach",
+        "ngay tra",
+        "ngay giao tra",
+        "ngay hoan tra"
+    ],
+    "Loại dịch vụ": [
+        "loai dich vu",
+        "dich vu",
+        "hinh thuc"
     ]
 }
 
 import unicodedata
 import re
+from functools import lru_cache
+import numpy as np
 
-def clean_text(text):
-    if not isinstance(text, str): return ""
+from rma_dates import as_datetime, parse_dates, report_invalid_dates
+
+def _build_strip_table(fold_d):
+    # Bảng dịch sẵn: ký tự Latin có dấu (gồm toàn bộ tiếng Việt) -> ký tự gốc không dấu,
+    # đúng bằng kết quả NFKD + bỏ dấu kết hợp của từng ký tự.
+    table = {}
+    for cp in list(range(0x00C0, 0x0250)) + list(range(0x1E00, 0x1F00)):
+        ch = chr(cp)
+        stripped = ''.join(c for c in unicodedata.normalize('NFKD', ch) if not unicodedata.combining(c))
+        if stripped != ch:
+            table[cp] = stripped
+    if fold_d:
+        table[ord('đ')] = 'd'
+        table[ord('Đ')] = 'd'
+    return table
+
+_CLEAN_TABLE = _build_strip_table(fold_d=True)
+_MATCH_TABLE = _build_strip_table(fold_d=False)
+
+def _strip_accents_slow(text):
     text = unicodedata.normalize('NFKD', text)
-    text = ''.join([c for c in text if not unicodedata.combining(c)])
-    text = text.replace('đ', 'd').replace('Đ', 'd')
-    text = text.lower().strip()
+    return ''.join([c for c in text if not unicodedata.combining(c)])
+
+@lru_cache(maxsize=131072)
+def _clean_text_str(text):
+    stripped = text.translate(_CLEAN_TABLE)
+    if not stripped.isascii():
+        # Còn ký tự ngoài bảng (dấu rời, ký tự tương thích...): đi đường NFKD đầy đủ
+        stripped = _strip_accents_slow(text).replace('đ', 'd').replace('Đ', 'd')
+    text = stripped.lower().strip()
     text = re.sub(r'[\W_]+', ' ', text)
     text = re.sub(r'\s+', ' ', text)
     return text
 
-def normalize_for_match(text):
-    text = str(text).lower()
-    text = unicodedata.normalize('NFKD', text)
-    text = ''.join([c for c in text if not unicodedata.combining(c)])
-    text = re.sub(r'[\-_\&]', '', text)
+@lru_cache(maxsize=131072)
+def _normalize_for_match_str(text):
+    text = text.lower()
+    stripped = text.translate(_MATCH_TABLE)
+    if not stripped.replace('đ', '').isascii():
+        stripped = _strip_accents_slow(text)
+    text = re.sub(r'[\-_\&]', '', stripped)
     text = re.sub(r'\s+', ' ', text)
     return text.strip()
 
+def clean_text(text):
+    if not isinstance(text, str): return ""
+    return _clean_text_str(text)
+
+def normalize_for_match(text):
+    return _normalize_for_match_str(str(text))
+
+def _map_unique(series, func):
+    # Mỗi giá trị khác nhau chỉ chuẩn hoá một lần rồi ánh xạ ngược về các dòng
+    codes, uniques = pd.factorize(series)
+    values = np.array([func(u) for u in uniques] + [""], dtype=object)
+    mapped = values[codes]
+    missing = np.flatnonzero(codes < 0)
+    if len(missing):
+        # None/NaN giữ đúng kết quả của hàm gốc ("none"/"nan" với normalize_for_match)
+        mapped[missing] = [func(v) for v in series.iloc[missing]]
+    return pd.Series(mapped, index=series.index, name=series.name, dtype=object)
+
+_RE_NON_WORD_KEEP_NL = re.compile(r'(?:[^\w\n]|_)+')
+
+def clean_text_many(values):
+    """
+    clean_text cho cả danh sách chuỗi, kết quả giống hệt gọi từng phần tử.
+    Nối lại thành một chuỗi để translate/lower/regex chạy một lần thay vì mỗi giá trị một lần.
+    """
+    values = [v if isinstance(v, str) else "" for v in values]
+    if any("\n" in v for v in values):
+        return [clean_text(v) for v in values]
+    lines = "\n".join(values).translate(_CLEAN_TABLE).split("\n")
+    for i, line in enumerate(lines):
+        if not line.isascii():
+            # Còn ký tự ngoài bảng: giá trị này đi đường đầy đủ
+            lines[i] = None
+    stripped = "\n".join(line.lower().strip() if line is not None else "" for line in lines)
+    cleaned = _RE_NON_WORD_KEEP_NL.sub(' ', stripped).split("\n")
+    return [c if line is not None else clean_text(v) for c, line, v in zip(cleaned, lines, values)]
+
+def clean_text_series(series):
+    """clean_text cho cả cột, kết quả giống hệt gọi clean_text từng dòng."""
+    return _map_unique(series, clean_text)
+
+def normalize_for_match_series(series):
+    """normalize_for_match cho cả cột, kết quả giống hệt gọi từng dòng."""
+    return _map_unique(series, normalize_for_match)
+
 def match_block(name, keyword):
     n_name = normalize_for_match(name)
     n_key = normalize_for_match(keyword)
@@ -132,21 +222,230 @@ def find_col(cols, keyword, column_mapping={}):
             return col
     return None
 
-def ensure_time_columns(df):
+class SchemaResolver:
+    """
+    Ánh xạ tên cột một lần cho mỗi bộ cột:
+    - fields: tên chuẩn trong COLUMN_MAPPING -> tên cột thật (None nếu không có)
+    - find(keyword): cùng kết quả với find_col(cols, keyword) nhưng tra O(1) sau lần đầu
+    """
+    def __init__(self, cols, column_mapping=COLUMN_MAPPING):
+        self.columns = tuple(cols)
+        self._cleaned = [(col, clean_text(col)) for col in self.columns]
+        self._by_clean = {}
+        for col, cleaned in self._cleaned:
+            self._by_clean.setdefault(cleaned, col)
+        self._lookup = {}
+        self.fields = {}
+        for field, aliases in column_mapping.items():
+            col = None
+            for alias in aliases:
+                col = self._by_clean.get(clean_text(alias))
+                if col:
+                    break
+            self.fields[field] = col or self.find(field)
+        self.missing = [field for field, col in self.fields.items() if col is None]
+
+    def find(self, keyword):
+        if keyword in self._lookup:
+            return self._lookup[keyword]
+        keyword_clean = clean_text(keyword)
+        col = self._by_clean.get(keyword_clean)
+        if col is None:
+            for c, cleaned in self._cleaned:
+                if keyword_clean in cleaned:
+                    col = c
+                    break
+        self._lookup[keyword] = col
+        return col
+
+    def __getitem__(self, field):
+        return self.fields.get(field)
+
+_schemas = {}
+
+def get_schema(cols):
+    """Trả về SchemaResolver dùng chung cho bộ cột này (chỉ dựng lần đầu)."""
+    key = tuple(cols)
+    schema = _schemas.get(key)
+    if schema is None:
+        schema = SchemaResolver(key)
+        if schema.missing:
+            print("⚠️ Không nhận diện được cột:", ", ".join(schema.missing))
+        if len(_schemas) >= 32:
+            _schemas.clear()
+        _schemas[key] = schema
+    return schema
+
+def ensure_time_columns(df, date_format=None):
+    """
+    Parse cột ngày tiếp nhận và thêm Năm/Tháng/Quý/Tuần. date_format: định dạng chủ đạo đã biết (không đoán lại);
+    định dạng đã dùng được ghi vào df.attrs["date_format"] để các khối/dòng nạp sau đọc cùng một kiểu.
+    """
     date_col = None
     for col in df.columns:
-        cleaned = unicodedata.normalize('NFKD', col).lower().replace('đ','d')
-        cleaned = re.sub(r'[\W_]+', ' ', cleaned)
+        # clean_text bỏ hẳn dấu; NFKD + \W cũ tách "Ngày" thành "nga y" nên không nhận ra cột có dấu
+        cleaned = clean_text(col)
         if ("ngay" in cleaned) and (("nhan" in cleaned) or ("tiep" in cleaned)):
             date_col = col
             break
     if date_col:
-        df[date_col] = pd.to_datetime(df[date_col], errors='coerce')
-        df["Năm"] = df[date_col].dt.year
-        df["Tháng"] = df[date_col].dt.month
-        df["Quý"] = df[date_col].dt.quarter
+        # Mỗi chuỗi ngày khác nhau parse một lần theo định dạng chủ đạo; Năm/Tháng/Quý/Tuần tính cùng lượt
+        parsed = parse_dates(df[date_col], fmt=date_format)
+        report_invalid_dates(df, date_col, parsed)
+        if parsed.format:
+            df.attrs["date_format"] = parsed.format
+        df[date_col] = parsed.values()
+        for col, dtype in TIME_INT_DTYPES.items():
+            df[col] = parsed.part(col, dtype)
     return df
 
+# === Thời gian xử lý tính một lần khi tải: số ngày từ tiếp nhận tới trả khách ===
+TURNAROUND_COL = "Số ngày xử lý"
+TURNAROUND_DTYPE = "Int16"
+
+def ensure_turnaround_column(df, schema=None):
+    """
+    Parse cột ngày trả khách và thêm cột TURNAROUND_COL (Int16): trống khi chưa trả khách,
+    thiếu ngày tiếp nhận hoặc ngày trả trước ngày nhận (dữ liệu lỗi).
+    """
+    schema = schema or get_schema(df.columns)
+    col_nhan = schema.find("ngay tiep nhan")
+    col_tra = schema.find("ngay tra khach")
+    if not col_nhan or not col_tra:
+        return df
+    if not pd.api.types.is_datetime64_any_dtype(df[col_tra]):
+        parsed = parse_dates(df[col_tra])
+        report_invalid_dates(df, col_tra, parsed)
+        df[col_tra] = parsed.values()
+    days = (df[col_tra] - as_datetime(df[col_nhan])).dt.days
+    days = days.where((days >= 0) & (days <= np.iinfo(np.int16).max))
+    df[TURNAROUND_COL] = days.astype(TURNAROUND_DTYPE)
+    return df
+
+# === Kiểu dữ liệu gọn khi tải: chuỗi lặp nhiều -> category, Năm/Tháng/Quý -> số nguyên nullable ===
+CATEGORY_FIELDS = ["Tên khách hàng", "Sản phẩm", "Nhóm hàng", "Kỹ thuật viên", "Tên lỗi", "Loại dịch vụ", "Nguồn file"]
+TIME_INT_DTYPES = {"Năm": "Int16", "Tháng": "Int8", "Quý": "Int8", "Tuần": "Int8"}
+CATEGORY_MAX_RATIO = 0.5  # nhiều giá trị khác nhau hơn tỉ lệ này thì category không tiết kiệm
+
+def compact_dtypes(df, schema=None):
+    schema = schema or get_schema(df.columns)
+    for field in CATEGORY_FIELDS:
+        col = schema[field]
+        if not col or col in TIME_INT_DTYPES:
+            continue
+        series = df[col]
+        if isinstance(series.dtype, pd.CategoricalDtype) or not pd.api.types.is_string_dtype(series):
+            continue
+        if series.nunique() <= len(series) * CATEGORY_MAX_RATIO:
+            df[col] = series.astype("category")
+    for col, dtype in TIME_INT_DTYPES.items():
+        if col in df.columns and pd.api.types.is_float_dtype(df[col]):
+            df[col] = df[col].astype(dtype)
+    return df
+
+# === Kiểu cột khai báo trước khi đọc CSV (theo COLUMN_MAPPING), không để pandas đoán lại mỗi lần tải ===
+TEXT_FIELDS = ["Số serial"]  # mã định danh: luôn là chuỗi, giữ số 0 ở đầu
+DATE_FIELDS = ["Ngày tiếp nhận", "Ngày trả khách"]  # đọc là chuỗi, parse sau bằng ensure_time_columns
+# Chắc chắn ít giá trị khác nhau nên khai báo category ngay khi đọc; tên khách hàng/sản phẩm/lỗi có thể rất nhiều
+# giá trị (category khi đó tốn hơn chuỗi) nên chưa biết dữ liệu thì không ép
+CSV_CATEGORY_FIELDS = ["Nhóm hàng", "Kỹ thuật viên", "Loại dịch vụ", "Nguồn file"]
+
+def csv_dtypes(columns):
+    """
+    dtype cho read_csv theo tên cột thật (chưa strip) của file: cột trong CSV_CATEGORY_FIELDS
+    đọc thẳng thành category (không tạo chuỗi object cho từng dòng), serial và cột ngày là chuỗi.
+    Các cột nhóm khác để compact_dtypes quyết định theo CATEGORY_MAX_RATIO sau khi đọc.
+    Cột không có trong COLUMN_MAPPING để pandas tự đoán.
+    """
+    stripped = {str(col).strip(): col for col in columns}
+    schema = get_schema(list(stripped))
+    dtypes = {}
+    for field in CSV_CATEGORY_FIELDS:
+        col = schema[field]
+        if col and col not in TIME_INT_DTYPES:
+            dtypes[stripped[col]] = "category"
+    for field in TEXT_FIELDS + DATE_FIELDS:
+        col = schema[field]
+        if col:
+            dtypes.setdefault(stripped[col], str)
+    return dtypes
+
+def align_dtypes(df, like):
+    """
+    Ép các cột của df (vd vài dòng mới parse) về kiểu của bảng like để nối không đổi kiểu;
+    cột category giữ danh mục riêng (concat_frames gộp lại). None nếu cột khác nhau hoặc không ép được.
+    """
+    if list(df.columns) != list(like.columns):
+        return None
+    columns = {}
+    for col in like.columns:
+        target = like[col].dtype
+        values = df[col]
+        if pd.api.types.is_bool_dtype(target) and not pd.api.types.is_bool_dtype(values):
+            # Ô checkbox xuất ra "TRUE"/"FALSE": astype(bool) sẽ coi mọi chuỗi khác rỗng là True
+            values = values.astype(str).str.strip().str.lower().map({"true": True, "false": False})
+            if values.isna().any():
+                return None
+        try:
+            columns[col] = values.astype("category" if isinstance(target, pd.CategoricalDtype) else target)
+        except (TypeError, ValueError):
+            return None
+    return pd.DataFrame(columns, index=df.index)
+
+def concat_frames(frames):
+    """Nối các bảng cùng cột; cột category được gộp danh mục thay vì bị pd.concat đổi thành object."""
+    columns = {}
+    for col in frames[0].columns:
+        parts = [frame[col] for frame in frames]
+        if all(isinstance(part.dtype, pd.CategoricalDtype) for part in parts):
+            categories = parts[0].cat.categories
+            for part in parts[1:]:
+                extra = part.cat.categories.difference(categories, sort=False)
+                if len(extra):
+                    categories = categories.append(extra)
+            dtype = pd.CategoricalDtype(categories)
+            parts = [part.astype(dtype) for part in parts]
+        columns[col] = pd.concat(parts, ignore_index=True)
+    return pd.DataFrame(columns)
+
+def memory_report(df):
+    """Bộ nhớ từng cột (MB): kiểu hiện tại so với kiểu khi mới đọc CSV (chuỗi / float64)."""
+    rows = []
+    for col in df.columns:
+        series = df[col]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            original = series.astype(series.cat.categories.dtype)
+        elif (col in TIME_INT_DTYPES or col == TURNAROUND_COL) and pd.api.types.is_integer_dtype(series):
+            original = series.astype("float64")
+        else:
+            original = series
+        rows.append({
+            "Cột": col,
+            "Kiểu ban đầu": str(original.dtype),
+            "Kiểu hiện tại": str(series.dtype),
+            "MB ban đầu": original.memory_usage(deep=True, index=False) / 2**20,
+            "MB hiện tại": series.memory_usage(deep=True, index=False) / 2**20,
+        })
+    report = pd.DataFrame(rows)
+    total = {"Cột": "Tổng", "Kiểu ban đầu": "", "Kiểu hiện tại": "",
+             "MB ban đầu": report["MB ban đầu"].sum(), "MB hiện tại": report["MB hiện tại"].sum()}
+    report = pd.concat([report, pd.DataFrame([total])], ignore_index=True)
+    report["Giảm (%)"] = (100 - report["MB hiện tại"] / report["MB ban đầu"] * 100).round(1)
+    report[["MB ban đầu", "MB hiện tại"]] = report[["MB ban đầu", "MB hiện tại"]].round(2)
+    return report
+
+def value_counts(series):
+    """
+    value_counts cho cả cột category: đếm trên mã, bỏ nhóm 0 dòng và giữ thứ tự
+    như cột chuỗi (nhiều nhất trước, bằng nhau thì giá trị xuất hiện trước đứng trước).
+    """
+    if not isinstance(series.dtype, pd.CategoricalDtype):
+        return series.value_counts()
+    codes, uniques = pd.factorize(series)
+    counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+    order = np.argsort(-counts, kind="stable")
+    return pd.Series(counts[order], index=pd.Index(uniques.take(order), name=series.name), name="count")
+
 def extract_time_filter_from_question(question):
     years = re.findall(r"(20\d{2})", question)
     years = [int(y) for y in years]
@@ -172,48 +471,37 @@ def extract_time_filter_from_question(question):
     quarters = [q for q in q_norm if 1 <= q <= 4]
     return years, months, quarters
 
-def filter_df_by_time(df, years=None, months=None, quarters=None):
-    df2 = df.copy()
-    if years and "Năm" in df2.columns:
-        df2 = df2[df2["Năm"].isin(years)]
-    if months and "Tháng" in df2.columns:
-        df2 = df2[df2["Tháng"].isin(months)]
-    if quarters and "Quý" in df2.columns:
-        df2 = df2[df2["Quý"].isin(quarters)]
-    return df2
-import streamlit as st
-
-def bo_loc_da_nang(df, prefix_key=""):
-    df_filtered = df.copy()
-    
-    with st.sidebar.expander("📕 Bộ lọc nâng cao", expanded=False):
-        col1, col2 = st.columns(2)
-        years = sorted(df["Năm"].dropna().unique())
-        months = sorted(df["Tháng"].dropna().unique())
-        selected_years = col1.multiselect("Năm", years, key=prefix_key + "_loc_nam")
-        selected_months = col2.multiselect("Tháng", months, key=prefix_key + "_loc_thang")
-
-        col3, col4 = st.columns(2)
-        quarters = sorted(df["Quý"].dropna().unique())
-        selected_quarters = col3.multiselect("Quý", quarters, key=prefix_key + "_loc_quy")
-        date_range = col4.date_input("Ngày tiếp nhận (Từ – Đến)", [], key=prefix_key + "_loc_ngay")
-
-        if selected_years:
-            df_filtered = df_filtered[df_filtered["Năm"].isin(selected_years)]
-        if selected_months:
-            df_filtered = df_filtered[df_filtered["Tháng"].isin(selected_months)]
-        if selected_quarters:
-            df_filtered = df_filtered[df_filtered["Quý"].isin(selected_quarters)]
-        if isinstance(date_range, list) and len(date_range) == 2:
-            col_date = find_col(df.columns, "ngày tiếp nhận")
-            if col_date:
-                df_filtered = df_filtered[
-                    (df_filtered[col_date] >= pd.to_datetime(date_range[0])) &
-                    (df_filtered[col_date] <= pd.to_datetime(date_range[1]))
-                ]
-
-    return df_filtered
+def is_date_range(value):
+    # st.date_input trả về tuple; chỉ lọc khi đã chọn đủ (từ, đến)
+    return isinstance(value, (list, tuple)) and len(value) == 2
 
+def date_range_bounds(start, end):
+    """
+    [start, stop) cho bộ lọc ngày tiếp nhận: ngày kết thúc không kèm giờ tính trọn ngày (stop = ngày hôm sau),
+    để dòng có giờ trong ngày cuối không bị loại. Mọi đường lọc (dòng thô, chỉ mục ngày, cube) dùng chung.
+    """
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    if end == end.normalize():
+        return start, end + pd.Timedelta(days=1)
+    return start, end + pd.Timedelta(1, "ns")
+
+def time_filter_mask(df, years=None, months=None, quarters=None, date_range=None):
+    """Gộp điều kiện năm/tháng/quý/khoảng ngày tiếp nhận thành một mask bool, không copy bảng."""
+    mask = np.ones(len(df), dtype=bool)
+    for col, values in (("Năm", years), ("Tháng", months), ("Quý", quarters)):
+        if values and col in df.columns:
+            mask &= df[col].isin(values).to_numpy()
+    if is_date_range(date_range):
+        col_date = get_schema(df.columns).find("ngày tiếp nhận")
+        if col_date:
+            dates = df[col_date]
+            start, stop = date_range_bounds(*date_range)
+            mask &= ((dates >= start) & (dates < stop)).to_numpy()
+    return mask
+
+def filter_df_by_time(df, years=None, months=None, quarters=None):
+    mask = time_filter_mask(df, years, months, quarters)
+    return df if mask.all() else df[mask]
 def render_result_table(results):
     """
     Nhận vào danh sách [("Tên sản phẩm", lượt gửi), ...] và trả HTML bảng
@@ -225,40 +513,12 @@ def render_result_table(results):
     html += "</table>"
     return html
 
-def render_bo_loc_sidebar(df, prefix_key=""):
-    with st.expander("📕 Bộ lọc nâng cao", expanded=False):
-        col1, col2 = st.columns(2)
-        years = sorted(df["Năm"].dropna().unique())
-        months = sorted(df["Tháng"].dropna().unique())
-        selected_years = col1.multiselect("Năm", years, key=prefix_key + "_loc_nam")
-        selected_months = col2.multiselect("Tháng", months, key=prefix_key + "_loc_thang")
-
-        col3, col4 = st.columns(2)
-        quarters = sorted(df["Quý"].dropna().unique())
-        selected_quarters = col3.multiselect("Quý", quarters, key=prefix_key + "_loc_quy")
-        date_range = col4.date_input("Ngày tiếp nhận (Từ – Đến)", [], key=prefix_key + "_loc_ngay")
-
-        return {
-            "years": selected_years,
-            "months": selected_months,
-            "quarters": selected_quarters,
-            "date_range": date_range
-        }
-
 def apply_bo_loc(df, filters):
-    df_filtered = df.copy()
-
-    if filters["years"]:
-        df_filtered = df_filtered[df_filtered["Năm"].isin(filters["years"])]
-    if filters["months"]:
-        df_filtered = df_filtered[df_filtered["Tháng"].isin(filters["months"])]
-    if filters["quarters"]:
-        df_filtered = df_filtered[df_filtered["Quý"].isin(filters["quarters"])]
-    if isinstance(filters["date_range"], list) and len(filters["date_range"]) == 2:
-        col_date = find_col(df.columns, "ngày tiếp nhận")
-        if col_date:
-            df_filtered = df_filtered[
-                (df_filtered[col_date] >= pd.to_datetime(filters["date_range"][0])) &
-                (df_filtered[col_date] <= pd.to_datetime(filters["date_range"][1]))
-            ]
-    return df_filtered
+    mask = time_filter_mask(
+        df,
+        years=filters["years"],
+        months=filters["months"],
+        quarters=filters["quarters"],
+        date_range=filters["date_range"],
+    )
+    return df if mask.all() else df[mask]